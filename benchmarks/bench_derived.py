@@ -0,0 +1,126 @@
+###################################################################
+# functions/derived.pyとmetpyの計算結果と時間の比較
+###################################################################
+import os
+import sys
+import time as tm
+import json
+import argparse
+import statistics
+
+import numpy as np
+from metpy.units import units
+import metpy.calc as mpcalc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from functions import derived
+
+# 格子の大きさ (名前, 緯度, 経度)
+GRIDS = {
+    # GSM(0.5度)の日本域
+    'gsm_jp': (np.arange(70, -0.25, -0.5), np.arange(60, 200.25, 0.5)),
+    # MSM(0.05度 x 0.0625度)
+    'msm': (np.linspace(47.6, 22.4, 505), np.linspace(120, 150, 481)),
+}
+
+
+def make_fields(lat_1d, lon_1d, dtype):  # 擬似データ
+    lon, lat = np.meshgrid(lon_1d, lat_1d)
+    rng = np.random.default_rng(0)
+    wave = np.sin(np.radians(lon) * 4) * np.cos(np.radians(lat) * 3)
+    fields = {
+        'lon': lon,
+        'lat': lat,
+        'u': (20 * np.cos(np.radians(lat)) + 10 * wave + rng.normal(0, 1, lat.shape)).astype(dtype),
+        'v': (10 * wave + rng.normal(0, 1, lat.shape)).astype(dtype),
+        't': (300 - 0.6 * np.abs(lat) + 3 * wave).astype(dtype),
+        'r': np.clip(60 + 35 * wave + rng.normal(0, 5, lat.shape), 1, 100).astype(dtype) * 0.01,
+    }
+    return fields
+
+
+def timeit(func, repeat):  # 中央値(秒)と結果
+    times = []
+    for _ in range(repeat):
+        start = tm.perf_counter()
+        result = func()
+        times.append(tm.perf_counter() - start)
+    return statistics.median(times), result
+
+
+def error(ours, theirs):  # 最大の相対誤差(metpyの最大値に対する)
+    ours = np.asarray(ours, dtype=np.float64)
+    theirs = np.asarray(theirs, dtype=np.float64)
+    return float(np.nanmax(np.abs(ours - theirs)) / np.nanmax(np.abs(theirs)))
+
+
+def run_grid(name, lat_1d, lon_1d, dtype, repeat):
+    f = make_fields(lat_1d, lon_1d, dtype)
+    u = f['u'] * units('m/s')
+    v = f['v'] * units('m/s')
+    t = f['t'] * units.kelvin
+    p = 850 * units.hPa
+    dx_m, dy_m = mpcalc.lat_lon_grid_deltas(f['lon'], f['lat'])
+    dx, dy = derived.get_grid_deltas(f['lon'], f['lat'])
+    td_m = mpcalc.dewpoint_from_relative_humidity(t, f['r'])
+    td = derived.dewpoint_from_relative_humidity(f['t'], f['r'])
+    cases = {
+        'wind_speed_kt': (
+            lambda: mpcalc.wind_speed(u, v).to('kt').m,
+            lambda: derived.to_kt(derived.wind_speed(f['u'], f['v']))),
+        'celsius': (
+            lambda: t.to(units.celsius).m,
+            lambda: derived.to_celsius(f['t'])),
+        'dewpoint': (
+            lambda: mpcalc.dewpoint_from_relative_humidity(t, f['r']).to(units.kelvin).m,
+            lambda: derived.dewpoint_from_relative_humidity(f['t'], f['r'])),
+        'equivalent_potential_temperature': (
+            lambda: mpcalc.equivalent_potential_temperature(p, t, td_m).to(units.kelvin).m,
+            lambda: derived.equivalent_potential_temperature(850, f['t'], td)),
+        'lat_lon_grid_deltas': (
+            lambda: np.asarray(mpcalc.lat_lon_grid_deltas(f['lon'], f['lat'])[0].m),
+            lambda: derived.lat_lon_grid_deltas(f['lon'], f['lat'])[0]),
+        'vorticity': (
+            lambda: mpcalc.vorticity(u, v, dx=dx_m, dy=dy_m).m,
+            lambda: derived.vorticity(f['u'], f['v'], dx, dy)),
+    }
+    results = {}
+    for case, (metpy_func, derived_func) in cases.items():
+        metpy_s, expected = timeit(metpy_func, repeat)
+        derived_s, actual = timeit(derived_func, repeat)
+        results[case] = {
+            'metpy_s': metpy_s,
+            'derived_s': derived_s,
+            'speedup': metpy_s / derived_s,
+            'max_rel_error': error(actual, expected),
+        }
+        print(f'{name} {np.dtype(dtype).name} {case}: metpy {metpy_s * 1000:.2f}ms, derived {derived_s * 1000:.2f}ms, '
+              f'x{metpy_s / derived_s:.1f}, error {results[case]["max_rel_error"]:.3g}')
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--output', help='結果を保存するJSONファイル')
+    # 許容する相対誤差(float64のとき)
+    parser.add_argument('--tolerance', type=float, default=1e-6)
+    args = parser.parse_args()
+    results = {}
+    failed = []
+    for name, (lat_1d, lon_1d) in GRIDS.items():
+        for dtype in (np.float64, np.float32):
+            key = f'{name}_{np.dtype(dtype).name}'
+            results[key] = run_grid(name, lat_1d, lon_1d, dtype, args.repeat)
+            if dtype is np.float64:
+                failed += [f'{key} {case}' for case, result in results[key].items() if result['max_rel_error'] > args.tolerance]
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump(results, fp, indent=4)
+    if failed:
+        print('metpyと一致しません: ' + ', '.join(failed))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
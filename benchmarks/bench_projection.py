@@ -0,0 +1,125 @@
+###################################################################
+# 等値線の描画時間の比較(transform指定 / 投影座標のキャッシュ)
+###################################################################
+import os
+import sys
+import time as tm
+import json
+import argparse
+import statistics
+
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import cartopy.crs as ccrs
+import cartopy.util as cutil
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from functions.projection_cache import project_grid
+
+# 正距円筒図法
+datacrs = ccrs.PlateCarree()
+# ランベルト正角円錐図法(日本域)
+mapcrs_jp = ccrs.LambertConformal(central_longitude=140, central_latitude=35, standard_parallels=(30, 60))
+extent_jp = [100, 170, 10, 60]
+# 正距方位図法(北極中心)
+mapcrs_np = ccrs.AzimuthalEquidistant(central_longitude=140, central_latitude=90)
+extent_np = [-40, 320, 20, 90]
+
+
+def make_grid(lat1, lat2, lon1, lon2, step=0.5):  # GSM(0.5度)と同じ並びの格子
+    lat_1d = np.arange(90, -90 - step / 2, -step)
+    lon_1d = np.arange(0, 360, step)
+    lat_1d = lat_1d[(lat_1d >= lat1) & (lat_1d <= lat2)]
+    lon_1d = lon_1d[(lon_1d >= lon1) & (lon_1d <= lon2)]
+    lon, lat = np.meshgrid(lon_1d, lat_1d)
+    return lat, lon
+
+
+def make_field(lat, lon, base, amplitude, seed):  # なめらかな擬似データ
+    rng = np.random.default_rng(seed)
+    phase = rng.uniform(0, 2 * np.pi, 3)
+    field = base + amplitude * (np.cos(np.radians(lat)) + 0.3 * np.sin(np.radians(lon) * 3 + phase[0]) * np.cos(np.radians(lat) * 2 + phase[1])
+                                + 0.1 * np.sin(np.radians(lon) * 7 + phase[2]))
+    return field
+
+
+def case_jp_850_eptw():  # 850hPa相当温位のような日本域の塗りつぶしと等値線
+    lat, lon = make_grid(0, 70, 60, 200)
+    ept = make_field(lat, lon, 270, 60, 0)
+    layers = [('contourf', ept, np.arange(255, 372, 3)), ('contour', ept, np.arange(255, 372, 3))]
+    return mapcrs_jp, extent_jp, lon, lat, layers
+
+
+def case_np_500_ht():  # 500hPa高度/気温のような北極中心の塗りつぶしと等値線
+    lat, lon = make_grid(-10, 90, 0, 360)
+    height = make_field(lat, lon, 4800, 1000, 1)
+    temp = make_field(lat, lon, -45, 30, 2)
+    height_cyclic = np.empty((lat.shape[0], lat.shape[1] + 1))
+    temp_cyclic = np.empty((lat.shape[0], lat.shape[1] + 1))
+    lon_cyclic = np.empty((lat.shape[0], lat.shape[1] + 1))
+    lat_cyclic = np.empty((lat.shape[0], lat.shape[1] + 1))
+    for i in range(lat.shape[0]):
+        height_cyclic[i, :], lon_cyclic[i, :] = cutil.add_cyclic_point(height[i, :], coord=lon[i, :])
+        temp_cyclic[i, :], lat_cyclic[i, :] = cutil.add_cyclic_point(temp[i, :], coord=lat[i, :])
+    temp_arange = np.arange(-51, 9, 3)
+    layers = [('contourf', temp_cyclic, temp_arange), ('contour', temp_cyclic, temp_arange), ('contour', height_cyclic, np.arange(0, 8000, 60))]
+    return mapcrs_np, extent_np, lon_cyclic, lat_cyclic, layers
+
+
+def draw(projection, extent, lon, lat, layers, projected):  # 等値線を描画して時間を返す
+    start = tm.perf_counter()
+    fig = plt.figure(figsize=(16, 12))
+    ax = fig.add_subplot(1, 1, 1, projection=projection)
+    ax.set_extent(extent, datacrs)
+    if projected:
+        x, y = project_grid(ax.projection, lon, lat)
+    for kind, field, levels in layers:
+        if projected:
+            getattr(ax, kind)(x, y, field, levels)
+        else:
+            getattr(ax, kind)(lon, lat, field, levels, transform=datacrs)
+    # 描画時に変換されるのでここまで計る
+    fig.canvas.draw()
+    elapsed = tm.perf_counter() - start
+    plt.close(fig=fig)
+    return elapsed
+
+
+def run(repeat):
+    results = {}
+    for name, case in (('jp_850_eptw', case_jp_850_eptw), ('np_500_ht', case_np_500_ht)):
+        projection, extent, lon, lat, layers = case()
+        # 初回(キャッシュの作成を含む)
+        first = draw(projection, extent, lon, lat, layers, True)
+        times = {'transform': [], 'projected': []}
+        for _ in range(repeat):
+            times['transform'].append(draw(projection, extent, lon, lat, layers, False))
+            times['projected'].append(draw(projection, extent, lon, lat, layers, True))
+        transform = statistics.median(times['transform'])
+        projected = statistics.median(times['projected'])
+        results[name] = {
+            'grid': list(lon.shape),
+            'transform_s': transform,
+            'projected_s': projected,
+            'projected_first_s': first,
+            'speedup': transform / projected,
+        }
+        print(f'{name}: transform {transform:.3f}s, projected {projected:.3f}s (first {first:.3f}s), x{transform / projected:.2f}')
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='結果を保存するJSONファイル')
+    args = parser.parse_args()
+    results = run(args.repeat)
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump(results, fp, indent=4)
+
+
+if __name__ == "__main__":
+    main()
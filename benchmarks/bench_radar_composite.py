@@ -0,0 +1,115 @@
+###################################################################
+# レーダー画像の合成の時間とメモリ確保量の比較(cv2での結合 / RadarCompositor)
+###################################################################
+import os
+import sys
+import time as tm
+import json
+import argparse
+import statistics
+import tracemalloc
+
+import numpy as np
+import cv2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from functions.radar_composite import RadarCompositor
+
+# タイルの数(日本域 z=6, x=53-58, y=22-27)と大きさ
+TILES_X = 6
+TILES_Y = 6
+TILE_SIZE = 256
+
+
+def make_background(seed):  # 地図と凡例のような背景
+    rng = np.random.default_rng(seed)
+    height, width = TILES_Y * TILE_SIZE, TILES_X * TILE_SIZE
+    background = np.full((height, width, 3), 125, dtype=np.uint8)
+    # 陸地
+    land = rng.random((height // 64, width // 64)) < 0.4
+    background[np.kron(land, np.ones((64, 64), dtype=bool))] = 150
+    # 凡例
+    background[1200:1400, 1200:1300] = 255
+    return background
+
+
+def make_tiles(seed):  # 降水域のある擬似タイル(BGRA)
+    rng = np.random.default_rng(seed)
+    tiles = []
+    for _ in range(TILES_Y):
+        tiles_h = []
+        for _ in range(TILES_X):
+            tile = np.zeros((TILE_SIZE, TILE_SIZE, 4), dtype=np.uint8)
+            # 降水のない所は透明な黒
+            yy, xx = np.mgrid[0:TILE_SIZE, 0:TILE_SIZE]
+            cy, cx, r = rng.uniform(0, TILE_SIZE, 2).tolist() + [rng.uniform(20, 120)]
+            rain = (yy - cy) ** 2 + (xx - cx) ** 2 < r ** 2
+            tile[rain, :3] = rng.integers(1, 256, 3, dtype=np.uint8)
+            tile[rain, 3] = 255
+            tiles_h.append(tile)
+        tiles.append(tiles_h)
+    return tiles
+
+
+def composite_cv2(background, tiles):  # 以前のdraw_contentと同じ合成
+    image = cv2.vconcat([cv2.hconcat(image_h) for image_h in tiles])
+    rgb = image[:, :, :3]
+    rgb[np.where((rgb == [0, 0, 0]).all(axis=2))] = [255, 255, 255]
+    a = image[:, :, 3]
+    mask = cv2.merge((a, a, a))
+    dst = cv2.bitwise_or(background, mask)
+    dst = cv2.bitwise_and(dst, rgb)
+    return dst
+
+
+def measure(func, frames, repeat):  # 1枚あたりの時間の中央値(秒)とメモリ確保量の最大(バイト)
+    # 作業領域の確保を除くため一度実行しておく
+    func(frames[0])
+    times = []
+    peaks = []
+    for i in range(repeat):
+        tiles = frames[i % len(frames)]
+        start = tm.perf_counter()
+        func(tiles)
+        times.append(tm.perf_counter() - start)
+    for tiles in frames:
+        tracemalloc.start()
+        func(tiles)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return statistics.median(times), max(peaks)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--frames', type=int, default=4, help='擬似画像の枚数')
+    parser.add_argument('--output', help='結果を保存するJSONファイル')
+    args = parser.parse_args()
+    background = make_background(0)
+    frames = [make_tiles(i + 1) for i in range(args.frames)]
+    compositor = RadarCompositor(background)
+    # 結果が一致するか
+    for tiles in frames:
+        if not np.array_equal(composite_cv2(background, tiles), compositor.composite(tiles)):
+            print('合成結果が一致しません')
+            sys.exit(1)
+    cv2_s, cv2_peak = measure(lambda tiles: composite_cv2(background, tiles), frames, args.repeat)
+    compositor_s, compositor_peak = measure(compositor.composite, frames, args.repeat)
+    results = {
+        'shape': [TILES_Y * TILE_SIZE, TILES_X * TILE_SIZE],
+        'cv2_s': cv2_s,
+        'compositor_s': compositor_s,
+        'speedup': cv2_s / compositor_s,
+        'cv2_peak_bytes': cv2_peak,
+        'compositor_peak_bytes': compositor_peak,
+    }
+    print(f'cv2 {cv2_s * 1000:.2f}ms/{cv2_peak / 2 ** 20:.1f}MiB, '
+          f'compositor {compositor_s * 1000:.2f}ms/{compositor_peak / 2 ** 20:.1f}MiB, x{cv2_s / compositor_s:.2f}')
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump(results, fp, indent=4)
+
+
+if __name__ == "__main__":
+    main()
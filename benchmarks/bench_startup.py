@@ -0,0 +1,99 @@
+###################################################################
+# 起動時間とメモリ(プログラムごとの読み込み)
+# 衛星・レーダーで天気図用のモジュールを読み込んでいたら失敗(終了コード1)
+###################################################################
+import os
+import sys
+import json
+import argparse
+import subprocess
+import statistics
+import time as tm
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# プログラム -> 読み込む文(main_*.pyと同じ)
+ENTRIES = {
+    'gsm': 'from functions import download_gsm',
+    'msm': 'from functions import download_msm',
+    'sat': 'from functions import download_sat',
+    'rad': 'from functions import download_rad',
+    'daemon': 'from functions import run_daemon',
+}
+# 天気図だけで使う重いモジュール
+HEAVY = ('cartopy', 'matplotlib', 'metpy', 'pint', 'scipy', 'pygrib', 'xarray')
+# 重いモジュールを読み込んではいけないプログラム
+LIGHT = ('sat', 'rad', 'daemon')
+
+# 子プロセスで実行する計測(読み込みの時間，最大メモリ，読み込んだ重いモジュール)
+CHILD = '''
+import sys, json, time, resource
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+heavy = sorted(name for name in {heavy!r} if name in sys.modules)
+print(json.dumps({{'import_s': elapsed, 'rss_kib': rss, 'heavy': heavy}}))
+'''
+
+
+def run_entry(statement):  # 新しいプロセスで1回読み込む
+    code = CHILD.format(statement=statement, heavy=HEAVY)
+    start = tm.perf_counter()
+    out = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True)
+    elapsed = tm.perf_counter() - start
+    if out.returncode != 0:
+        raise RuntimeError(out.stderr.strip().splitlines()[-1] if out.stderr.strip() else f'終了コード{out.returncode}')
+    result = json.loads(out.stdout.strip().splitlines()[-1])
+    result['total_s'] = elapsed
+    return result
+
+
+def bench_entry(statement, repeat):  # 中央値
+    # 1回目は.pycの作成などが入るので捨てる
+    run_entry(statement)
+    samples = [run_entry(statement) for _ in range(repeat)]
+    return {
+        'total_s': statistics.median(sample['total_s'] for sample in samples),
+        'import_s': statistics.median(sample['import_s'] for sample in samples),
+        'rss_mib': max(sample['rss_kib'] for sample in samples) / 1024,
+        'heavy': samples[-1]['heavy'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--only', nargs='+', choices=list(ENTRIES) + ['python'], default=['python'] + list(ENTRIES), help='計測する対象')
+    parser.add_argument('--max-seconds', type=float, help='読み込みがこれより遅いプログラムがあれば失敗')
+    parser.add_argument('--output', help='結果を保存するJSONファイル(compare.pyで比較できる)')
+    args = parser.parse_args()
+    results = {}
+    failures = []
+    for name in args.only:
+        # pythonは何も読み込まないときの起動時間(基準)
+        statement = 'pass' if name == 'python' else ENTRIES[name]
+        try:
+            result = bench_entry(statement, args.repeat)
+        except RuntimeError as e:
+            print(f'{name}: 読み込めません ({e})')
+            failures.append(name)
+            continue
+        results[name] = result
+        heavy = ', '.join(result['heavy']) or 'なし'
+        print(f'{name}: 起動 {result["total_s"] * 1000:.0f}ms, 読み込み {result["import_s"] * 1000:.0f}ms, 最大 {result["rss_mib"]:.0f}MiB, 重いモジュール: {heavy}')
+        if name in LIGHT and result['heavy']:
+            print(f'  {name}で天気図用のモジュールを読み込んでいます')
+            failures.append(name)
+        if args.max_seconds is not None and name != 'python' and result['import_s'] > args.max_seconds:
+            print(f'  {name}の読み込みが{args.max_seconds}秒を超えています')
+            failures.append(name)
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump({'meta': {'python': sys.version.split()[0], 'repeat': args.repeat}, 'results': results}, fp, indent=4)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+###################################################################
+# 天気図・衛星画像・レーダー画像の作成時間(段階ごと，擬似データを使う)
+###################################################################
+import os
+import sys
+import time as tm
+import json
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+import contextlib
+
+import numpy as np
+import cv2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from synthetic import write_grib2, LocalTileFetcher, cycle_time
+
+# 計測する対象
+GROUPS = ('gsm', 'msm', 'sat', 'rad')
+# 擬似データの時刻(衛星・レーダー)
+BASETIME = '20210401000000'
+
+
+class StageTimer:  # 段階ごとの時間を集計
+    def __init__(self):
+        # 段階 -> 秒
+        self.times = {}
+
+    def add(self, name, elapsed):
+        self.times[name] = self.times.get(name, 0.0) + elapsed
+
+    @contextlib.contextmanager
+    def stage(self, name):  # withの中の時間
+        start = tm.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, tm.perf_counter() - start)
+
+    @contextlib.contextmanager
+    def patch(self, owner, attr, name):  # withの中で呼ばれた関数の時間
+        func = getattr(owner, attr)
+
+        def timed(*args, **kwargs):
+            start = tm.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.add(name, tm.perf_counter() - start)
+
+        setattr(owner, attr, timed)
+        try:
+            yield
+        finally:
+            setattr(owner, attr, func)
+
+    def exclude(self, name, *parts):  # 内側で計った段階を除く
+        self.times[name] = self.times.get(name, 0.0) - sum(self.times.get(part, 0.0) for part in parts)
+
+
+def summarize(samples):  # 段階ごとの中央値と合計の中央値
+    stages = sorted({name for sample in samples for name in sample})
+    result = {f'{name}_s': statistics.median(sample.get(name, 0.0) for sample in samples) for name in stages}
+    result['total_s'] = statistics.median(sum(sample.values()) for sample in samples)
+    result['samples'] = len(samples)
+    return result
+
+
+def run_samples(func, repeat):  # 1回目は準備(キャッシュの作成など)として捨てる
+    samples = []
+    for i in range(repeat + 1):
+        timer = StageTimer()
+        func(timer)
+        if i > 0:
+            samples.append(timer.times)
+    return summarize(samples)
+
+
+def bench_charts(grid_name, workdir, repeat, fig_x, fig_y):  # 天気図ごとの 読み込み/計算/描画/保存
+    # 天気図用のモジュール(cartopy, matplotlib, pygrib)は天気図を計測するときだけ読み込む
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from functions.download_gsmclass import DownloadGSM
+    from functions.download_msmclass import DownloadMSM
+    from functions.chart_specs import chart_fields, chart_refs, is_derived, required_fields
+    cls = DownloadMSM if grid_name == 'msm' else DownloadGSM
+    time_this = cycle_time()
+    path_tmp = os.path.join(workdir, grid_name)
+    os.makedirs(path_tmp, exist_ok=True)
+    # 最後の予報時間(MSMではFT15の降水量がFT14のメッセージになる)
+    forecast_time = cls.forecast_times[-1]
+    write_grib2(os.path.join(path_tmp, time_this.strftime('%Y%m%d%H')), grid_name, required_fields(cls.charts), [forecast_time], time_this, cls.accumulated)
+    t = cls(time_this, fig_x, fig_y, path_tmp, forecast_times=[forecast_time])
+    t.download_grib2()
+    t.set_forecast_time(forecast_time)
+    path_out = os.path.join(workdir, f'{grid_name}_charts')
+    os.makedirs(path_out, exist_ok=True)
+    results = {}
+    for chart in t.charts:
+        region = t.chart_region(chart)
+
+        def sample(timer):
+            t.fields.clear()
+            with timer.stage('decode'):
+                for shortName, level in t.step_fields(chart_fields(chart)):
+                    t.select_field(shortName, level, region)
+            _, lat, lon = t.select_field(*t.step_fields(chart_fields(chart))[0], region)
+            with timer.stage('compute'):
+                for ref in chart_refs(chart):
+                    if is_derived(ref) and t.ref_available(ref):
+                        t.evaluate(ref, region, (lat, lon))
+            path_fig = t.path_fig(path_out)
+            if os.path.exists(path_fig):
+                os.remove(path_fig)
+            with timer.patch(plt, 'savefig', 'encode'), timer.stage('draw'):
+                getattr(t, chart)(path_out)
+            timer.exclude('draw', 'encode')
+
+        results[f'{grid_name}.{chart}'] = run_samples(sample, repeat)
+        print_result(f'{grid_name}.{chart}', results[f'{grid_name}.{chart}'])
+    return results
+
+
+def bench_tiles(t, name, workdir, repeat, base, contents, prepare=None):  # 地図と画像の 取得/デコード/合成/保存
+    # base: draw_baseの位置引数(保存先を除く)
+    # contents: 名前 -> (draw_contentの位置引数(保存先を除く), キーワード引数)
+    # prepare(t): 地図を作成した後の準備(レーダーの合成など)
+    results = {}
+    t.fetcher.prepare(t.uri_base(*base))
+    path_map = os.path.join(workdir, f'{name}_map.png')
+
+    def sample_base(timer):
+        if os.path.exists(path_map):
+            os.remove(path_map)
+        with timer.patch(t.fetcher, 'get_grid', 'fetch'), timer.patch(t, 'decode_tile', 'decode'), timer.patch(cv2, 'imwrite', 'encode'), timer.stage('compute'):
+            t.draw_base(*base, path_map)
+        timer.exclude('compute', 'fetch', 'decode', 'encode')
+
+    results[f'{name}.draw_base'] = run_samples(sample_base, repeat)
+    print_result(f'{name}.draw_base', results[f'{name}.draw_base'])
+    t.image_map = t.draw_base(*base, path_map)
+    if prepare is not None:
+        prepare(t)
+    for product, (args, kwargs) in contents.items():
+        uri_grid = t.uri_content(*args)
+        t.fetcher.prepare(uri_grid)
+        path = os.path.join(workdir, name, product, f'{args[0]}.jpg')
+
+        def sample(timer):
+            if os.path.exists(path):
+                os.remove(path)
+            with timer.stage('fetch'):
+                tiles = t.fetch_content(uri_grid, args[0], False)
+            with timer.patch(t, 'decode_tile', 'decode'), timer.patch(cv2, 'imwrite', 'encode'), timer.stage('compute'):
+                t.draw_content(*args, path, check=False, tiles=tiles, **kwargs)
+            timer.exclude('compute', 'decode', 'encode')
+
+        results[f'{name}.{product}'] = run_samples(sample, repeat)
+        print_result(f'{name}.{product}', results[f'{name}.{product}'])
+    return results
+
+
+def bench_satellite(workdir, repeat):
+    from functions.download_satclass import DownloadSatellite
+    t = DownloadSatellite.__new__(DownloadSatellite)
+    t.settings = {"path": {}}
+    t.fetcher = LocalTileFetcher(os.path.join(workdir, 'tiles'))
+    contents = {name: ((BASETIME, BASETIME, band, prod, *t.tiles_jp), dict(alpha=alpha, beta=beta)) for name, (band, prod, alpha, beta) in t.products.items()}
+    return bench_tiles(t, 'sat', workdir, repeat, t.tiles_jp, contents)
+
+
+def bench_radar(workdir, repeat):
+    from functions.download_radclass import DownloadRadar
+    from functions.radar_composite import RadarCompositor
+    t = DownloadRadar.__new__(DownloadRadar)
+    t.settings = {"path": {}}
+    t.fetcher = LocalTileFetcher(os.path.join(workdir, 'tiles'))
+    tiles = (6, 53, 22, 58, 27)
+
+    def prepare(t):  # 合成の準備(背景は地図)
+        t.compositor = RadarCompositor(t.image_map)
+
+    return bench_tiles(t, 'rad', workdir, repeat, tiles, {'jp_radar': ((BASETIME, BASETIME, *tiles), {})}, prepare)
+
+
+def print_result(name, result):
+    stages = ', '.join(f'{key[:-2]} {value * 1000:.1f}ms' for key, value in result.items() if key.endswith('_s') and key != 'total_s')
+    print(f'{name}: {result["total_s"] * 1000:.1f}ms ({stages})')
+
+
+def metadata():  # 比較するときの情報
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'numpy': np.__version__,
+        # 天気図を計測しなければ読み込まない
+        'matplotlib': getattr(sys.modules.get('matplotlib'), '__version__', None),
+        'opencv': cv2.__version__,
+        'time': tm.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--only', nargs='+', choices=GROUPS, default=list(GROUPS), help='計測する対象')
+    parser.add_argument('--fig-x', type=float, default=21)
+    parser.add_argument('--fig-y', type=float, default=17)
+    parser.add_argument('--workdir', help='擬似データと画像の保存先(指定しなければ一時ディレクトリ)')
+    parser.add_argument('--output', help='結果を保存するJSONファイル')
+    args = parser.parse_args()
+    workdir = args.workdir or tempfile.mkdtemp(prefix='bench_suite_')
+    results = {}
+    try:
+        if 'gsm' in args.only:
+            results.update(bench_charts('gsm', workdir, args.repeat, args.fig_x, args.fig_y))
+        if 'msm' in args.only:
+            results.update(bench_charts('msm', workdir, args.repeat, args.fig_x, args.fig_y))
+        if 'sat' in args.only:
+            results.update(bench_satellite(workdir, args.repeat))
+        if 'rad' in args.only:
+            results.update(bench_radar(workdir, args.repeat))
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump({'meta': metadata(), 'results': results}, fp, indent=4)
+
+
+if __name__ == "__main__":
+    main()
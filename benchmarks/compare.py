@@ -0,0 +1,64 @@
+###################################################################
+# ベンチマーク結果(JSON)の比較
+###################################################################
+import sys
+import json
+import argparse
+
+
+def load(path):  # 名前 -> 結果
+    with open(path) as fp:
+        data = json.load(fp)
+    # bench_suite.pyの形式 {'meta': ..., 'results': ...}
+    if 'results' in data:
+        return data.get('meta', {}), data['results']
+    return {}, data
+
+
+def flatten(results, prefix=''):  # 入れ子の結果を 名前 -> 秒 にする(名前が_sで終わる値だけ)
+    values = {}
+    for key, value in results.items():
+        name = f'{prefix}.{key}' if prefix else key
+        if isinstance(value, dict):
+            values.update(flatten(value, name))
+        elif key.endswith('_s') and isinstance(value, (int, float)):
+            values[name] = float(value)
+    return values
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('base', help='基準の結果')
+    parser.add_argument('new', help='比較する結果')
+    parser.add_argument('--threshold', type=float, default=0.10, help='遅くなったとみなす割合')
+    parser.add_argument('--min-seconds', type=float, default=0.001, help='これより短い計測は判定しない')
+    parser.add_argument('--all', action='store_true', help='合計(total_s)以外の段階も判定する')
+    args = parser.parse_args()
+    meta_base, base = load(args.base)
+    meta_new, new = load(args.new)
+    print(f'base: {meta_base.get("commit", args.base)}')
+    print(f'new : {meta_new.get("commit", args.new)}')
+    base = flatten(base)
+    new = flatten(new)
+    regressions = []
+    width = max((len(name) for name in base), default=0)
+    for name in sorted(base):
+        if name not in new:
+            print(f'{name:<{width}}  {base[name] * 1000:10.2f}ms  (なし)')
+            continue
+        ratio = new[name] / base[name] if base[name] > 0 else float('inf')
+        checked = args.all or name.endswith('total_s')
+        regressed = checked and base[name] >= args.min_seconds and ratio > 1 + args.threshold
+        mark = ' !' if regressed else ''
+        print(f'{name:<{width}}  {base[name] * 1000:10.2f}ms -> {new[name] * 1000:10.2f}ms  x{ratio:.2f}{mark}')
+        if regressed:
+            regressions.append(name)
+    for name in sorted(set(new) - set(base)):
+        print(f'{name:<{width}}  (なし) -> {new[name] * 1000:10.2f}ms')
+    if regressions:
+        print(f'{len(regressions)}件遅くなりました: ' + ', '.join(regressions))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+###################################################################
+# ベンチマーク用の擬似データ(grib2ファイル，地図・衛星・レーダーのタイル)
+###################################################################
+import os
+import sys
+import struct
+import hashlib
+import datetime
+
+import numpy as np
+import cv2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from functions.tile_fetcher import TileFetcher
+
+# 格子 (Ni, Nj, 北西端の緯度, 経度, 南東端の緯度, 経度, 経度の間隔, 緯度の間隔)
+GRIDS = {
+    # GSM全球(Rgl) 0.5度
+    'gsm': (720, 361, 90, 0, -90, 359.5, 0.5, 0.5),
+    # MSM日本域(Rjp)の地上 0.0625度 x 0.05度
+    'msm': (481, 505, 47.6, 120, 22.4, 150, 0.0625, 0.05),
+}
+# shortName -> (discipline, parameterCategory, parameterNumber)
+PARAMETERS = {
+    't': (0, 0, 0),
+    'r': (0, 1, 1),
+    'tp': (0, 1, 8),
+    'u': (0, 2, 2),
+    'v': (0, 2, 3),
+    'w': (0, 2, 8),
+    'prmsl': (0, 3, 1),
+    'gh': (0, 3, 5),
+    'tcc': (0, 6, 1),
+    '10u': (0, 2, 2),
+    '10v': (0, 2, 3),
+}
+# shortName -> (第一固定面の種類, 気圧面か)
+LEVEL_TYPES = {
+    'prmsl': 101,
+    'tcc': 1,
+    'tp': 1,
+    '10u': 103,
+    '10v': 103,
+}
+# 気圧面の高度の目安(m)
+HEIGHTS = {300: 9200, 500: 5700, 700: 3000, 850: 1500, 1000: 100}
+
+
+def signed(value, nbytes):  # 整数を符号と絶対値で表す
+    return value if value >= 0 else (1 << (nbytes * 8 - 1)) | -value
+
+
+def section(number, body):  # 節の長さと番号をつける
+    return struct.pack('>IB', len(body) + 5, number) + body
+
+
+def pack_simple(values, bits=16, decimal=2):  # 単純圧縮(テンプレート5.0と第7節)
+    scaled = np.asarray(values, dtype=np.float64) * 10.0 ** decimal
+    reference = np.float32(np.floor(scaled.min()))
+    span = float(scaled.max() - reference)
+    binary = max(0, int(np.ceil(np.log2(span / (2 ** bits - 1)))) if span > 0 else 0)
+    packed = np.clip(np.rint((scaled - reference) / 2.0 ** binary), 0, 2 ** bits - 1).astype('>u2')
+    template = struct.pack('>fHHBB', reference, signed(binary, 2), signed(decimal, 2), bits, 0)
+    return template, packed.tobytes()
+
+
+def grib2_message(short_name, level, forecast_time, grid, values, time_this):  # 1つのgrib2メッセージ
+    ni, nj, la1, lo1, la2, lo2, di, dj = grid
+    discipline, category, number = PARAMETERS[short_name]
+    # 第1節 識別節(RJTD)
+    sec1 = section(1, struct.pack('>HHBBBHBBBBBBB', 34, 0, 2, 1, 1, time_this.year, time_this.month, time_this.day, time_this.hour, 0, 0, 0, 1))
+    # 第3節 格子系定義節(テンプレート3.0 等緯度経度格子)
+    micro = lambda degree: signed(int(round(degree * 10 ** 6)), 4)
+    sec3 = section(3, struct.pack('>BIBBH', 0, ni * nj, 0, 0, 0)
+                   + struct.pack('>BBIBIBI', 6, 0, 0, 0, 0, 0, 0)
+                   + struct.pack('>IIIIIIBIIIIB', ni, nj, 0, 0xFFFFFFFF, micro(la1), micro(lo1), 48, micro(la2), micro(lo2), micro(di), micro(dj), 0))
+    # 第4節 プロダクト定義節(テンプレート4.0，降水量は1時間の積算のテンプレート4.8)
+    level_type = LEVEL_TYPES.get(short_name, 100)
+    scaled_level = level * 100 if level_type == 100 else level
+    # 雲量と降水量は大気全体
+    second_type = 8 if short_name in ('tcc', 'tp') else 255
+    template = struct.pack('>BBBBBHBBIBBIBBI', category, number, 2, 0, 31, 0, 0, 1, forecast_time, level_type, 0, scaled_level, second_type, 0, 0)
+    if short_name == 'tp':
+        time_end = time_this + datetime.timedelta(hours=forecast_time + 1)
+        template += (struct.pack('>HBBBBBBI', time_end.year, time_end.month, time_end.day, time_end.hour, 0, 0, 1, 0)
+                     + struct.pack('>BBBIBI', 1, 2, 1, 1, 255, 0))
+    sec4 = section(4, struct.pack('>HH', 0, 8 if short_name == 'tp' else 0) + template)
+    # 第5節 資料表現節(テンプレート5.0) 第6節 ビットマップ節(なし) 第7節 資料節
+    template, packed = pack_simple(values)
+    sec5 = section(5, struct.pack('>IH', ni * nj, 0) + template)
+    sec6 = section(6, struct.pack('>B', 255))
+    sec7 = section(7, packed)
+    body = sec1 + sec3 + sec4 + sec5 + sec6 + sec7 + b'7777'
+    # 第0節 指示節
+    return b'GRIB' + struct.pack('>HBBQ', 0, discipline, 2, len(body) + 16) + body
+
+
+def grid_lat_lon(grid):  # 格子の緯度経度(北から南，西から東)
+    ni, nj, la1, lo1, la2, lo2, di, dj = grid
+    lon, lat = np.meshgrid(np.linspace(lo1, lo2, ni), np.linspace(la1, la2, nj))
+    return lat, lon
+
+
+def field_values(short_name, level, forecast_time, lat, lon):  # それらしい値の擬似データ
+    rng = np.random.default_rng(int(hashlib.sha1(f'{short_name}{level}{forecast_time}'.encode()).hexdigest()[:8], 16))
+    phase = rng.uniform(0, 2 * np.pi, 2)
+    wave = np.sin(np.radians(lon) * 4 + phase[0] + forecast_time * 0.05) * np.cos(np.radians(lat) * 3 + phase[1])
+    coslat = np.cos(np.radians(lat))
+    if short_name == 'gh':
+        return HEIGHTS.get(level, 5000) + 300 * coslat + 120 * wave
+    if short_name == 't':
+        return 300 - 0.0065 * HEIGHTS.get(level, 0) - 30 * (1 - coslat) + 5 * wave
+    if short_name in ('u', '10u'):
+        return 30 * coslat * (level / 300 if level > 10 else 0.3) + 10 * wave
+    if short_name in ('v', '10v'):
+        return 15 * wave
+    if short_name == 'r':
+        return np.clip(60 + 40 * wave, 1, 100)
+    if short_name == 'w':
+        return 0.5 * wave
+    if short_name == 'prmsl':
+        return 101300 + 1500 * wave
+    if short_name == 'tcc':
+        return np.clip(50 + 60 * wave, 0, 100)
+    if short_name == 'tp':
+        return np.clip(20 * wave, 0, None)
+    return wave
+
+
+def write_grib2(path, grid_name, fields, forecast_times, time_this, accumulated=None):  # 擬似データのgrib2ファイルを作成(予報時間順)
+    # accumulated: 積算値の要素 shortName -> 積算時間(DownloadGSM.accumulated)
+    # 積算値は実際のファイル(MSMのFH00-15など)と同じく積算の開始をforecastTimeにする(予報時間nの値はforecastTime n-積算時間，FT0はなし)
+    accumulated = accumulated or {}
+    grid = GRIDS[grid_name]
+    lat, lon = grid_lat_lon(grid)
+    path_tmp = f'{path}.tmp'
+    with open(path_tmp, 'wb') as fp:
+        for forecast_time in forecast_times:
+            for short_name, level in sorted(fields):
+                message_time = forecast_time - accumulated.get(short_name, 0)
+                if message_time < 0:
+                    continue
+                fp.write(grib2_message(short_name, level, message_time, grid, field_values(short_name, level, message_time, lat, lon), time_this))
+    os.replace(path_tmp, path)
+    return path
+
+
+def tile_image(uri):  # URIに応じた擬似タイル(PNG/JPGのバイト列)
+    seed = int(hashlib.sha1(uri.encode()).hexdigest()[:8], 16)
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:256, 0:256]
+    if 'gsi.go.jp' in uri:
+        # 地図 海は[220, 220, 90]，陸はそれ以外
+        image = np.full((256, 256, 3), (220, 220, 90), dtype=np.uint8)
+        cy, cx, r = rng.uniform(0, 256), rng.uniform(0, 256), rng.uniform(40, 160)
+        image[(yy - cy) ** 2 + (xx - cx) ** 2 < r ** 2] = (200, 230, 200)
+        return cv2.imencode('.png', image)[1].tobytes()
+    if 'nowc' in uri:
+        # レーダー 降水のない所は透明
+        image = np.zeros((256, 256, 4), dtype=np.uint8)
+        cy, cx, r = rng.uniform(0, 256), rng.uniform(0, 256), rng.uniform(10, 100)
+        rain = (yy - cy) ** 2 + (xx - cx) ** 2 < r ** 2
+        image[rain, :3] = rng.integers(1, 256, 3, dtype=np.uint8)
+        image[rain, 3] = 255
+        return cv2.imencode('.png', image)[1].tobytes()
+    # 衛星 雲のような濃淡
+    cloud = 128 + 100 * np.sin(xx / 17.0 + rng.uniform(0, 6)) * np.cos(yy / 23.0 + rng.uniform(0, 6)) + rng.normal(0, 10, (256, 256))
+    image = np.repeat(np.clip(cloud, 0, 255).astype(np.uint8)[:, :, np.newaxis], 3, axis=2)
+    return cv2.imencode('.jpg', image)[1].tobytes()
+
+
+class LocalTileFetcher(TileFetcher):  # ネットワークの代わりにローカルのファイルからタイルを返す
+    def __init__(self, path, max_workers=None):
+        super().__init__(max_workers)
+        # タイルの保存先
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def path_tile(self, uri):  # URIに対応するファイル
+        return os.path.join(self.path, hashlib.sha1(uri.encode()).hexdigest() + os.path.splitext(uri)[1])
+
+    def prepare(self, uri_grid):  # タイルを作成しておく(計測に含めない)
+        for uri_h in uri_grid:
+            for uri in uri_h:
+                path = self.path_tile(uri)
+                if not os.path.exists(path):
+                    with open(path, 'wb') as fp:
+                        fp.write(tile_image(uri))
+
+    def get(self, uri):  # ファイルを読んで返す(なければNone)
+        try:
+            with open(self.path_tile(uri), 'rb') as fp:
+                return fp.read()
+        except FileNotFoundError:
+            return None
+
+
+def cycle_time(hour=0):  # 擬似データの初期時刻
+    return datetime.datetime(2021, 4, 1, hour)
@@ -1,6 +1,26 @@
-from .download_gsm import download_gsm
-from .download_msm import download_msm
-from .download_sat import download_sat
-from .download_rad import download_rad
-from .download_gsmtest import download_gsmtest
-__all__ = ["download_gsm", "download_sat", "download_rad", "download_gsmtest", "download_msm"]
+import importlib
+
+# 名前 -> 定義しているモジュール
+# 使うときに初めて読み込む(衛星・レーダーだけのときにcartopy, matplotlib, pygribなどを読み込まないように)
+_modules = {
+    "download_gsm": ".download_gsm",
+    "download_msm": ".download_msm",
+    "download_sat": ".download_sat",
+    "download_rad": ".download_rad",
+    "download_gsmtest": ".download_gsmtest",
+    "run_daemon": ".daemon",
+}
+__all__ = ["download_gsm", "download_sat", "download_rad", "download_gsmtest", "download_msm", "run_daemon"]
+
+
+def __getattr__(name):
+    if name not in _modules:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_modules[name], __name__), name)
+    # 同じ名前のサブモジュールが属性に入るので，関数で上書きしておく
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,140 @@
+###################################################################
+# 過去分の一括処理(複数サイクルの並列実行)
+###################################################################
+import os
+import sys
+import json
+import signal
+import threading
+import multiprocessing
+from concurrent import futures
+
+if __name__ == "__main__":
+    print("please execute main.py")
+    sys.exit()
+
+from .exit_program import set_interactive
+from .metrics import init_metrics, get_metrics
+
+# 子プロセスのプールを処理の後も残すか(常駐するときは次回も使い，子プロセスのキャッシュを保つ)
+keep_workers = False
+# プロセス内で使い回す子プロセスのプール (プロセス数, 計測の設定, 計測の名前) -> ProcessPoolExecutor
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def save_settings(settings, time_start, settings_file_path):  # ダウンロード開始日時を設定ファイルに保存
+    settings["time_start"]["year"] = time_start.year
+    settings["time_start"]["month"] = time_start.month
+    settings["time_start"]["day"] = time_start.day
+    # 書き込み途中で止まっても壊れないように置き換える
+    path_tmp = f'{settings_file_path}.tmp'
+    with open(path_tmp, "w") as fp:
+        json.dump(settings, fp)
+    os.replace(path_tmp, settings_file_path)
+
+
+def set_keep_workers(value):  # 子プロセスのプールを残すかの設定
+    global keep_workers
+    keep_workers = value
+
+
+def get_executor(workers, module):  # 設定ごとに共有の子プロセスのプールを返す
+    # module: 子プロセスで先に読み込んでおくモジュール(1サイクル分の処理を定義しているモジュール)
+    metrics = get_metrics()
+    key = (workers, json.dumps(metrics.config(), sort_keys=True), getattr(metrics, 'job', None))
+    with _executors_lock:
+        if key not in _executors:
+            # forkではなくforkserverで子プロセスを作る(常駐するときはスレッドやロックの状態を複製しないように)
+            context = multiprocessing.get_context("forkserver")
+            # forkserverで先に読み込んでおく(子プロセスごとにcartopy, matplotlib, pygribを読み込まないように)
+            context.set_forkserver_preload(['__main__', module])
+            _executors[key] = futures.ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=init_worker, initargs=(metrics.config(), key[2]))
+        return _executors[key]
+
+
+def drop_executor(executor):  # プールを終了して共有から外す
+    with _executors_lock:
+        for key in [key for key, value in _executors.items() if value is executor]:
+            del _executors[key]
+    executor.shutdown(wait=True)
+
+
+def shutdown_executors():  # 共有のプールを全て終了(常駐を終了するとき)
+    with _executors_lock:
+        executors = list(_executors.values())
+        _executors.clear()
+    for executor in executors:
+        executor.shutdown(wait=True)
+
+
+def init_worker(metrics, job):  # 子プロセスではSIGINTを無視(親プロセスで処理する)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # 子プロセスでは'q'の入力を待たない(失敗は親プロセスに例外として返す)
+    set_interactive(False)
+    # 子プロセスの計測(段階はJSON Linesに出力し，累積した値は親プロセスに返す)
+    init_metrics(metrics, job)
+
+
+def run_cycle(process_cycle, time_this, settings):  # 子プロセスで1サイクル処理して累積した計測値を返す
+    # 子プロセスではatexitが呼ばれないので，サイクルごとに親プロセスに渡して親プロセスで出力する
+    process_cycle(time_this, settings)
+    return get_metrics().take()
+
+
+def run_backfill(process_cycle, settings, settings_file_path, time_start, time_end, step, workers=1):
+    # process_cycle(time_this, settings): 1サイクル分の処理(子プロセスで実行するのでモジュールの関数にする)
+    # 戻り値: 次回のダウンロード開始日時
+    cycles = []
+    time_this = time_start
+    while time_this.date() < time_end:
+        cycles.append(time_this)
+        time_this += step
+    time_next = time_this
+    # 完了したサイクル
+    done = set()
+    # 先頭から連続して完了したサイクルの数
+    n_done = 0
+    day_saved = time_start.date()
+
+    def checkpoint():  # 連続して完了したところまで設定ファイルに保存
+        nonlocal n_done, day_saved
+        while n_done < len(cycles) and cycles[n_done] in done:
+            n_done += 1
+        time_resume = cycles[n_done] if n_done < len(cycles) else time_next
+        # 日付が進んだときだけ保存
+        if time_resume.date() > day_saved:
+            save_settings(settings, time_resume, settings_file_path)
+            day_saved = time_resume.date()
+            print(f'[進捗を保存] {day_saved}')
+
+    if workers <= 1:
+        for time_this in cycles:
+            process_cycle(time_this, settings)
+            done.add(time_this)
+            checkpoint()
+        return time_next
+    print(f'[並列処理] {workers}プロセス, {len(cycles)}サイクル')
+    metrics = get_metrics()
+    executor = get_executor(workers, process_cycle.__module__)
+    pending = {}
+    try:
+        # 古いサイクルから順に投入
+        pending = {executor.submit(run_cycle, process_cycle, time_this, settings): time_this for time_this in cycles}
+        for future in futures.as_completed(pending):
+            metrics.merge(future.result())
+            done.add(pending[future])
+            checkpoint()
+    except BaseException as e:
+        # 失敗したら残りのサイクルは実行しない(実行中のサイクルは終わるまで待つ)
+        for future in pending:
+            future.cancel()
+        futures.wait(pending)
+        # 子プロセスが異常終了したプールは次回使わない
+        if isinstance(e, futures.BrokenExecutor):
+            drop_executor(executor)
+        raise
+    finally:
+        if not keep_workers:
+            drop_executor(executor)
+    return time_next
@@ -0,0 +1,90 @@
+###################################################################
+# 地図の背景(陸，海岸線，国境線)のキャッシュ
+###################################################################
+import os
+import sys
+import hashlib
+import threading
+
+import numpy as np
+import cartopy.crs as ccrs
+import matplotlib.pyplot as plt
+
+if __name__ == "__main__":
+    print("please execute main.py")
+    sys.exit()
+
+
+class BaseMapCache:  # 投影法，範囲，地図の大きさ(ピクセル)，スタイルごとに背景を一度だけ描画する
+    def __init__(self, path=None):
+        # 背景の保存先(Noneならプロセス内だけで保持)
+        self.path = path
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+        # キー -> (画像, 投影座標での範囲)
+        self.images = {}
+        self.lock = threading.Lock()
+
+    def key(self, projection, extent, size, dpi, style):  # キャッシュのキー
+        text = repr((projection.proj4_init, tuple(extent), tuple(size), dpi, style))
+        return hashlib.sha1(text.encode()).hexdigest()
+
+    def get(self, projection, extent, size, dpi, style, draw_layers):  # 背景の画像と範囲を返す
+        # size: 貼り付ける地図の大きさ(ピクセル)
+        key = self.key(projection, extent, size, dpi, style)
+        with self.lock:
+            if key in self.images:
+                return self.images[key]
+            path = os.path.join(self.path, f'{style}_{key}.npz') if self.path is not None else None
+            # 保存済みなら読み込む
+            if path is not None and os.path.exists(path):
+                with np.load(path) as npz:
+                    self.images[key] = (npz['image'], tuple(npz['extent']))
+                return self.images[key]
+            image, map_extent = self.render(projection, extent, size, dpi, draw_layers)
+            self.images[key] = (image, map_extent)
+            if path is not None:
+                path_tmp = f'{path}.{os.getpid()}.tmp.npz'
+                np.savez_compressed(path_tmp, image=image, extent=np.array(map_extent))
+                os.replace(path_tmp, path)
+                print(f'[背景を作成] {path}')
+            return self.images[key]
+
+    def render(self, projection, extent, size, dpi, draw_layers):  # 背景だけの画像を地図と同じ大きさで描画
+        fig = plt.figure(figsize=(size[0] / dpi, size[1] / dpi), dpi=dpi)
+        ax = fig.add_axes([0, 0, 1, 1], projection=projection)
+        ax.set_extent(extent, ccrs.PlateCarree())
+        draw_layers(ax)
+        ax.spines['geo'].set_visible(False)
+        fig.canvas.draw()
+        # 地図の部分だけを切り出す
+        buffer = np.asarray(fig.canvas.buffer_rgba())
+        x0, y0, x1, y1 = np.round(ax.bbox.extents).astype(int)
+        height = buffer.shape[0]
+        image = buffer[height - y1:height - y0, x0:x1].copy()
+        map_extent = ax.get_extent()
+        plt.close(fig=fig)
+        return image, map_extent
+
+    def draw(self, ax, extent, style, draw_layers):  # 背景を地図に貼り付ける(カラーバーや余白の調整が終わってから呼ぶ)
+        # 縦横比を反映した実際の地図の大きさ(ピクセル)
+        ax.apply_aspect()
+        x0, y0, x1, y1 = ax.bbox.extents
+        size = (int(round(x1 - x0)), int(round(y1 - y0)))
+        image, map_extent = self.get(ax.projection, extent, size, ax.figure.dpi, style, draw_layers)
+        # 同じ大きさなので補間しない(海岸線などをぼかさない)
+        ax.imshow(image, extent=map_extent, origin='upper', transform=ax.projection, zorder=0, interpolation='none')
+        # imshowで範囲が変わらないようにする
+        ax.set_extent(map_extent, ax.projection)
+
+
+# プロセス内で共有する背景のキャッシュ 保存先 -> BaseMapCache
+_base_maps = {}
+_base_maps_lock = threading.Lock()
+
+
+def get_base_maps(path=None):  # 保存先ごとに共有の背景のキャッシュを返す
+    with _base_maps_lock:
+        if path not in _base_maps:
+            _base_maps[path] = BaseMapCache(path)
+        return _base_maps[path]
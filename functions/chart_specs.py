@@ -0,0 +1,228 @@
+###################################################################
+# 天気図の仕様(使う要素，計算，等値線の間隔，スタイル)
+###################################################################
+import sys
+
+import numpy as np
+from matplotlib import cm
+from matplotlib.colors import ListedColormap
+from scipy.ndimage import gaussian_filter
+
+if __name__ == "__main__":
+    print("please execute main.py")
+    sys.exit()
+
+from .derived import *
+
+# 高度のシグマ
+HEIGHT_SIGMA = 1.0
+
+###################################################################
+# 計算した値
+# 参照は要素 (shortName, level)，計算 (名前, 引数...)，格子 'lat' / 'lon'，定数のいずれか
+###################################################################
+DERIVED = {
+    # 平滑化 ("smooth", 参照, シグマ)
+    "smooth": lambda value, sigma: gaussian_filter(value, sigma=sigma),
+    # 定数倍 ("scale", 参照, 倍率)
+    "scale": lambda value, factor: value * factor,
+    # 差 ("sub", 参照, 参照)
+    "sub": lambda a, b: a - b,
+    # K -> ℃
+    "celsius": to_celsius,
+    # Pa -> hPa
+    "hpa": to_hpa,
+    # Pa/s -> hPa/h
+    "hpa_per_hour": to_hpa_per_hour,
+    # 風速(kt)
+    "wind_speed_kt": lambda u, v: to_kt(wind_speed(u, v)),
+    # 露点温度(K) ("dewpoint", 気温, 相対湿度(%))
+    "dewpoint": lambda temp, rh: dewpoint_from_relative_humidity(temp, rh * 0.01),
+    # 相当温位(K) ("ept", 気圧(hPa), 気温, 露点温度)
+    "ept": equivalent_potential_temperature,
+    # 相対渦度(1/s) ("vorticity", 東西風, 南北風, 'lat', 'lon')
+    "vorticity": lambda u, v, lat, lon: vorticity(u, v, *get_grid_deltas(lon, lat)),
+}
+
+
+def cmap_pubu():  # 湿数
+    return ListedColormap(np.flipud(cm.get_cmap('BuPu', 256)(range(256))))
+
+
+def cmap_vorticity():  # 渦度
+    PuBu = np.flipud(cm.get_cmap('BuPu', 140)(range(140)))
+    YlOrRd = cm.get_cmap('YlOrRd', 380)(range(380))
+    return ListedColormap(np.vstack((PuBu, YlOrRd)))
+
+
+def cmap_vertical_velocity():  # 上昇流
+    RdOrYl = np.flipud(cm.get_cmap('YlOrRd', 125)(range(125)))
+    BuPu = cm.get_cmap('BuPu', 65)(range(65))
+    return ListedColormap(np.vstack((RdOrYl, BuPu)))
+
+
+def cmap_precipitation():  # 降水量
+    colors = ["aliceblue"] * 1 + ["skyblue"] * 4 + ["dodgerblue"] * 5 + ["blue"] * 10 + ["yellow"] * 10 + ["orange"] * 20 + ["red"] * 30 + ["darkmagenta"] * 20
+    return ListedColormap(colors)
+
+
+# よく使う値
+HEIGHT_300 = ("smooth", ("gh", 300), HEIGHT_SIGMA)
+HEIGHT_500 = ("smooth", ("gh", 500), HEIGHT_SIGMA)
+HEIGHT_850 = ("smooth", ("gh", 850), HEIGHT_SIGMA)
+TEMP_500 = ("celsius", ("t", 500))
+DEWPOINT_700 = ("dewpoint", ("t", 700), ("r", 700))
+DEWPOINT_850 = ("dewpoint", ("t", 850), ("r", 850))
+
+###################################################################
+# 天気図
+# layers: 描画する順の層
+#   type: contourf / contour / barbs
+#   data: 等値線の値(contourf, contour)  u, v: 風(barbs, ktに変換して間引く)
+#   levels: 等値線の値  step: 風を間引く間隔
+#   clabel: 等値線のラベルの設定  colorbar: カラーバーのラベル
+#   その他はmatplotlibにそのまま渡す(cmapは関数でもよい)
+###################################################################
+CHARTS = {
+    "jp_300_hw": {
+        "name": "300hPa高度/風(日本域)",
+        "title": "300hPa: HEIGHT(M), ISOTACH(kt), WIND ARROW(kt)",
+        "region": "jp",
+        "layers": [
+            {"type": "contourf", "data": ("wind_speed_kt", ("u", 300), ("v", 300)), "levels": np.arange(0, 220, 20), "extend": "max", "cmap": "YlGnBu", "alpha": 0.9, "colorbar": "ISOTECH(kt)"},
+            {"type": "barbs", "u": ("u", 300), "v": ("v", 300), "step": 10, "color": "black", "alpha": 0.5, "length": 10},
+            {"type": "contour", "data": HEIGHT_300, "levels": np.arange(5400, 12000, 120), "colors": "black", "clabel": {}},
+        ],
+    },
+    "jp_500_ht": {
+        "name": "500hPa高度/気温(日本域)",
+        "title": r"500hPa: HEIGHT(M), TEMP($^\circ$C)",
+        "region": "jp",
+        "layers": [
+            {"type": "contourf", "data": TEMP_500, "levels": np.arange(-48, 9, 3), "extend": "both", "cmap": "jet", "alpha": 0.9, "colorbar": r"TEMP($^\circ$C)"},
+            {"type": "contour", "data": TEMP_500, "levels": np.arange(-48, 9, 3), "colors": "black", "linestyles": "dashed", "alpha": 0.5, "clabel": {}},
+            {"type": "contour", "data": HEIGHT_500, "levels": np.arange(0, 8000, 60), "colors": "black", "clabel": {}},
+        ],
+    },
+    "jp_500_hv": {
+        "name": "500hPa高度/風/渦度(日本域)",
+        "title": "500hPa: HEIGHT(M), WIND ARROW(kt), VORT($10^{-6}/s$)",
+        "region": "jp",
+        "layers": [
+            {"type": "contourf", "data": ("scale", ("vorticity", ("u", 500), ("v", 500), "lat", "lon"), 10**6), "levels": np.arange(-120, 390, 30), "extend": "both", "cmap": cmap_vorticity, "alpha": 0.9, "colorbar": "VORT($10^{-6}/s$)"},
+            {"type": "barbs", "u": ("u", 500), "v": ("v", 500), "step": 10, "color": "black", "alpha": 0.5, "length": 10},
+            {"type": "contour", "data": HEIGHT_500, "levels": np.arange(0, 8000, 60), "colors": "black", "clabel": {}},
+        ],
+    },
+    "jp_500_t_700_td": {
+        "name": "500hPa気温/700hPa湿数(日本域)",
+        "title": "500hPa: TEMP($^\\circ$C)\n700hPa: T-Td($^\\circ$C)",
+        "region": "jp",
+        "layers": [
+            {"type": "contourf", "data": ("sub", ("t", 700), DEWPOINT_700), "levels": np.arange(0, 21, 3), "extend": "max", "cmap": cmap_pubu, "alpha": 0.9, "colorbar": r"T-Td($^\circ$C)"},
+            {"type": "contour", "data": ("sub", ("t", 700), DEWPOINT_700), "levels": np.array([-100, 3]), "colors": "yellow", "linestyles": "solid"},
+            {"type": "contour", "data": TEMP_500, "levels": np.arange(-60, 30, 3), "colors": "black", "linestyles": "solid", "clabel": {}},
+        ],
+    },
+    "jp_850_ht": {
+        "name": "850hPa高度/気温(日本域)",
+        "title": r"850hPa: HEIGHT(M), TEMP($^\circ$C)",
+        "region": "jp",
+        "layers": [
+            {"type": "contourf", "data": ("celsius", ("t", 850)), "levels": np.arange(-24, 33, 3), "extend": "both", "cmap": "jet", "alpha": 0.9, "colorbar": r"TEMP($^\circ$C)"},
+            {"type": "contour", "data": ("celsius", ("t", 850)), "levels": np.arange(-24, 33, 3), "colors": "black", "linestyles": "dashed", "alpha": 0.5, "clabel": {}},
+            {"type": "contour", "data": HEIGHT_850, "levels": np.arange(0, 8000, 60), "colors": "black", "clabel": {}},
+        ],
+    },
+    "jp_850_tw_700_vv": {
+        "name": "850hPa気温/風，700hPa上昇流(日本域)",
+        "title": "850hPa: HEIGHT(M), WIND ARROW(kt)\n700hPa: VERTICAL VELOCITY(hPa/h)",
+        "region": "jp",
+        "layers": [
+            {"type": "contourf", "data": ("hpa_per_hour", ("w", 700)), "levels": np.arange(-120, 70, 10), "extend": "both", "cmap": cmap_vertical_velocity, "alpha": 0.9, "colorbar": "VERTICAL VELOCITY(hPa/h)"},
+            {"type": "barbs", "u": ("u", 850), "v": ("v", 850), "step": 10, "color": "black", "alpha": 0.5, "length": 10},
+            {"type": "contour", "data": ("celsius", ("smooth", ("t", 850), 1.0)), "levels": np.arange(-60, 60, 3), "colors": "black", "clabel": {}},
+        ],
+    },
+    "jp_850_eptw": {
+        "name": "850hPa相当温位/風(日本域)",
+        "title": "850hPa: E.P.TEMP(K), WIND ARROW(kt)",
+        "region": "jp",
+        "layers": [
+            {"type": "contourf", "data": ("smooth", ("ept", 850, ("t", 850), DEWPOINT_850), 1.0), "levels": np.arange(255, 372, 3), "extend": "both", "cmap": "jet", "alpha": 0.9, "colorbar": "E.P.TEMP(K)"},
+            {"type": "contour", "data": ("smooth", ("ept", 850, ("t", 850), DEWPOINT_850), 1.0), "levels": np.arange(255, 372, 3), "colors": "black", "linestyles": "solid", "linewidths": 1, "clabel": {"levels": np.arange(258, 372, 6)}},
+            {"type": "barbs", "u": ("u", 850), "v": ("v", 850), "step": 5, "length": 8, "color": "black", "alpha": 0.5},
+        ],
+    },
+    "jp_surf_pwt": {
+        "name": "地上気圧/風/気温（日本域)",
+        "title": r"SUFRACE: PRESSURE(hPa), TEMP($^\circ$C), WIND ARROW(kt)",
+        "region": "jp",
+        "layers": [
+            {"type": "contourf", "data": ("celsius", ("t", 1000)), "levels": np.arange(-15, 42, 3), "extend": "both", "cmap": "jet", "alpha": 0.9, "colorbar": r"TEMP($^\circ$C)"},
+            {"type": "contour", "data": ("celsius", ("t", 1000)), "levels": np.arange(-15, 42, 3), "colors": "black", "linestyles": "dashed", "alpha": 0.5, "clabel": {"fontsize": 20}},
+            {"type": "barbs", "u": ("10u", 10), "v": ("10v", 10), "step": 5, "color": "black", "alpha": 0.5, "length": 8},
+            {"type": "contour", "data": ("smooth", ("hpa", ("prmsl", 0)), 2.0), "levels": np.arange(900, 1600, 4), "colors": "black", "clabel": {}},
+        ],
+    },
+    "np_500_ht": {
+        "name": "500hPa高度/気温(北極中心)",
+        "title": r"500hPa: HEIGHT(M), TEMP($^\circ$C)",
+        "region": "np",
+        # 経度の端をつなぐ
+        "cyclic": True,
+        # 正方形の図にする
+        "square": True,
+        "adjust": {"bottom": 0.02, "top": 0.95, "left": 0.05, "right": 0.95},
+        "layers": [
+            {"type": "contourf", "data": TEMP_500, "levels": np.arange(-48, 9, 3), "extend": "both", "cmap": "jet", "alpha": 0.9, "colorbar": r"TEMP($^\circ$C)"},
+            {"type": "contour", "data": TEMP_500, "levels": np.arange(-48, 9, 3), "colors": "black", "linestyles": "dashed", "alpha": 0.5, "clabel": {"levels": np.arange(-48, 9, 6)}},
+            {"type": "contour", "data": HEIGHT_500, "levels": np.arange(0, 8000, 60), "colors": "black", "clabel": {"levels": np.arange(0, 8000, 120)}},
+        ],
+    },
+    "jp_surf_ppc": {
+        "name": "地上気圧/降水量/雲量(日本域)",
+        "title": "SUFRACE: PRESSURE(hPa)\n PRECIPITATION(mm/h), CLOUD COVER(%)",
+        "region": "jp",
+        "layers": [
+            {"type": "contourf", "data": ("tcc", 0), "levels": np.arange(0, 110, 10), "cmap": "gray", "alpha": 0.9, "colorbar": "CLOUD COVER(%)", "colorbar_orientation": "vertical"},
+            {"type": "contourf", "data": ("tp", 0), "levels": np.array([0.1, 1, 5, 10, 20, 30, 50, 80, 100]), "extend": "max", "cmap": cmap_precipitation, "alpha": 0.9, "colorbar": "PRECIPITATION(mm/h)"},
+            {"type": "barbs", "u": ("10u", 10), "v": ("10v", 10), "step": 30, "color": "green", "alpha": 0.9, "length": 10},
+            {"type": "contour", "data": ("smooth", ("hpa", ("prmsl", 0)), 12.0), "levels": np.arange(900, 1600, 4), "colors": "red", "clabel": {}},
+        ],
+    },
+}
+# matplotlibに渡さない層のキー
+LAYER_KEYS = ("type", "data", "u", "v", "step", "levels", "clabel", "colorbar", "colorbar_orientation")
+
+
+def is_derived(ref):  # 計算した値の参照か
+    return isinstance(ref, tuple) and len(ref) > 0 and ref[0] in DERIVED
+
+
+def is_field(ref):  # 要素の参照か
+    return isinstance(ref, tuple) and len(ref) == 2 and isinstance(ref[0], str) and not is_derived(ref)
+
+
+def ref_fields(ref):  # 参照が使う要素(使う順)
+    if is_derived(ref):
+        return [field for arg in ref[1:] for field in ref_fields(arg)]
+    if is_field(ref):
+        return [ref]
+    return []
+
+
+def layer_refs(layer):  # 層が使う参照
+    return [layer[key] for key in ("data", "u", "v") if key in layer]
+
+
+def chart_refs(chart):  # 天気図が使う参照(重複なし)
+    return list(dict.fromkeys(ref for layer in CHARTS[chart]["layers"] for ref in layer_refs(layer)))
+
+
+def chart_fields(chart):  # 天気図が使う要素(重複なし，使う順)
+    return list(dict.fromkeys(field for ref in chart_refs(chart) for field in ref_fields(ref)))
+
+
+def required_fields(charts):  # 天気図をまとめて作成するのに必要な要素
+    return {field for chart in charts for field in chart_fields(chart)}
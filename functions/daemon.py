@@ -0,0 +1,179 @@
+###################################################################
+# 常駐して定期的に実行(GSM 6時間, MSM 3時間, 衛星 10分, レーダー 5分)
+###################################################################
+import os
+import sys
+import json
+import signal
+import asyncio
+import datetime
+import traceback
+import importlib
+import time as tm
+from concurrent import futures
+
+if __name__ == "__main__":
+    print("please execute main.py")
+    sys.exit()
+
+from .exit_program import set_interactive
+from .backfill import set_keep_workers, shutdown_executors
+from .metrics import init_metrics, get_metrics
+
+# 処理ごとの既定の設定
+# interval_minutes: 実行の間隔(UTCの0時から区切る)
+# offset_minutes: 区切りからの遅れ(データが公開されるまでの時間)
+# group: 同じグループの処理は同時に実行しない(matplotlibはスレッドセーフでないので天気図はまとめる)
+DEFAULT_JOBS = {
+    "gsm": {"enabled": True, "interval_minutes": 360, "offset_minutes": 0, "group": "charts"},
+    "msm": {"enabled": True, "interval_minutes": 180, "offset_minutes": 0, "group": "charts"},
+    "sat": {"enabled": True, "interval_minutes": 10, "offset_minutes": 3, "group": "sat"},
+    "rad": {"enabled": True, "interval_minutes": 5, "offset_minutes": 1, "group": "rad"},
+}
+
+
+class Runner:  # モジュールを読み込んで関数を実行(無効にした処理のモジュールは読み込まない)
+    def __init__(self, module, name):
+        self.module = module
+        self.name = name
+        self.func = None
+
+    def load(self):  # モジュールの読み込み(スレッドで同時に読み込まないように起動時に呼ぶ)
+        self.func = getattr(importlib.import_module(self.module, __package__), self.name)
+
+    def __call__(self):
+        self.func(metrics=False)
+
+
+class TileRunner(Runner):  # 衛星・レーダーのオブジェクトを使い回す(地図，タイル取得エンジン，記録を保持)
+    def __init__(self, module, name, method):
+        super().__init__(module, name)
+        self.method = method
+        self.t = None
+
+    def __call__(self):
+        if self.t is None:
+            # 初回は地図の作成と時刻リストの取得
+            self.t = self.func(metrics=False)
+        else:
+            # 2回目以降は時刻リストだけ取得し直す
+            self.t.refresh()
+        getattr(self.t, self.method)()
+
+
+def get_runners():  # 処理の名前 -> 実行する関数
+    return {
+        "gsm": Runner(".download_gsm", "update_gsm"),
+        "msm": Runner(".download_msm", "update_msm"),
+        "sat": TileRunner(".download_satclass", "DownloadSatellite", "download_jp"),
+        "rad": TileRunner(".download_radclass", "DownloadRadar", "download_jp_radar"),
+    }
+
+
+class Job:  # 定期的に実行する処理
+    def __init__(self, name, func, interval_minutes, offset_minutes=0, group=None, run_at_start=True, **kwargs):
+        self.name = name
+        self.func = func
+        self.interval = interval_minutes * 60
+        self.offset = offset_minutes * 60
+        self.group = group or name
+        # 起動してすぐに1回実行するか
+        self.run_at_start = run_at_start
+
+    def delay(self, now=None):  # 次の区切りまでの秒数
+        now = tm.time() if now is None else now
+        time_next = ((now - self.offset) // self.interval + 1) * self.interval + self.offset
+        return time_next - now
+
+    def run(self):  # 1回実行(別スレッドで実行する 失敗しても次の実行は続ける)
+        metrics = get_metrics()
+        print(f'[{datetime.datetime.now():%Y-%m-%d %H:%M:%S}] {self.name}: 開始')
+        start = tm.perf_counter()
+        try:
+            with metrics.stage('job', job=self.name):
+                self.func()
+        except Exception:
+            traceback.print_exc()
+            metrics.count('job_failures', job=self.name)
+            print(f'[{datetime.datetime.now():%Y-%m-%d %H:%M:%S}] {self.name}: 失敗しました')
+        else:
+            print(f'[{datetime.datetime.now():%Y-%m-%d %H:%M:%S}] {self.name}: 完了({tm.perf_counter() - start:.1f}秒)')
+        finally:
+            metrics.flush()
+
+
+class Daemon:  # 処理をそれぞれの間隔で実行し，SIGINT/SIGTERMで実行中の処理が終わってから終了
+    def __init__(self, jobs):
+        self.jobs = jobs
+        self.stop = None
+        self.locks = {}
+        # 処理ごとに1つのスレッド
+        self.executor = futures.ThreadPoolExecutor(max_workers=max(len(jobs), 1), thread_name_prefix='job')
+
+    def request_stop(self, signum):  # シグナルハンドラ(2回目は待たずに終了)
+        if self.stop.is_set():
+            print(f'[{signal.Signals(signum).name}] 強制終了します')
+            os._exit(1)
+        print(f'[{signal.Signals(signum).name}] 実行中の処理が終わったら終了します(もう一度送ると強制終了)')
+        self.stop.set()
+
+    async def sleep(self, seconds):  # 指定した秒数待つ(終了の要求があればTrue)
+        try:
+            await asyncio.wait_for(self.stop.wait(), seconds)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    async def run_job(self, job):  # 区切りの時刻ごとに実行
+        loop = asyncio.get_running_loop()
+        first = job.run_at_start
+        while not self.stop.is_set():
+            if not first and await self.sleep(job.delay()):
+                break
+            first = False
+            async with self.locks[job.group]:
+                if self.stop.is_set():
+                    break
+                await loop.run_in_executor(self.executor, job.run)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self.stop = asyncio.Event()
+        self.locks = {job.group: asyncio.Lock() for job in self.jobs}
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, self.request_stop, signum)
+        print('[常駐] ' + ', '.join(f'{job.name}({job.interval // 60}分ごと)' for job in self.jobs))
+        try:
+            await asyncio.gather(*(self.run_job(job) for job in self.jobs))
+        finally:
+            self.executor.shutdown(wait=True)
+            # 使い回していた天気図の子プロセスを終了
+            shutdown_executors()
+        print('[常駐] 終了しました')
+
+
+def get_jobs(settings):  # 設定ファイルの"jobs"で既定の設定を上書き
+    runners = get_runners()
+    jobs = []
+    for name, default in DEFAULT_JOBS.items():
+        config = {**default, **settings.get("jobs", {}).get(name, {})}
+        if config["enabled"]:
+            runners[name].load()
+            jobs.append(Job(name, runners[name], **config))
+    return jobs
+
+
+def run_daemon(settings_file_path="settings_daemon.json"):
+    print("#####GPV-JMA Daemon#####")
+    # 設定ファイルの読み込み(なければ既定の設定)
+    settings = {}
+    if os.path.exists(settings_file_path):
+        with open(settings_file_path) as fp:
+            settings = json.load(fp)
+    # エラーのときに'q'の入力を待たない
+    set_interactive(False)
+    # 天気図の子プロセスを次回も使う(読み込んだモジュールや地図の背景，格子，投影のキャッシュを保つ)
+    set_keep_workers(True)
+    # 計測(全ての処理で共有)
+    init_metrics(settings.get("metrics"), "daemon")
+    asyncio.run(Daemon(get_jobs(settings)).run())
@@ -0,0 +1,126 @@
+###################################################################
+# 単位なしの計算(風速，露点温度，相当温位，渦度など)
+###################################################################
+import sys
+import threading
+
+import numpy as np
+
+if __name__ == "__main__":
+    print("please execute main.py")
+    sys.exit()
+
+from .projection_cache import grid_digest
+
+# 定数(metpyと同じ値)
+ZERO_CELSIUS = 273.15
+# m/s -> kt
+MS_TO_KT = 3600 / 1852
+# 乾燥空気の気体定数/定圧比熱
+KAPPA = 0.2857142857142857
+# 水蒸気と乾燥空気の分子量の比
+EPSILON = 0.6219569100577033
+# 飽和水蒸気圧(hPa)の係数(Bolton 1980)
+SAT_PRESSURE_0C = 6.112
+# 地球の半径(m) pyprojの'sphere'
+EARTH_RADIUS = 6370997.0
+# (格子) -> (dx, dy)
+_deltas = {}
+_deltas_lock = threading.Lock()
+
+
+def wind_speed(u, v, out=None):  # 風速
+    return np.hypot(u, v, out=out)
+
+
+def to_kt(speed, out=None):  # m/s -> kt
+    return np.multiply(speed, MS_TO_KT, out=out)
+
+
+def to_celsius(temp, out=None):  # K -> ℃
+    return np.subtract(temp, ZERO_CELSIUS, out=out)
+
+
+def to_hpa(pressure, out=None):  # Pa -> hPa
+    return np.multiply(pressure, 0.01, out=out)
+
+
+def to_hpa_per_hour(omega, out=None):  # Pa/s -> hPa/h
+    return np.multiply(omega, 36.0, out=out)
+
+
+def saturation_vapor_pressure(temp):  # 飽和水蒸気圧(hPa) temp: K
+    return SAT_PRESSURE_0C * np.exp(17.67 * (temp - ZERO_CELSIUS) / (temp - 29.65))
+
+
+def dewpoint_from_relative_humidity(temp, rh):  # 露点温度(K) temp: K, rh: 0-1
+    ln = np.log(saturation_vapor_pressure(temp) * rh / SAT_PRESSURE_0C)
+    return ZERO_CELSIUS + 243.5 * ln / (17.67 - ln)
+
+
+def equivalent_potential_temperature(pressure, temp, dewp):  # 相当温位(K) pressure: hPa, temp, dewp: K
+    e = saturation_vapor_pressure(dewp)
+    r = EPSILON * e / (pressure - e)
+    # 持ち上げ凝結高度の気温
+    t_l = 56 + 1.0 / (1.0 / (dewp - 56) + np.log(temp / dewp) / 800)
+    th_l = temp * (1000 / (pressure - e)) ** KAPPA * (temp / t_l) ** (0.28 * r)
+    return th_l * np.exp(r * (1 + 0.448 * r) * (3036.0 / t_l - 1.78))
+
+
+def lat_lon_grid_deltas(lon, lat):  # 隣り合う格子点の距離(m) 東向き，北向きを正とする
+    lon = np.radians(lon)
+    lat = np.radians(lat)
+
+    def distance(lon1, lat1, lon2, lat2):  # 大円距離
+        a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+        return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(a))
+
+    dx = distance(lon[:, :-1], lat[:, :-1], lon[:, 1:], lat[:, 1:])
+    dx *= np.where(np.sin(lon[:, 1:] - lon[:, :-1]) < 0, -1, 1)
+    dy = distance(lon[:-1, :], lat[:-1, :], lon[1:, :], lat[1:, :])
+    dy *= np.where(lat[1:, :] < lat[:-1, :], -1, 1)
+    return dx, dy
+
+
+def get_grid_deltas(lon, lat):  # 格子ごとに一度だけ距離を計算
+    key = grid_digest(lon, lat)
+    with _deltas_lock:
+        deltas = _deltas.get(key)
+    if deltas is None:
+        deltas = lat_lon_grid_deltas(lon, lat)
+        for delta in deltas:
+            delta.setflags(write=False)
+        with _deltas_lock:
+            _deltas[key] = deltas
+    return deltas
+
+
+def first_derivative(f, delta, axis):  # 不等間隔の2次精度の差分
+    f = np.moveaxis(np.asarray(f), axis, 0)
+    delta = np.moveaxis(np.asarray(delta), axis, 0)
+    out = np.empty(f.shape, dtype=np.result_type(f, delta))
+    # 内側
+    d0 = delta[:-1]
+    d1 = delta[1:]
+    combined = d0 + d1
+    out[1:-1] = (-d1 / (combined * d0) * f[:-2]
+                 + (d1 - d0) / (d0 * d1) * f[1:-1]
+                 + d0 / (combined * d1) * f[2:])
+    # 端
+    d0 = delta[0]
+    d1 = delta[1]
+    combined = d0 + d1
+    out[0] = (-(combined + d0) / (combined * d0) * f[0]
+              + combined / (d0 * d1) * f[1]
+              - d0 / (combined * d1) * f[2])
+    d0 = delta[-2]
+    d1 = delta[-1]
+    combined = d0 + d1
+    out[-1] = (d1 / (combined * d0) * f[-3]
+               - combined / (d0 * d1) * f[-2]
+               + (combined + d1) / (combined * d1) * f[-1])
+    return np.moveaxis(out, 0, axis)
+
+
+def vorticity(u, v, dx, dy):  # 相対渦度(1/s) 配列は(y, x)の順
+    return first_derivative(v, dx, axis=1) - first_derivative(u, dy, axis=0)
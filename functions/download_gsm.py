@@ -1,4 +1,6 @@
 from .download_gsmclass import *
+from .backfill import run_backfill, save_settings
+from .metrics import init_metrics
 
 if __name__ == "__main__":
     print("please execute main.py")
@@ -9,54 +11,50 @@ def download_gsm():
     print("#####GSM Downloader#####")
     # SIGINTシグナルを受け取る
     signal.signal(signal.SIGINT, handler_sigint)
+    # ダウンロードと天気図作成
+    try:
+        update_gsm()
+    except Exception as e:
+        exit_program(e, sys.exc_info())
+    # 完了
+    exit_program("完了しました")
+
+
+def update_gsm(metrics=True):  # 前回の続きから前日までのサイクルを処理(失敗したら例外を送出)
     # 設定ファイルの読み込み
     with open("settings_gsm.json") as fp:
         settings = json.load(fp)
+    # 計測(常駐するときは共有のものを使う)
+    if metrics:
+        init_metrics(settings.get("metrics"), "gsm")
     # ディレクトリが存在しなければ作成
     try:
         for dirs in settings["path"].values():
             os.makedirs(dirs, exist_ok=True)
     except FileNotFoundError:
-        exit_program(f'{settings["path"]}は存在しないパスです.')
+        raise FileNotFoundError(f'{settings["path"]}は存在しないパスです.')
     # ダウンロード開始時刻の設定
-    try:
-        time_start = datetime.datetime(settings["time_start"]["year"], settings["time_start"]["month"], settings["time_start"]["day"], 0, 0)
-    except Exception as e:
-        exit_program(e, sys.exc_info())
+    time_start = datetime.datetime(settings["time_start"]["year"], settings["time_start"]["month"], settings["time_start"]["day"], 0, 0)
     print(f'ダウンロード開始日時(UTC): {time_start}')
     # ダウンロード終了時刻は一日前
     time_end = datetime.date.today() - datetime.timedelta(days=1)
     # ダウンロードと天気図作成
-    while time_start.date() < time_end:
-        try:
-            t = DownloadGSM(time_start, settings["fig_x"], settings["fig_y"], settings["path"]["tmp"])
-            t.download_grib2()
-            t.jp_300_hw(settings["path"]["jp_300_hw"])
-            t.jp_500_ht(settings["path"]["jp_500_ht"])
-            t.jp_500_hv(settings["path"]["jp_500_hv"])
-            t.jp_500_t_700_td(settings["path"]["jp_500_t_700_td"])
-            t.jp_850_ht(settings["path"]["jp_850_ht"])
-            t.jp_850_tw_700_vv(settings["path"]["jp_850_tw_700_vv"])
-            t.jp_850_eptw(settings["path"]["jp_850_eptw"])
-            t.jp_surf_pwt(settings["path"]["jp_surf_pwt"])
-            t.np_500_ht(settings["path"]["np_500_ht"])
-        except Exception as e:
-            exit_program(e, sys.exc_info())
-        time_start += datetime.timedelta(hours=6)
+    time_start = run_backfill(download_gsm_cycle, settings, "settings_gsm.json", time_start, time_end, datetime.timedelta(hours=6), settings.get("workers", 1))
     # grib2ファイルの削除
     if(settings["delete_tmp"]):
         shutil.rmtree(settings["path"]["tmp"])
     # 設定の更新
     update_settings(settings, time_start, "settings_gsm.json")
-    # 完了
-    exit_program("完了しました")
+
+
+def download_gsm_cycle(time_this, settings):  # 1サイクル分のダウンロードと天気図作成
+    t = DownloadGSM(time_this, settings["fig_x"], settings["fig_y"], settings["path"]["tmp"], settings.get("partial_grib2", False), settings.get("field_cache_mb"), settings.get("forecast_times"), settings.get("charts"), settings["path"].get("archive"), settings.get("timelapse"), settings["path"].get("basemap"))
+    t.download_grib2()
+    t.extract()
+    t.render(settings["path"], settings.get("render_workers", 1))
 
 
 def update_settings(settings, time_start, settings_file_path):
     # 設定の更新
-    settings["time_start"]["year"] = time_start.year
-    settings["time_start"]["month"] = time_start.month
-    settings["time_start"]["day"] = time_start.day
-    with open(settings_file_path, "w") as fp:
-        json.dump(settings, fp)
+    save_settings(settings, time_start, settings_file_path)
     print("#####完了#####")
@@ -6,18 +6,14 @@ import datetime
 import requests
 import signal
 import json
+import multiprocessing
+from concurrent import futures
 
 import numpy as np
 import cartopy.crs as ccrs
 import cartopy.feature as cfeature
-import cartopy.util as cutil
 import matplotlib.pyplot as plt
 import matplotlib.ticker as mticker
-from matplotlib import cm
-from matplotlib.colors import ListedColormap
-from metpy.units import units
-import metpy.calc as mpcalc
-from scipy.ndimage import gaussian_filter
 import pygrib as grib
 
 if __name__ == "__main__":
@@ -26,6 +22,17 @@ if __name__ == "__main__":
 
 from .exit_program import *
 from .file_is_on_server import *
+from .grib2_index import RangeNotSupported, scan, http_reader, merge_ranges, build_index, Grib2Index, path_index, load_unavailable, save_unavailable, path_unavailable
+from .shared_fields import SharedFields, attach_fields
+from .field_store import FieldStore
+from .grid_registry import subset_field
+from .base_map import get_base_maps
+from .projection_cache import project_grid
+from .derived import *
+from .field_archive import FieldArchive
+from .timelapse import get_timelapses
+from .metrics import init_metrics, get_metrics
+from .chart_specs import CHARTS, DERIVED, LAYER_KEYS, is_derived, is_field, ref_fields, layer_refs, chart_refs, chart_fields, required_fields
 
 
 class DownloadGSM:
@@ -51,16 +58,38 @@ class DownloadGSM:
     mapcrs_np = ccrs.AzimuthalEquidistant(central_longitude=140, central_latitude=90)
     # 正距円筒図法
     datacrs = ccrs.PlateCarree()
-    # 高度のシグマ
-    height_sigma = 1.0
     # フォントサイズのデフォルト
     fontsize = 25
+    # 地図の背景をキャッシュするか
+    cached_base = True
+    # 地図の背景のスタイル名(キャッシュのキー)
+    base_style = 'gsm'
+    # ダウンロードのチャンクサイズ
+    chunk_size = 1024 * 1024
+    # 部分ダウンロードでまとめるメッセージ間の隙間(バイト)
+    range_gap = 0
+    # 部分ダウンロードが壊れていたときの再試行の回数(超えたらファイル全体をダウンロード)
+    partial_retries = 3
+    # 使用する予報時間
+    forecast_times = [0]
+    # 積算値の要素 shortName -> 積算時間(時間)
+    # テンプレート4.8のforecastTimeは積算の開始なので，予報時間nの値はforecastTimeがn-積算時間のメッセージ
+    accumulated = {}
+    # 読み込み途中でメモリに置く予報時間の数
+    max_pending = 2
+    # 作成する天気図(仕様はchart_specs.CHARTS)
+    charts = ["jp_300_hw", "jp_500_ht", "jp_500_hv", "jp_500_t_700_td", "jp_850_ht", "jp_850_tw_700_vv", "jp_850_eptw", "jp_surf_pwt", "np_500_ht"]
 
-    def __init__(self, time_this, fig_x, fig_y, path):
+    def __init__(self, time_this, fig_x, fig_y, path, partial=False, field_cache_mb=None, forecast_times=None, charts=None, archive=None, timelapse=None, basemap=None):
         # 時間
         self.time_this = time_this
-        self.time_str1 = time_this.strftime('%Y%m%d%H')
-        self.time_str2 = f'{(time_this + datetime.timedelta(hours=self.time_diff)).strftime("%Y.%m.%d %H")}JST ({time_this.strftime("%Y.%m.%d %H")}UTC)'
+        # 予報時間
+        if forecast_times is not None:
+            self.forecast_times = forecast_times
+        # 作成する天気図
+        if charts is not None:
+            self.charts = [chart for chart in self.charts if chart in charts]
+        self.set_forecast_time(0)
         # 解像度x,y
         self.fig_x = fig_x
         self.fig_y = fig_y
@@ -68,58 +97,295 @@ class DownloadGSM:
         self.path_grib2 = os.path.join(path, time_this.strftime('%Y%m%d%H'))
         # grib2ファイル
         self.grib2 = None
+        # grib2ファイルの索引
+        self.index = None
+        # 天気図に使う要素だけダウンロードするか
+        self.partial = partial
+        # 現在の予報時間のメッセージ (shortName, level) -> バイト列
+        self.messages = {}
+        # 読み込み済みの要素 (shortName, level, forecastTime, 領域) -> (data, lat, lon)
+        self.fields = FieldStore(field_cache_mb)
+        # 要素のアーカイブ(Noneなら保存しない)
+        self.archive = FieldArchive(os.path.join(archive, time_this.strftime('%Y%m%d%H'))) if archive is not None else None
+        # 天気図の動画(設定がなければ作らない)
+        self.timelapses = get_timelapses(timelapse, self.charts)
+        # 地図の背景のキャッシュの保存先(Noneならプロセス内だけで保持)
+        self.path_basemap = basemap
 
     def __del__(self):
         # grib2ファイルを閉じる
-        self.grib2.close()
+        if self.grib2 is not None:
+            self.grib2.close()
+
+    def set_forecast_time(self, forecast_time):  # 予報時間を切り替える(タイトルと保存先のファイル名も変わる)
+        self.forecast_time = forecast_time
+        time_valid = self.time_this + datetime.timedelta(hours=forecast_time)
+        self.time_str1 = self.time_this.strftime('%Y%m%d%H')
+        self.time_str2 = f'{(time_valid + datetime.timedelta(hours=self.time_diff)).strftime("%Y.%m.%d %H")}JST ({time_valid.strftime("%Y.%m.%d %H")}UTC)'
+        # 初期値以外は予報時間をつける
+        if forecast_time > 0:
+            self.time_str1 += f'_FT{forecast_time:03d}'
+            self.time_str2 += f' FT{forecast_time}'
+
+    def uri_grib2(self):  # ダウンロード先URI
+        return f'http://database3.rish.kyoto-u.ac.jp/arch/jmadata/data/gpv/original/{self.time_this.strftime("%Y/%m/%d")}/Z__C_RJTD_{self.time_this.strftime("%Y%m%d%H%M%S")}_GSM_GPV_Rgl_FD0000_grib2.bin'
+
+    def required_fields(self):  # 天気図に使う要素の一覧
+        return required_fields(self.charts)
+
+    def message_time(self, shortName, forecast_time):  # 予報時間の値を持つメッセージのforecastTime(積算値で積算の期間がなければNone)
+        hours = self.accumulated.get(shortName)
+        if hours is None:
+            return forecast_time
+        return forecast_time - hours if forecast_time >= hours else None
+
+    def step_fields(self, fields, forecast_time=None):  # 予報時間に値がある要素だけ(順番はそのまま)
+        forecast_time = self.forecast_time if forecast_time is None else forecast_time
+        return [field for field in fields if self.message_time(field[0], forecast_time) is not None]
+
+    def step_messages(self, forecast_time):  # 予報時間に読むメッセージ [(shortName, level, forecastTime)]
+        return [(shortName, level, self.message_time(shortName, forecast_time)) for shortName, level in self.step_fields(sorted(self.required_fields()), forecast_time)]
+
+    def required_messages(self):  # 全ての予報時間で読むメッセージ {(shortName, level, forecastTime)}
+        return {message for forecast_time in self.forecast_times for message in self.step_messages(forecast_time)}
 
     def download_grib2(self):  # grib2ファイルのダウンロード
+        # アーカイブに全ての要素があればダウンロードしない
+        if self.archive_is_complete():
+            print(f'[アーカイブ　] {self.archive.path}')
+            return
+        # 部分ダウンロードしたファイルに足りない要素があり，サーバのファイルにはあればダウンロードし直す
+        if self.partial and os.path.exists(self.path_grib2):
+            missing = self.missing_fields(Grib2Index(self.path_grib2)) - load_unavailable(self.path_grib2)
+            if missing and self.remote_has(missing):
+                print(f'[要素が不足] {self.path_grib2}')
+                for path in (self.path_grib2, path_index(self.path_grib2), path_unavailable(self.path_grib2)):
+                    if os.path.exists(path):
+                        os.remove(path)
         # ダウンロード済みの場合は何もしない
         if not os.path.exists(self.path_grib2):
-            # ダウンロード先URI
-            uri_grib2 = f'http://database3.rish.kyoto-u.ac.jp/arch/jmadata/data/gpv/original/{self.time_this.strftime("%Y/%m/%d")}/Z__C_RJTD_{self.time_this.strftime("%Y%m%d%H%M%S")}_GSM_GPV_Rgl_FD0000_grib2.bin'
             # ダウンロード試行
-            self.download_grib2_sub(uri_grib2)
+            if self.partial:
+                self.download_grib2_partial(self.uri_grib2())
+            else:
+                self.download_grib2_sub(self.uri_grib2())
+            # 索引を作成
+            build_index(self.path_grib2)
+            # ダウンロードしても足りないメッセージはサーバのファイルにもない(次回から不足とみなさない)
+            missing = self.missing_fields(Grib2Index(self.path_grib2))
+            if missing:
+                print(f'[要素なし　　] {sorted(missing)}はサーバのファイルにありません: {self.uri_grib2()}')
+                save_unavailable(self.path_grib2, missing)
         self.grib2 = grib.open(self.path_grib2)
+        self.index = Grib2Index(self.path_grib2)
+
+    def missing_fields(self, index):  # 索引にないメッセージの一覧
+        return {(shortName, level, message_time) for shortName, level, message_time in self.required_messages() if index.find(shortName, level, message_time) is None}
+
+    def remote_has(self, missing):  # 不足したメッセージがサーバのファイルにあるか(ないものは記録する)
+        try:
+            with requests.Session() as session:
+                entries = scan(http_reader(session, self.uri_grib2()))
+        # 一覧を取得できなければ今あるファイルを使う(次回また確認する)
+        except Exception as e:
+            print(f'[エラー　　　] {e}')
+            return False
+        remote = {(entry['shortName'], entry['level'], entry['forecastTime']) for entry in entries}
+        if missing - remote:
+            save_unavailable(self.path_grib2, missing - remote)
+        return bool(missing & remote)
 
     def download_grib2_sub(self, uri_grib2):
+        # 一時ファイルにダウンロードして，完了したら名前を変える
+        path_part = self.path_grib2 + '.part'
+        metrics = get_metrics()
         # ダウンロード試行
         while True:
             try:
-                req = requests.get(uri_grib2, timeout=10)
+                with metrics.stage('grib2_download'):
+                    total = self.download_grib2_part(uri_grib2, path_part)
+
+            # サーバにない場合は中止
+            except requests.HTTPError:
+                raise
 
             # ダウンロードできない場合
             except Exception as e:
                 print(f'[エラー　　　] {e}')
+                metrics.count('retries', source='grib2')
                 tm.sleep(10)
+                continue
 
+            # 大きさが合わなければ続きからダウンロード
+            size = os.path.getsize(path_part)
+            if total is not None and size != total:
+                print(f'[エラー　　　] {size}/{total}バイトで中断されました: {uri_grib2}')
+                metrics.count('retries', source='grib2')
+                tm.sleep(10)
+                continue
+            # 終端がなければ最初からダウンロード
+            if not self.grib2_is_complete(path_part):
+                print(f'[エラー　　　] grib2ファイルが壊れています: {uri_grib2}')
+                metrics.count('retries', source='grib2')
+                os.remove(path_part)
+                tm.sleep(10)
+                continue
             # ダウンロードが成功したらファイルを保存
+            os.replace(path_part, self.path_grib2)
+            print(f'[ダウンロード] {self.path_grib2}: {uri_grib2}')
+            break
+
+    def download_grib2_part(self, uri_grib2, path_part):  # 途中からのダウンロード(ファイル全体の大きさを返す)
+        # 途中までダウンロードしたファイルがあれば続きから
+        size = os.path.getsize(path_part) if os.path.exists(path_part) else 0
+        headers = {'Range': f'bytes={size}-'} if size > 0 else {}
+        with requests.get(uri_grib2, headers=headers, timeout=10, stream=True) as req:
+            # すでに最後までダウンロードしている場合
+            if req.status_code == 416:
+                total = self.content_range_total(req)
+                if total != size:
+                    os.remove(path_part)
+                    raise IOError(f'途中のファイルを破棄しました: {path_part}')
+                return total
+            # サーバ側のエラーは再試行
+            if req.status_code >= 500:
+                raise IOError(f'{req.status_code}: {uri_grib2}')
+            req.raise_for_status()
+            # 続きから(206)か，最初から(200)か
+            if req.status_code == 206:
+                mode = 'ab'
+                total = self.content_range_total(req)
+            else:
+                mode = 'wb'
+                length = req.headers.get('Content-Length')
+                total = int(length) if length is not None else None
+            # 少しずつファイルに書き込む
+            with open(path_part, mode) as fp:
+                for chunk in req.iter_content(chunk_size=self.chunk_size):
+                    fp.write(chunk)
+                    get_metrics().count('bytes', len(chunk), source='grib2')
+        return total
+
+    def download_grib2_partial(self, uri_grib2):  # 天気図に使う要素だけをRangeでダウンロード
+        # 接続はこの中で使い回し，終わったら閉じる
+        with requests.Session() as session:
+            # 各メッセージのヘッダだけ読んで一覧を作成
+            while True:
+                try:
+                    entries = scan(http_reader(session, uri_grib2))
+                # Rangeに対応していなければファイル全体をダウンロード
+                except RangeNotSupported:
+                    print(f'[部分ダウンロード非対応] {uri_grib2}')
+                    return self.download_grib2_sub(uri_grib2)
+                # サーバにない場合は中止
+                except requests.HTTPError:
+                    raise
+                # ダウンロードできない場合
+                except Exception as e:
+                    print(f'[エラー　　　] {e}')
+                    tm.sleep(10)
+                else:
+                    break
+            messages = self.required_messages()
+            wanted = [entry for entry in entries if (entry['shortName'], entry['level'], entry['forecastTime']) in messages]
+            # 見つからない要素があればファイル全体をダウンロード
+            missing = messages - {(entry['shortName'], entry['level'], entry['forecastTime']) for entry in wanted}
+            if missing:
+                print(f'[部分ダウンロード不可] {sorted(missing)}がありません: {uri_grib2}')
+                return self.download_grib2_sub(uri_grib2)
+            # 必要な範囲だけダウンロード
+            path_part = self.path_grib2 + '.part'
+            ranges = merge_ranges(wanted, self.range_gap)
+            for attempt in range(self.partial_retries + 1):
+                if attempt > 0:
+                    get_metrics().count('retries', source='grib2')
+                    tm.sleep(10)
+                with open(path_part, 'wb') as fp, get_metrics().stage('grib2_download', partial=True):
+                    for start, end in ranges:
+                        self.download_grib2_range(session, uri_grib2, start, end, fp)
+                if self.grib2_is_complete(path_part):
+                    break
+                # 終端がなければ最初からダウンロードし直す
+                print(f'[エラー　　　] grib2ファイルが壊れています: {uri_grib2}')
+                os.remove(path_part)
             else:
-                with open(self.path_grib2, 'wb') as fp:
-                    fp.write(req.content)
-                print(f'[ダウンロード] {self.path_grib2}: {uri_grib2}')
-                break
+                # 何度やっても壊れていればファイル全体をダウンロード
+                print(f'[部分ダウンロード不可] 再試行しても壊れています: {uri_grib2}')
+                return self.download_grib2_sub(uri_grib2)
+            os.replace(path_part, self.path_grib2)
+            size = sum(end - start for start, end in ranges)
+            print(f'[部分ダウンロード] {self.path_grib2}: {uri_grib2} ({len(wanted)}/{len(entries)}メッセージ, {size}バイト)')
 
-    def draw_map(self, projection, extent):  # 地図を描画
+    def download_grib2_range(self, session, uri_grib2, start, end, fp):  # 指定した範囲をファイルに追記
+        position = fp.tell()
+        while True:
+            try:
+                with session.get(uri_grib2, headers={'Range': f'bytes={start}-{end - 1}'}, timeout=10, stream=True) as req:
+                    if req.status_code != 206:
+                        raise IOError(f'{req.status_code}: {uri_grib2}')
+                    for chunk in req.iter_content(chunk_size=self.chunk_size):
+                        fp.write(chunk)
+                get_metrics().count('bytes', fp.tell() - position, source='grib2')
+                if fp.tell() - position != end - start:
+                    raise IOError(f'{fp.tell() - position}/{end - start}バイトで中断されました: {uri_grib2}')
+            # ダウンロードできない場合は書き込んだ分を戻して再試行
+            except Exception as e:
+                print(f'[エラー　　　] {e}')
+                get_metrics().count('retries', source='grib2')
+                fp.seek(position)
+                fp.truncate()
+                tm.sleep(10)
+            else:
+                return
+
+    @staticmethod
+    def content_range_total(req):  # Content-Rangeからファイル全体の大きさを取得
+        content_range = req.headers.get('Content-Range', '')
+        total = content_range.rpartition('/')[2]
+        return int(total) if total.isdigit() else None
+
+    @staticmethod
+    def grib2_is_complete(path):  # grib2ファイルが終端(7777)で終わっているか確認
+        if os.path.getsize(path) < 4:
+            return False
+        with open(path, 'rb') as fp:
+            fp.seek(-4, os.SEEK_END)
+            return fp.read(4) == b'7777'
+
+    def draw_map(self, projection, extent, figsize=None):  # 地図を描画
+        if figsize is None:
+            figsize = (self.fig_x, self.fig_y)
         # 地図
-        fig = plt.figure(figsize=(self.fig_x, self.fig_y))
+        fig = plt.figure(figsize=figsize)
         ax = fig.add_subplot(1, 1, 1, projection=projection)
         # 地図の範囲を設定
         ax.set_extent(extent, self.datacrs)
+        # 陸，海岸線，国境線(キャッシュする場合は大きさが決まってからdraw_baseで貼り付ける)
+        if not self.cached_base:
+            self.draw_base_layers(ax)
+        # 格子線の大きさ、色、線種、間隔の設定(ここでは緯線と経線をひく)
+        ax.gridlines(xlocs=mticker.MultipleLocator(10),
+                     ylocs=mticker.MultipleLocator(10),
+                     linestyle=':', color='grey')
+        return fig, ax
+
+    def draw_base(self, ax, extent):  # キャッシュした背景を地図の大きさで貼り付ける
+        if self.cached_base:
+            get_base_maps(self.path_basemap).draw(ax, extent, self.base_style, self.draw_base_layers)
+
+    def draw_base_layers(self, ax):  # 地図の背景を描画
         # 海岸線を追加
         ax.add_feature(cfeature.COASTLINE.with_scale('50m'))
         # 国境線を追加
         ax.add_feature(cfeature.BORDERS.with_scale('50m'))
         # 陸の塗りつぶし
         ax.add_feature(cfeature.LAND, color='black', alpha=0.8)
-        # 格子線の大きさ、色、線種、間隔の設定(ここでは緯線と経線をひく)
-        ax.gridlines(xlocs=mticker.MultipleLocator(10),
-                     ylocs=mticker.MultipleLocator(10),
-                     linestyle=':', color='grey')
-        return fig, ax
 
-    def draw_jp_colorbar(self, cf):  # カラーバー
-        cbar = plt.colorbar(cf, orientation='horizontal', fraction=0.05, shrink=0.95, aspect=50, pad=0)
+    def draw_jp_colorbar(self, cf, orientation='horizontal'):  # カラーバー
+        if orientation == 'vertical':
+            cbar = plt.colorbar(cf, orientation='vertical', fraction=0.15, shrink=0.95, aspect=20, pad=0)
+        else:
+            cbar = plt.colorbar(cf, orientation='horizontal', fraction=0.05, shrink=0.95, aspect=50, pad=0)
         cbar.ax.tick_params(labelsize=self.fontsize)
         return cbar
 
@@ -128,358 +394,325 @@ class DownloadGSM:
         ax.set_title(title_r, loc='right', fontsize=self.fontsize)
 
     def grib2_select_jp(self, shortName, level):  # grib2ファイルから指定したデータを取得(日本域)
-        return self.grib2.select(shortName=shortName, level=level)[0].data(lat1=self.lat_min_jp, lat2=self.lat_max_jp, lon1=self.lon_min_jp, lon2=self.lon_max_jp)
+        return self.select_field(shortName, level, 'jp')
 
     # grib2ファイルから指定したデータを取得(北極域)
     def grib2_select_np(self, shortName, level):
-        return self.grib2.select(shortName=shortName, level=level)[0].data(lat1=self.lat_min_np, lat2=self.lat_max_np)
+        return self.select_field(shortName, level, 'np')
 
-    def jp_300_hw(self, path):  # 300hPa高度/風(日本域)
-        path_fig = os.path.join(path, self.time_str1 + '.jpg')
+    def select_field(self, shortName, level, region):  # 読み込み済みならそれを，なければアーカイブかgrib2ファイルから取得
+        key = (shortName, level, self.forecast_time, region)
+        field = self.fields.get(key)
+        if field is None:
+            if self.archive is not None and self.archive.has(key):
+                field = self.archive.load(key)
+            else:
+                field = self.decode_field(shortName, level, region)
+            self.fields.put(key, field)
+        return field
+
+    def select_message(self, shortName, level):  # 索引からメッセージを取得(索引になければ検索)
+        # 読み込み済みの予報時間のメッセージ
+        data = self.messages.get((shortName, level))
+        if data is not None:
+            return grib.fromstring(data)
+        message_time = self.message_time(shortName, self.forecast_time)
+        entry = self.index.find(shortName, level, message_time) if self.index is not None else None
+        if entry is None:
+            return self.grib2.select(shortName=shortName, level=level, forecastTime=message_time)[0]
+        return grib.fromstring(self.index.read(entry))
+
+    def region_bounds(self, region):  # 領域の範囲(lat1, lat2, lon1, lon2)
+        if region == 'np':
+            return (self.lat_min_np, self.lat_max_np, None, None)
+        return (self.lat_min_jp, self.lat_max_jp, self.lon_min_jp, self.lon_max_jp)
+
+    def decode_field(self, shortName, level, region):  # grib2ファイルから指定したデータを取得
+        return subset_field(self.select_message(shortName, level), self.region_bounds(region))
+
+    @staticmethod
+    def chart_region(chart):  # 天気図の領域
+        return CHARTS[chart]["region"]
+
+    def region_map(self, region):  # 領域の投影法と範囲
+        if region == 'np':
+            return self.mapcrs_np, self.extent_np
+        return self.mapcrs_jp, self.extent_jp
+
+    def field_offset(self, field):  # 要素のファイル内の位置(読む順番)
+        message_time = self.message_time(field[0], self.forecast_time)
+        entry = self.index.find(field[0], field[1], message_time) if self.index is not None and message_time is not None else None
+        return entry['offset'] if entry is not None else 0
+
+    def evaluate(self, ref, region, grid):  # 参照の値(計算した値は予報時間と領域ごとに一度だけ計算)
+        # grid: (lat, lon)
+        if ref == 'lat':
+            return grid[0]
+        if ref == 'lon':
+            return grid[1]
+        if is_field(ref):
+            return self.select_field(ref[0], ref[1], region)[0]
+        # 定数
+        if not is_derived(ref):
+            return ref
+        key = ('derived', ref, self.forecast_time, region)
+        value = self.fields.get(key)
+        if value is None:
+            value = (DERIVED[ref[0]](*[self.evaluate(arg, region, grid) for arg in ref[1:]]),)
+            self.fields.put(key, value)
+        return value[0]
+
+    def path_fig(self, path):  # 天気図の保存先
+        return os.path.join(path, self.time_str1 + '.jpg')
+
+    def ref_available(self, ref):  # 現在の予報時間で参照の値を計算できるか(積算の期間がない要素を使わないか)
+        return len(self.step_fields(ref_fields(ref))) == len(ref_fields(ref))
+
+    def load_fields(self, charts):  # 天気図に使う要素をファイルの順に一度だけ読み込み，計算した値もまとめる
+        fields = {}
+        plan = {(shortName, level, self.chart_region(chart)) for chart in charts for shortName, level in self.step_fields(chart_fields(chart))}
+        metrics = get_metrics()
+        with metrics.stage('decode', ft=self.forecast_time):
+            for shortName, level, region in sorted(plan, key=lambda item: (self.field_offset(item), item[2])):
+                fields[(shortName, level, self.forecast_time, region)] = self.select_field(shortName, level, region)
+        # 天気図の間で共通の値は一度だけ計算する
+        with metrics.stage('compute', ft=self.forecast_time):
+            for chart in charts:
+                region = self.chart_region(chart)
+                _, lat, lon = self.select_field(*self.step_fields(chart_fields(chart))[0], region)
+                for ref in chart_refs(chart):
+                    if is_derived(ref) and self.ref_available(ref):
+                        fields[('derived', ref, self.forecast_time, region)] = (self.evaluate(ref, region, (lat, lon)),)
+        return fields
+
+    def charts_to_render(self, paths):  # 現在の予報時間でまだ作成していない天気図
+        return [chart for chart in self.charts if chart in paths and not os.path.exists(self.path_fig(paths[chart]))]
+
+    def archive_keys(self, forecast_time):  # アーカイブに保存する要素
+        return sorted({(shortName, level, forecast_time, self.chart_region(chart)) for chart in self.charts for shortName, level in self.step_fields(chart_fields(chart), forecast_time)}, key=lambda key: (self.field_offset(key), key[3]))
+
+    def archive_is_complete(self, forecast_times=None):  # アーカイブに全ての要素があるか
+        if self.archive is None:
+            return False
+        forecast_times = self.forecast_times if forecast_times is None else forecast_times
+        return all(self.archive.has(key) for forecast_time in forecast_times for key in self.archive_keys(forecast_time))
+
+    def extract(self):  # 天気図に使う要素をアーカイブに書き出す
+        if self.archive is None or self.index is None:
+            return
+        forecast_times = [forecast_time for forecast_time in self.forecast_times if not self.archive_is_complete([forecast_time])]
+        for forecast_time, messages in self.iter_steps(forecast_times):
+            self.set_forecast_time(forecast_time)
+            self.messages = messages
+            for key in self.archive_keys(forecast_time):
+                if not self.archive.has(key):
+                    self.archive.write(key, self.decode_field(key[0], key[1], key[3]))
+            # 予報時間ごとに索引を保存(中断しても続きから)
+            self.archive.save()
+            self.messages = {}
+        if forecast_times:
+            print(f'[アーカイブ　] {self.archive.path}: FT{forecast_times}')
+        self.set_forecast_time(0)
+
+    def iter_steps(self, forecast_times):  # 予報時間ごとのメッセージを順に返す
+        # アーカイブから読む場合はgrib2ファイルを読まない
+        if self.index is None or self.archive_is_complete(forecast_times):
+            return ((forecast_time, {}) for forecast_time in forecast_times)
+        return self.index.iter_steps({forecast_time: self.step_messages(forecast_time) for forecast_time in forecast_times}, self.max_pending)
+
+    def render(self, paths, workers=1):  # 天気図をまとめて作成
+        # paths: 天気図の名前 -> 保存先ディレクトリ
+        forecast_times = []
+        for forecast_time in self.forecast_times:
+            self.set_forecast_time(forecast_time)
+            if self.charts_to_render(paths):
+                forecast_times.append(forecast_time)
+        # 子プロセスは予報時間をまたいで使い回す(背景，格子，投影のキャッシュを保ったまま)
+        executor = None
+        try:
+            # grib2ファイルを一度だけ読み，そろった予報時間から作成する
+            for forecast_time, messages in self.iter_steps(forecast_times):
+                self.set_forecast_time(forecast_time)
+                self.messages = messages
+                charts = self.charts_to_render(paths)
+                if workers <= 1 or len(charts) <= 1:
+                    self.load_fields(charts)
+                    for chart in charts:
+                        self.draw_chart(chart, paths[chart])
+                else:
+                    if executor is None:
+                        metrics = get_metrics()
+                        executor = futures.ProcessPoolExecutor(max_workers=min(workers, len(self.charts)), mp_context=render_context(), initializer=init_render_worker, initargs=(metrics.config(), getattr(metrics, 'job', None)))
+                    self.render_parallel(charts, paths, executor)
+                self.add_timelapse(charts, paths)
+                print(f'[{self.time_str2}] 要素キャッシュ: {self.fields.stats()}')
+                # 作成が終わった予報時間の要素は捨てる
+                self.messages = {}
+                self.fields.clear()
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=True)
+        self.set_forecast_time(0)
+        for timelapse in self.timelapses.values():
+            timelapse.flush()
+
+    def add_timelapse(self, charts, paths):  # 作成した天気図を動画に追加(時刻は対象時刻)
+        time_valid = (self.time_this + datetime.timedelta(hours=self.forecast_time)).strftime('%Y%m%d%H%M%S')
+        for chart in charts:
+            path_fig = self.path_fig(paths[chart])
+            if chart in self.timelapses and os.path.exists(path_fig):
+                self.timelapses[chart].add(time_valid, path_fig)
+
+    def render_parallel(self, charts, paths, executor):  # 子プロセスで天気図を作成
+        # 要素を一度だけ読み込んで共有メモリに置く
+        arrays = {}
+        for key, value in self.load_fields(charts).items():
+            region = key[3]
+            arrays[key] = value[0]
+            # 計算した値には緯度経度がない
+            if len(value) == 3:
+                arrays[('lat', region)] = value[1]
+                arrays[('lon', region)] = value[2]
+        shared = SharedFields(arrays)
+        try:
+            # 予報時間ごとに変わるのは共有メモリの記述子だけ
+            results = [executor.submit(render_chart, type(self), self.time_this, self.forecast_time, self.fig_x, self.fig_y, os.path.dirname(self.path_grib2), chart, paths[chart], shared.descriptor, self.path_basemap) for chart in charts]
+            for result in results:
+                get_metrics().merge(result.result())
+        finally:
+            shared.close()
+
+    @staticmethod
+    def add_cyclic(values, period=0):  # 経度の端をつなぐ(経度はperiodを足す)
+        return np.concatenate([values, values[:, :1] + period], axis=1)
+
+    def draw_chart(self, chart, path):  # 仕様に従って天気図を作成
+        path_fig = self.path_fig(path)
         if(os.path.exists(path_fig)): return
-        # 300hPa高度、緯度、経度の取得
-        height, lat, lon = self.grib2_select_jp('gh', 300)
-        # ガウシアンフィルター
-        height = gaussian_filter(height, sigma=self.height_sigma)
-        # 300hPa風の取得
-        wind_u, _, _ = self.grib2_select_jp('u', 300) * units('m/s')
-        wind_v, _, _ = self.grib2_select_jp('v', 300) * units('m/s')
-        wind_speed = mpcalc.wind_speed(wind_u, wind_v).to('kt')
-        # 地図の描画
-        fig, ax = self.draw_map(self.mapcrs_jp, self.extent_jp)
-        # 等風速線を引く
-        wind_constant = ax.contourf(lon, lat, wind_speed, np.arange(0, 220, 20), extend='max', cmap='YlGnBu', transform=self.datacrs, alpha=0.9)
-        # カラーバーをつける
-        cbar = self.draw_jp_colorbar(wind_constant)
-        cbar.set_label('ISOTECH(kt)', fontsize=self.fontsize)
-        # 風ベクトルの表示
-        wind_arrow = (slice(None, None, 10), slice(None, None, 10))
-        ax.barbs(lon[wind_arrow], lat[wind_arrow], wind_u[wind_arrow].to('kt').m, wind_v[wind_arrow].to('kt').m, pivot='middle', color='black', alpha=0.5, transform=self.datacrs, length=10)
-        # 等高度線を引く
-        height_line = ax.contour(lon, lat, height, np.arange(5400, 12000, 120), colors='black', transform=self.datacrs)
-        plt.clabel(height_line, fmt='%d', fontsize=self.fontsize)
-        # タイトルをつける
-        self.draw_title(ax, '300hPa: HEIGHT(M), ISOTACH(kt), WIND ARROW(kt)', self.time_str2)
-        # 大きさの調整
-        plt.subplots_adjust(bottom=0.05, top=0.95, left=0, right=1.0)
+        metrics = get_metrics()
+        with metrics.stage('draw', chart=chart, ft=self.forecast_time):
+            fig = self.plot_chart(chart)
         # 保存
-        print(f'[{self.time_str2}] 300hPa高度/風(日本域)...{path_fig}'.format())
-        plt.savefig(path_fig)
+        print(f'[{self.time_str2}] {CHARTS[chart]["name"]}...{path_fig}')
+        with metrics.stage('encode', chart=chart, ft=self.forecast_time):
+            plt.savefig(path_fig)
         # 閉じる
         plt.close(fig=fig)
 
-    def jp_500_ht(self, path):  # 500hPa高度/気温(日本域)
-        path_fig = os.path.join(path, self.time_str1 + '.jpg')
-        if(os.path.exists(path_fig)): return
-        # 500hPa高度、緯度、経度の取得
-        height, lat, lon = self.grib2_select_jp('gh', 500)
-        height = gaussian_filter(height, sigma=self.height_sigma)
-        # 500hPa気温の取得
-        temp, _, _ = self.grib2_select_jp('t', 500)
-        temp = (temp * units.kelvin).to(units.celsius)
+    def plot_chart(self, chart):  # 仕様に従って天気図を描画(保存はしない)
+        spec = CHARTS[chart]
+        region = spec["region"]
+        # 緯度，経度の取得
+        _, lat, lon = self.select_field(*self.step_fields(chart_fields(chart))[0], region)
+        grid = (lat, lon)
+        # 等値線に使う格子(経度の端をつなぐ場合は1列増やす)
+        cyclic = spec.get("cyclic", False)
+        if cyclic:
+            lat_line, lon_line = self.add_cyclic(lat), self.add_cyclic(lon, 360)
+        else:
+            lat_line, lon_line = lat, lon
         # 地図の描画
-        fig, ax = self.draw_map(self.mapcrs_jp, self.extent_jp)
-        # 温度の塗りつぶし
-        temp_arange = np.arange(-48, 9, 3)
-        temp_constant = ax.contourf(lon, lat, temp, temp_arange, extend='both', cmap='jet', transform=self.datacrs, alpha=0.9)
-        # カラーバーをつける
-        cbar = self.draw_jp_colorbar(temp_constant)
-        cbar.set_label('TEMP($^\circ$C)', fontsize=self.fontsize)
-        # 等温線
-        temp_line = ax.contour(lon, lat, temp, temp_arange, colors='black', linestyles='dashed', alpha=0.5, transform=self.datacrs)
-        plt.clabel(temp_line, fontsize=self.fontsize, fmt='%d')
-        # 等高度線
-        height_line = ax.contour(lon, lat, height, np.arange(0, 8000, 60), colors='black', transform=self.datacrs)
-        plt.clabel(height_line, fmt='%d', fontsize=self.fontsize)
+        figsize = (self.fig_x, self.fig_x) if spec.get("square", False) else None
+        projection, extent = self.region_map(region)
+        fig, ax = self.draw_map(projection, extent, figsize)
+        # 格子点を地図の座標に変換(格子ごとに一度だけ)
+        x, y = project_grid(ax.projection, lon_line, lat_line)
+        for layer in spec["layers"]:
+            # 積算の期間がない予報時間(初期値の降水量など)は描かない
+            if not all(self.ref_available(ref) for ref in layer_refs(layer)):
+                continue
+            options = {key: value for key, value in layer.items() if key not in LAYER_KEYS}
+            if callable(options.get("cmap")):
+                options["cmap"] = options["cmap"]()
+            # 風ベクトルの表示
+            if layer["type"] == "barbs":
+                arrow = (slice(None, None, layer["step"]), slice(None, None, layer["step"]))
+                wind_u = self.evaluate(layer["u"], region, grid)[arrow]
+                wind_v = self.evaluate(layer["v"], region, grid)[arrow]
+                ax.barbs(lon[arrow], lat[arrow], to_kt(wind_u), to_kt(wind_v), pivot='middle', transform=self.datacrs, **options)
+                continue
+            # 等値線を引く
+            data = self.evaluate(layer["data"], region, grid)
+            if cyclic:
+                data = self.add_cyclic(data)
+            cs = getattr(ax, layer["type"])(x, y, data, layer["levels"], **options)
+            if "clabel" in layer:
+                plt.clabel(cs, **{"fontsize": self.fontsize, "fmt": '%d', **layer["clabel"]})
+            # カラーバーをつける
+            if "colorbar" in layer:
+                cbar = self.draw_jp_colorbar(cs, layer.get("colorbar_orientation", 'horizontal'))
+                cbar.set_label(layer["colorbar"], fontsize=self.fontsize)
         # タイトルをつける
-        self.draw_title(ax, '500hPa: HEIGHT(M), TEMP($^\circ$C)', self.time_str2)
+        self.draw_title(ax, spec["title"], self.time_str2)
         # 大きさの調整
-        plt.subplots_adjust(bottom=0.05, top=0.95, left=0, right=1.0)
-        # 保存
-        print(f'[{self.time_str2}] 500hPa高度/気温(日本域)...{path_fig}'.format())
-        plt.savefig(path_fig)
-        # 閉じる
-        plt.close(fig=fig)
+        plt.subplots_adjust(**spec.get("adjust", {"bottom": 0.05, "top": 0.95, "left": 0, "right": 1.0}))
+        # 背景(地図の大きさが決まってから)
+        self.draw_base(ax, extent)
+        return fig
+
+    def jp_300_hw(self, path):  # 300hPa高度/風(日本域)
+        self.draw_chart("jp_300_hw", path)
+
+    def jp_500_ht(self, path):  # 500hPa高度/気温(日本域)
+        self.draw_chart("jp_500_ht", path)
 
     def jp_500_hv(self, path):  # 500hPa高度/風/渦度(日本域)
-        path_fig = os.path.join(path, self.time_str1 + '.jpg')
-        if(os.path.exists(path_fig)): return
-        # 500hPa高度、緯度、経度の取得
-        height, lat, lon = self.grib2_select_jp('gh', 500)
-        height = gaussian_filter(height, sigma=self.height_sigma)
-        # 500hPa風の取得
-        wind_u, _, _ = self.grib2_select_jp('u', 500) * units('m/s')
-        wind_v, _, _ = self.grib2_select_jp('v', 500) * units('m/s')
-        # 渦度の計算
-        vort_x, vort_y = mpcalc.lat_lon_grid_deltas(lon, lat)
-        vort_abs = mpcalc.vorticity(wind_u, wind_v, vort_x, vort_y, dim_order='yx')
-        # 地図の描画
-        fig, ax = self.draw_map(self.mapcrs_jp, self.extent_jp)
-        # カラーマップを作成する
-        N = 140
-        M = 380
-        PuBu = np.flipud(cm.get_cmap('BuPu', N)(range(N)))
-        YlOrRd = cm.get_cmap('YlOrRd', M)(range(M))
-        PuBuYlOrRd = ListedColormap(np.vstack((PuBu, YlOrRd)))
-        # 等渦度線を引く
-        vort_constant = ax.contourf(lon, lat, vort_abs * 10**6, np.arange(-120, 390, 30), extend='both', cmap=PuBuYlOrRd, transform=self.datacrs, alpha=0.9)
-        # カラーバーをつける
-        cbar = self.draw_jp_colorbar(vort_constant)
-        cbar.set_label('VORT($10^{-6}/s$)', fontsize=self.fontsize)
-        # 風ベクトルの表示
-        wind_arrow = (slice(None, None, 10), slice(None, None, 10))
-        ax.barbs(lon[wind_arrow], lat[wind_arrow], wind_u[wind_arrow].to('kt').m, wind_v[wind_arrow].to('kt').m, pivot='middle', color='black', alpha=0.5, transform=self.datacrs, length=10)
-        # 等高度線を引く
-        height_line = ax.contour(lon, lat, height, np.arange(0, 8000, 60), colors='black', transform=self.datacrs)
-        plt.clabel(height_line, fmt='%d', fontsize=self.fontsize)
-        # タイトルをつける
-        self.draw_title(ax, '500hPa: HEIGHT(M), WIND ARROW(kt), VORT($10^{-6}/s$)', self.time_str2)
-        # 大きさの調整
-        plt.subplots_adjust(bottom=0.05, top=0.95, left=0, right=1.0)
-        # 保存
-        print(f'[{self.time_str2}] 500hPa高度/風/渦度(日本域)...{path_fig}'.format())
-        plt.savefig(path_fig)
-        # 閉じる
-        plt.close(fig=fig)
+        self.draw_chart("jp_500_hv", path)
 
     def jp_500_t_700_td(self, path):  # 500hPa気温/700hPa湿数(日本域)
-        path_fig = os.path.join(path, self.time_str1 + '.jpg')
-        if(os.path.exists(path_fig)): return
-        # 500hPa気温、緯度、経度の取得
-        temp, lat, lon = self.grib2_select_jp('t', 500)
-        temp = (temp * units.kelvin).to(units.celsius)
-        # 700hPa湿数の取得
-        temp_700, _, _ = self.grib2_select_jp('t', 700) * units.kelvin
-        rh, _, _ = self.grib2_select_jp('r', 700)
-        rh *= 0.01
-        dewp_700 = mpcalc.dewpoint_from_relative_humidity(temp_700, rh)
-        td = temp_700 - dewp_700
-        # 地図の描画
-        fig, ax = self.draw_map(self.mapcrs_jp, self.extent_jp)
-        # カラーマップを作成する
-        N = 256
-        M_PuBu = np.flipud(cm.get_cmap('BuPu', N)(range(N)))
-        PuBu = ListedColormap(M_PuBu)
-        # 等湿数線を引く
-        td_constant = ax.contourf(lon, lat, td, np.arange(0, 21, 3), extend='max', cmap=PuBu, transform=self.datacrs, alpha=0.9)
-        td_line = ax.contour(lon, lat, td, np.array([-100, 3]), colors='yellow', linestyles='solid', transform=self.datacrs)
-        # カラーバーをつける
-        cbar = self.draw_jp_colorbar(td_constant)
-        cbar.set_label('T-Td($^\circ$C)', fontsize=self.fontsize)
-        # 等温線を引く
-        temp_line = ax.contour(lon, lat, temp, np.arange(-60, 30, 3), colors='black', linestyles='solid', transform=self.datacrs)
-        plt.clabel(temp_line, fontsize=self.fontsize, fmt='%d')
-        # タイトルをつける
-        self.draw_title(ax, '500hPa: TEMP($^\circ$C)\n700hPa: T-Td($^\circ$C)', self.time_str2)
-        # 大きさの調整
-        plt.subplots_adjust(bottom=0.05, top=0.95, left=0, right=1.0)
-        # 保存
-        print(f'[{self.time_str2}] 500hPa気温/700hPa湿数(日本域)...{path_fig}'.format())
-        plt.savefig(path_fig)
-        # 閉じる
-        plt.close(fig=fig)
+        self.draw_chart("jp_500_t_700_td", path)
 
     def jp_850_ht(self, path):  # 850hPa高度/気温(日本域)
-        path_fig = os.path.join(path, self.time_str1 + '.jpg')
-        if(os.path.exists(path_fig)): return
-        # 850hPa高度、緯度、経度の取得
-        height, lat, lon = self.grib2_select_jp('gh', 850)
-        height = gaussian_filter(height, sigma=self.height_sigma)
-        # 850hPa気温の取得
-        temp, _, _ = self.grib2_select_jp('t', 850)
-        temp = (temp * units.kelvin).to(units.celsius)
-        # 地図の描画
-        fig, ax = self.draw_map(self.mapcrs_jp, self.extent_jp)
-        # 等温線を引く
-        temp_arange = np.arange(-24, 33, 3)
-        temp_constant = ax.contourf(lon, lat, temp, temp_arange, extend='both', cmap='jet', transform=self.datacrs, alpha=0.9)
-        temp_line = ax.contour(lon, lat, temp, temp_arange, colors='black', linestyles='dashed', alpha=0.5, transform=self.datacrs)
-        plt.clabel(temp_line, fontsize=self.fontsize, fmt='%d')
-        # カラーバーをつける
-        cbar = self.draw_jp_colorbar(temp_constant)
-        cbar.set_label('TEMP($^\circ$C)', fontsize=self.fontsize)
-        # 等高度線を引く
-        height_line = ax.contour(lon, lat, height, np.arange(0, 8000, 60), colors='black', transform=self.datacrs)
-        plt.clabel(height_line, fmt='%d', fontsize=self.fontsize)
-        # タイトルをつける
-        self.draw_title(ax, '850hPa: HEIGHT(M), TEMP($^\circ$C)', self.time_str2)
-        # 大きさの調整
-        plt.subplots_adjust(bottom=0.05, top=0.95, left=0, right=1.0)
-        # 保存
-        print(f'[{self.time_str2}] 850hPa高度/気温(日本域)...{path_fig}'.format())
-        plt.savefig(path_fig)
-        # 閉じる
-        plt.close(fig=fig)
+        self.draw_chart("jp_850_ht", path)
 
     def jp_850_tw_700_vv(self, path):  # 850hPa気温/風，700hPa上昇流(日本域)
-        path_fig = os.path.join(path, self.time_str1 + '.jpg')
-        if(os.path.exists(path_fig)): return
-        # 850hPa気温、緯度、経度の取得
-        temp, lat, lon = self.grib2_select_jp('t', 850)
-        temp = (gaussian_filter(temp, sigma=1.0) * units.kelvin).to(units.celsius)
-        # 700hPa上昇流の取得
-        vv, _, _ = self.grib2_select_jp('w', 700)
-        vv = (vv * units.Pa / units.second).to(units.hPa / units.hour)
-        # 850hPa風の取得
-        wind_u, _, _ = self.grib2_select_jp('u', 850) * units('m/s')
-        wind_v, _, _ = self.grib2_select_jp('v', 850) * units('m/s')
-        # 地図の描画
-        fig, ax = self.draw_map(self.mapcrs_jp, self.extent_jp)
-        # カラーマップを作成する
-        N = 125
-        M = 65
-        RdOrYl = np.flipud(cm.get_cmap('YlOrRd', N)(range(N)))
-        BuPu = cm.get_cmap('BuPu', M)(range(M))
-        RdOrYlBuPu = ListedColormap(np.vstack((RdOrYl, BuPu)))
-        # 等上昇流線を引く
-        vv_constant = ax.contourf(lon, lat, vv, np.arange(-120, 70, 10), extend='both', cmap=RdOrYlBuPu, transform=self.datacrs, alpha=0.9)
-        # カラーバーをつける
-        cbar = self.draw_jp_colorbar(vv_constant)
-        cbar.set_label('VERTICAL VELOCITY(hPa/h)', fontsize=self.fontsize)
-        # 風ベクトルの表示
-        wind_arrow = (slice(None, None, 10), slice(None, None, 10))
-        ax.barbs(lon[wind_arrow], lat[wind_arrow], wind_u[wind_arrow].to('kt').m, wind_v[wind_arrow].to('kt').m, pivot='middle', color='black', alpha=0.5, transform=self.datacrs, length=10)
-        # 等温線を引く
-        temp_line = ax.contour(lon, lat, temp, np.arange(-60, 60, 3), colors='black', transform=self.datacrs)
-        plt.clabel(temp_line, fontsize=self.fontsize, fmt='%d')
-        # タイトルをつける
-        self.draw_title(ax, '850hPa: HEIGHT(M), WIND ARROW(kt)\n700hPa: VERTICAL VELOCITY(hPa/h)', self.time_str2)
-        # 大きさの調整
-        plt.subplots_adjust(bottom=0.05, top=0.95, left=0, right=1.0)
-        # 保存
-        print(f'[{self.time_str2}] 850hPa気温/風，700hPa上昇流(日本域)...{path_fig}'.format())
-        plt.savefig(path_fig)
-        # 閉じる
-        plt.close(fig=fig)
+        self.draw_chart("jp_850_tw_700_vv", path)
 
     def jp_850_eptw(self, path):  # 850hPa相当温位/風(日本域)
-
-        path_fig = os.path.join(path, self.time_str1 + '.jpg')
-        if(os.path.exists(path_fig)): return
-        # 850hPa気温の取得
-        temp, lat, lon = self.grib2_select_jp('t', 850)
-        temp = temp * units.kelvin
-        # 850hPa風の取得
-        wind_u, _, _ = self.grib2_select_jp('u', 850) * units('m/s')
-        wind_v, _, _ = self.grib2_select_jp('v', 850) * units('m/s')
-        # 850hPa相対湿度の取得
-        rh, _, _ = self.grib2_select_jp('r', 850)
-        rh *= 0.01
-        # 露点温度の計算
-        dewp = mpcalc.dewpoint_from_relative_humidity(temp, rh)
-        # 相当温位の計算
-        ept = mpcalc.equivalent_potential_temperature(850 * units.hPa, temp, dewp)
-        ept = gaussian_filter(ept, sigma=1.0)
-        # 地図の描画
-        fig, ax = self.draw_map(self.mapcrs_jp, self.extent_jp)
-        # 等温線を引く
-        ept_arange = np.arange(255, 372, 3)
-        ept_constant = ax.contourf(lon, lat, ept, ept_arange, extend='both', cmap='jet', transform=self.datacrs, alpha=0.9)
-        ept_line = ax.contour(lon, lat, ept, ept_arange, colors='black', linestyles='solid', linewidths=1, transform=self.datacrs)
-        plt.clabel(ept_line, levels=np.arange(258, 372, 6), fmt='%d', fontsize=self.fontsize)
-        # カラーバーをつける
-        cbar = self.draw_jp_colorbar(ept_constant)
-        cbar.set_label('E.P.TEMP(K)', fontsize=self.fontsize)
-        # 風ベクトルの表示
-        wind_arrow = (slice(None, None, 5), slice(None, None, 5))
-        ax.barbs(lon[wind_arrow], lat[wind_arrow], wind_u[wind_arrow].to('kt').m,
-                 wind_v[wind_arrow].to('kt').m, pivot='middle', length=8, color='black', alpha=0.5, transform=self.datacrs)
-        # タイトルをつける
-        self.draw_title(ax, '850hPa: E.P.TEMP(K), WIND ARROW(kt)', self.time_str2)
-        # 大きさの調整
-        plt.subplots_adjust(bottom=0.05, top=0.95, left=0, right=1.0)
-        # 保存
-        print(f'[{self.time_str2}] 850hPa相当温位/風(日本域)...{path_fig}'.format())
-        plt.savefig(path_fig)
-        # 閉じる
-        plt.close(fig=fig)
+        self.draw_chart("jp_850_eptw", path)
 
     def jp_surf_pwt(self, path):  # 地上気圧/風/気温（日本域）
-        path_fig = os.path.join(path, self.time_str1 + '.jpg')
-        if(os.path.exists(path_fig)): return
-        # 地上気圧，緯度，経度の取得
-        pressure, lat, lon = self.grib2_select_jp("prmsl", 0)
-        pressure *= units('Pa')
-        pressure /= 100
-        # ガウシアンフィルター
-        pressure = gaussian_filter(pressure, sigma=2.0)
-        # 地上気温の取得
-        temp, _, _ = self.grib2_select_jp("t", 1000)
-        temp = (temp * units.kelvin).to(units.celsius)
-        # 地上風の取得
-        wind_u, _, _ = self.grib2_select_jp('10u', 10) * units('m/s')
-        wind_v, _, _ = self.grib2_select_jp('10v', 10) * units('m/s')
-        # 地図の描画
-        fig, ax = self.draw_map(self.mapcrs_jp, self.extent_jp)
-        # 等温線を引く
-        temp_arange = np.arange(-15, 42, 3)
-        temp_constant = ax.contourf(lon, lat, temp, temp_arange, extend="both", cmap="jet", transform=self.datacrs, alpha=0.9)
-        temp_line = ax.contour(lon, lat, temp, temp_arange, colors='black', linestyles='dashed', alpha=0.5, transform=self.datacrs)
-        plt.clabel(temp_line, fontsize=20, fmt="%d")
-        # カラーバーをつける
-        cbar = self.draw_jp_colorbar(temp_constant)
-        cbar.set_label('TEMP($^\circ$C)', fontsize=self.fontsize)
-        # 風ベクトルの表示
-        wind_arrow = (slice(None, None, 5), slice(None, None, 5))
-        ax.barbs(lon[wind_arrow], lat[wind_arrow], wind_u[wind_arrow].to('kt').m, wind_v[wind_arrow].to('kt').m, pivot='middle', color='black', alpha=0.5, transform=self.datacrs, length=8)
-        # 等圧線を引く
-        cs = ax.contour(lon, lat, pressure, np.arange(900, 1600, 4), colors="black", transform=self.datacrs)
-        plt.clabel(cs, fontsize=self.fontsize, fmt="%d")
-        # タイトルをつける
-        self.draw_title(ax, 'SUFRACE: PRESSURE(hPa), TEMP($^\circ$C), WIND ARROW(kt)', self.time_str2)
-        # 大きさの調整
-        plt.subplots_adjust(bottom=0.05, top=0.95, left=0, right=1.0)
-        # 保存
-        print(f'[{self.time_str2}] 地上気圧/風/気温（日本域)...{path_fig}'.format())
-        plt.savefig(path_fig)
-        # 閉じる
-        plt.close(fig=fig)
+        self.draw_chart("jp_surf_pwt", path)
 
     def np_500_ht(self, path):  # 500hPa高度/気温(北極中心)
-        path_fig = os.path.join(path, self.time_str1 + '.jpg')
-        if(os.path.exists(path_fig)): return
-        # 500hPa高度、緯度、経度の取得
-        height, lat, lon = self.grib2_select_np('gh', 500)
-        height = gaussian_filter(height, sigma=self.height_sigma)
-        # 500hPa気温の取得
-        temp, _, _ = self.grib2_select_np('t', 500)
-        temp = (temp * units.kelvin).to(units.celsius)
-        # Cyclic
-        height_cyclic = np.empty((height.shape[0], height.shape[1] + 1))
-        temp_cyclic = np.empty((temp.shape[0], temp.shape[1] + 1))
-        lon_cyclic = np.empty((temp.shape[0], temp.shape[1] + 1))
-        lat_cyclic = np.empty((temp.shape[0], temp.shape[1] + 1))
-        for i in range(temp_cyclic.shape[0]):
-            height_cyclic[i, :], lon_cyclic[i, :] = cutil.add_cyclic_point(height[i, :], coord=lon[i, :])
-            temp_cyclic[i, :], lat_cyclic[i, :] = cutil.add_cyclic_point(temp[i, :], coord=lat[i, :])
-        # 地図の描画
-        old = self.fig_y
-        self.fig_y = self.fig_x
-        fig, ax = self.draw_map(self.mapcrs_np, self.extent_np)
-        self.fig_y = old
-        # 温度の塗りつぶし
-        temp_arange = np.arange(-48, 9, 3)
-        temp_constant = ax.contourf(lon_cyclic, lat_cyclic, temp_cyclic, temp_arange, extend='both', cmap='jet', transform=self.datacrs, alpha=0.9)
-        # カラーバーをつける
-        cbar = self.draw_jp_colorbar(temp_constant)
-        cbar.set_label('TEMP($^\circ$C)', fontsize=self.fontsize)
-        # 等温線
-        temp_line = ax.contour(lon_cyclic, lat_cyclic, temp_cyclic, temp_arange, colors='black', linestyles='dashed', alpha=0.5, transform=self.datacrs)
-        plt.clabel(temp_line, levels=np.arange(-48, 9, 6), fontsize=self.fontsize, fmt='%d')
-        # 等高度線
-        height_line = ax.contour(lon_cyclic, lat_cyclic, height_cyclic, np.arange(0, 8000, 60), colors='black', transform=self.datacrs)
-        plt.clabel(height_line, levels=np.arange(0, 8000, 120), fontsize=self.fontsize, fmt='%d')
-        # タイトルをつける
-        self.draw_title(ax, '500hPa: HEIGHT(M), TEMP($^\circ$C)', self.time_str2)
-        # 大きさの調整
-        plt.subplots_adjust(bottom=0.02, top=0.95, left=0.05, right=0.95)
-        # 保存
-        print(f'[{self.time_str2}] 500hPa高度/気温(北極中心)...{path_fig}'.format())
-        plt.savefig(path_fig)
-        # 閉じる
-        plt.close(fig=fig)
+        self.draw_chart("np_500_ht", path)
 
     def test(self):  # テスト用
         [print(self.grib2.message(i)) for i in range(1, 110)]
         print(self.grib2.select(forecastTime=0)[10].data())
         pressure, lat, lon = self.grib2_select_jp("prmsl", 0)
+
+
+def render_context():  # 天気図作成用の子プロセスの作り方
+    # forkではなくforkserverで子プロセスを作る(スレッドやロックの状態を複製しないように)
+    context = multiprocessing.get_context("forkserver")
+    # forkserverで先に読み込んでおく(子プロセスごとにcartopy, matplotlib, pygribを読み込まないように)
+    context.set_forkserver_preload(['__main__', f'{__package__}.download_gsmclass', f'{__package__}.download_msmclass'])
+    return context
+
+
+def init_render_worker(metrics, job):  # 子プロセスの計測(段階はJSON Linesに出力し，累積した値は親プロセスに返す)
+    init_metrics(metrics, job)
+
+
+def render_chart(cls, time_this, forecast_time, fig_x, fig_y, path_tmp, chart, path, descriptor, basemap=None):  # 子プロセスで天気図を作成
+    shm, arrays = attach_fields(descriptor)
+    try:
+        t = cls(time_this, fig_x, fig_y, path_tmp, basemap=basemap)
+        t.set_forecast_time(forecast_time)
+        for key in arrays:
+            if key[0] == 'derived':
+                t.fields.put(key, (arrays[key],))
+            elif key[0] not in ('lat', 'lon'):
+                t.fields.put(key, (arrays[key], arrays[('lat', key[3])], arrays[('lon', key[3])]))
+        t.draw_chart(chart, path)
+        del t
+        arrays.clear()
+    finally:
+        try:
+            shm.close()
+        # 配列がまだ参照されている場合はプロセスの終了時に解放される
+        except BufferError:
+            pass
+    # 子プロセスではatexitが呼ばれないので，累積した値は天気図ごとに親プロセスに返す
+    return get_metrics().take()
@@ -1,5 +1,7 @@
 from .download_msmclass import *
 from .download_gsm import update_settings
+from .backfill import run_backfill
+from .metrics import init_metrics
 if __name__ == "__main__":
     print("please execute main.py")
     sys.exit()
@@ -9,36 +11,44 @@ def download_msm():
     print("#####MSM Downloader#####")
     # SIGINTシグナルを受け取る
     signal.signal(signal.SIGINT, handler_sigint)
+    # ダウンロードと天気図作成
+    try:
+        update_msm()
+    except Exception as e:
+        exit_program(e, sys.exc_info())
+    # 完了
+    exit_program("完了しました")
+
+
+def update_msm(metrics=True):  # 前回の続きから前日までのサイクルを処理(失敗したら例外を送出)
     # 設定ファイルの読み込み
     with open("settings_msm.json") as fp:
         settings = json.load(fp)
+    # 計測(常駐するときは共有のものを使う)
+    if metrics:
+        init_metrics(settings.get("metrics"), "msm")
     # ディレクトリが存在しなければ作成
     try:
         for dirs in settings["path"].values():
             os.makedirs(dirs, exist_ok=True)
     except FileNotFoundError:
-        exit_program(f'{settings["path"]}は存在しないパスです.')
+        raise FileNotFoundError(f'{settings["path"]}は存在しないパスです.')
     # ダウンロード開始時刻の設定
-    try:
-        time_start = datetime.datetime(settings["time_start"]["year"], settings["time_start"]["month"], settings["time_start"]["day"], 0, 0)
-    except Exception as e:
-        exit_program(e, sys.exc_info())
+    time_start = datetime.datetime(settings["time_start"]["year"], settings["time_start"]["month"], settings["time_start"]["day"], 0, 0)
     print(f'ダウンロード開始日時(UTC): {time_start}')
     # ダウンロード終了時刻は一日前
     time_end = datetime.date.today() - datetime.timedelta(days=1)
     # ダウンロードと天気図作成
-    while time_start.date() < time_end:
-        try:
-            t = DownloadMSM(time_start, settings["fig_x"], settings["fig_y"], settings["path"]["tmp"])
-            t.download_grib2()
-            t.jp_surf_ppc(settings["path"]["jp_surf_ppc"])
-        except Exception as e:
-            exit_program(e, sys.exc_info())
-        time_start += datetime.timedelta(hours=3)
+    time_start = run_backfill(download_msm_cycle, settings, "settings_msm.json", time_start, time_end, datetime.timedelta(hours=3), settings.get("workers", 1))
     # grib2ファイルの削除
     if(settings["delete_tmp"]):
         shutil.rmtree(settings["path"]["tmp"])
     # 設定の更新
     update_settings(settings, time_start, "settings_msm.json")
-    # 完了
-    exit_program("完了しました")
+
+
+def download_msm_cycle(time_this, settings):  # 1サイクル分のダウンロードと天気図作成
+    t = DownloadMSM(time_this, settings["fig_x"], settings["fig_y"], settings["path"]["tmp"], settings.get("partial_grib2", False), settings.get("field_cache_mb"), settings.get("forecast_times"), settings.get("charts"), settings["path"].get("archive"), settings.get("timelapse"), settings["path"].get("basemap"))
+    t.download_grib2()
+    t.extract()
+    t.render(settings["path"], settings.get("render_workers", 1))
@@ -8,15 +8,28 @@ if __name__ == "__main__":
     sys.exit()
 
 from .download_satclass import *
+from .radar_composite import RadarCompositor
 
 
 class DownloadRadar(DownloadSatellite):
-    def __init__(self):
-        # 一時ファイルの名前
-        self.tmp_name = "tmp_rad.png"
+    # 時刻リスト
+    uri_time_list = "https://www.jma.go.jp/bosai/jmatile/data/nowc/targetTimes_N1.json"
+    # 時刻リストにのっていない古いデータをさかのぼる日数
+    days_back = 4
+
+    def __init__(self, metrics=True):
         # 設定ファイルの読み込み
         with open("settings_rad.json") as fp:
             self.settings = json.load(fp)
+        # 計測(常駐するときは共有のものを使う)
+        if metrics:
+            init_metrics(self.settings.get("metrics"), "rad")
+        # タイル取得エンジン
+        self.init_fetcher()
+        # 作成状況の記録
+        self.init_manifest()
+        # 動画
+        self.timelapses = get_timelapses(self.settings.get("timelapse"), self.settings["path"])
         # ファイルの保存場所に移動
         try:
             # ディレクトリが存在しなければ作成
@@ -28,62 +41,57 @@ class DownloadRadar(DownloadSatellite):
         self.image_map = self.draw_base(6, 53, 22, 58, 27, self.settings["path_map"]["jp"])
         # 凡例が存在しなければ取得して，追加
         self.draw_legend()
+        # 合成の準備(背景は地図と凡例で固定)
+        self.compositor = RadarCompositor(self.image_map)
         # 時刻リストを取得(日本域)
-        self.jp_time_list = super().get_time_list("https://www.jma.go.jp/bosai/jmatile/data/nowc/targetTimes_N1.json", "レーダー画像")
+        self.refresh()
+
+    def refresh(self):  # 時刻リストを取得し直して，対象の期間を更新
+        self.jp_time_list = super().get_time_list(self.uri_time_list, "レーダー画像")
         # # 時刻表にのっていない時間
         self.time_end = datetime.datetime.strptime(self.jp_time_list[-1]["basetime"], "%Y%m%d%H%M%S")
-        self.time_begin = self.time_end - datetime.timedelta(days=4)
+        self.time_begin = self.time_end - datetime.timedelta(days=self.days_back)
 
     def get_time_list(self, uri, text):
         return super().get_time_list(uri, text)
 
     def download_jp_radar(self):  # ダウンロード(レーダー画像,日本域)
+        contents = []
         for time_this in self.jp_time_list:
             # 保存先
-            path = os.path.join(self.settings["path"]["jp_radar"], f'{time_this["basetime"]}.jpg')
-            self.draw_content(time_this["basetime"], time_this["validtime"], 6, 53, 22, 58, 27, path, check=False)
+            path = self.frame_path("jp_radar", time_this["basetime"])
+            contents.append(((time_this["basetime"], time_this["validtime"], 6, 53, 22, 58, 27, path), dict(check=False)))
         # 時刻リストにのっていない古いデータをダウンロード
         time_this = self.time_begin
         while time_this < self.time_end:
             # 保存先
             basetime = time_this.strftime("%Y%m%d%H%M%S")
-            path = os.path.join(self.settings["path"]["jp_radar"], f'{basetime}.jpg')
+            path = self.frame_path("jp_radar", basetime)
             # 画像作成
-            self.draw_content(basetime, basetime, 6, 53, 22, 58, 27, path)
+            contents.append(((basetime, basetime, 6, 53, 22, 58, 27, path), dict()))
             time_this += datetime.timedelta(minutes=5)
+        self.draw_contents("jp_radar", contents)
 
-    def draw_content(self, basetime, validtime, z, x0, y0, x1, y1, path, check=True):  # 画像作成
+    def uri_content(self, basetime, validtime, z, x0, y0, x1, y1):  # タイルのURIの2次元リスト
+        return [[f'https://www.jma.go.jp/bosai/jmatile/data/nowc/{basetime}/none/{validtime}/surf/hrpns/{str(z)}/{str(x)}/{str(y)}.png' for x in range(x0, x1 + 1)] for y in range(y0, y1 + 1)]
+
+    def draw_content(self, basetime, validtime, z, x0, y0, x1, y1, path, check=True, tiles=None):  # 画像作成(状態を返す)
         # ファイルが存在するなら何もしない
         if not os.path.exists(path):
-            image_list = np.empty((y1 - y0 + 1, x1 - x0 + 1), dtype=np.ndarray)
             # ダウンロード
-            for y in range(y0, y1 + 1):
-                for x in range(x0, x1 + 1):
-                    uri = f'https://www.jma.go.jp/bosai/jmatile/data/nowc/{basetime}/none/{validtime}/surf/hrpns/{str(z)}/{str(x)}/{str(y)}.png'
-                    # 時刻リストにないファイルだけチェックする
-                    if check and not file_is_on_server(uri):
-                        print(f'[{basetime}] サーバにないファイルです')
-                        return
-                    image_list[y - y0][x - x0] = cv2.imread(super().download(uri, self.tmp_name), -1)
-            # 結合
-            try:
-                image = cv2.vconcat([cv2.hconcat(image_h) for image_h in image_list])
-            except cv2.error:
+            if tiles is None:
+                tiles = self.fetch_content(self.uri_content(basetime, validtime, z, x0, y0, x1, y1), basetime, check)
+                if tiles is None: return FrameManifest.UNKNOWN
+            if not tiles: return FrameManifest.MISSING
+            metrics = get_metrics()
+            with metrics.stage('decode', product='jp_radar'):
+                image_list = [[self.decode_tile(data, cv2.IMREAD_UNCHANGED) for data in tiles_h] for tiles_h in tiles]
+            # 結合して背景と合成
+            with metrics.stage('compose', product='jp_radar'):
+                dst = self.compositor.composite(image_list)
+            if dst is None:
                 print(f'[{basetime}] 作成できませんでした')
-                return
-            ###################################################################
-            # マッピング
-            ###################################################################
-            # rgb成分を取り出す
-            rgb = image[:, :, :3]
-            rgb[np.where((rgb == [0, 0, 0]).all(axis=2))] = [255, 255, 255]
-            # α成分を取り出す
-            a = image[:, :, 3]
-            # マスク画像を作成
-            mask = cv2.merge((a, a, a))
-            # マスク画像と合成
-            dst = cv2.bitwise_or(self.image_map, mask)
-            dst = cv2.bitwise_and(dst, rgb)
+                return FrameManifest.FAILED
 
             # 文字書き込み
             date_utc = datetime.datetime.strptime(basetime, "%Y%m%d%H%M%S")
@@ -91,17 +99,20 @@ class DownloadRadar(DownloadSatellite):
             date_str = f'{date_jst.strftime("%Y.%m.%d %H:%M")}JST ({date_utc.strftime("%Y.%m.%d %H:%M")}UTC)'
             cv2.putText(dst, date_str, (10, 1520), cv2.FONT_HERSHEY_SIMPLEX, 1.5, (255, 255, 255), 4)
             # 画像を保存
-            cv2.imwrite(path, dst)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with metrics.stage('encode', product='jp_radar'):
+                written = cv2.imwrite(path, dst)
+            if not written:
+                return FrameManifest.FAILED
             print(f'[{date_str}] {path}')
+        return FrameManifest.DONE
 
     def draw_base(self, z, x0, y0, x1, y1, path):  # 地図描画
         # ファイルが存在するなら何もしない
         if not os.path.exists(path):
-            image_list = np.empty((y1 - y0 + 1, x1 - x0 + 1), dtype=np.ndarray)
             # ダウンロード
-            for y in range(y0, y1 + 1):
-                for x in range(x0, x1 + 1):
-                    image_list[y - y0][x - x0] = cv2.imread(super().download(f'https://cyberjapandata.gsi.go.jp/xyz/gmld_ptc2/{str(z)}/{str(x)}/{str(y)}.png', self.tmp_name))
+            tiles = self.fetcher.get_grid(self.uri_base(z, x0, y0, x1, y1))
+            image_list = [[self.decode_tile(data) for data in tiles_h] for tiles_h in tiles]
             # 結合
             try:
                 image = cv2.vconcat([cv2.hconcat(image_h) for image_h in image_list])
@@ -144,6 +155,5 @@ class DownloadRadar(DownloadSatellite):
         image_new = cv2.bitwise_and(image_new, rgb)
         self.image_map[rect[0, 1]:rect[2, 1], rect[0, 0]:rect[2, 0]] = image_new
 
-    @classmethod
-    def download(cls, uri, path):
+    def download(self, uri, path):
         return super().download(uri, path)
@@ -13,11 +13,7 @@ def download_sat():
         # クラス
         t = DownloadSatellite()
         # ダウンロード
-        t.download_jp_infrared()
-        t.download_jp_visible()
-        t.download_jp_watervapor()
-        t.download_jp_truecolor()
-        t.download_jp_cloudheight()
+        t.download_jp()
     except Exception as e:
         exit_program(e, sys.exc_info())
     exit_program("完了しました")
@@ -10,6 +10,9 @@ import requests
 import numpy as np
 import signal
 import datetime
+import hashlib
+import collections
+from concurrent import futures
 import cv2
 
 from urllib3 import request
@@ -20,15 +23,44 @@ if __name__ == "__main__":
 
 from .exit_program import *
 from .file_is_on_server import *
+from .tile_fetcher import get_fetcher
+from .frame_manifest import FrameManifest
+from .timelapse import get_timelapses
+from .metrics import init_metrics, get_metrics
 
 
 class DownloadSatellite:
-    def __init__(self):
-        # 一時ファイルの名前
-        self.tmp_name = "tmp_sat.jpg"
+    # 先読みする画像の数
+    prefetch = 4
+    # 日本域のタイルの範囲 (z, x0, y0, x1, y1)
+    tiles_jp = (5, 25, 10, 30, 14)
+    # 画像の種類 名前 -> (band, prod, alpha, beta)
+    products = {
+        "jp_infrared": ("B13", "TBB", 0.95, 0.05),
+        "jp_visible": ("B03", "ALBD", 0.95, 0.05),
+        "jp_watervapor": ("B08", "TBB", 0.95, 0.05),
+        "jp_truecolor": ("REP", "ETC", 1, 0),
+        "jp_cloudheight": ("SND", "ETC", 0.95, 0.05),
+    }
+
+    # 時刻リスト
+    uri_time_list = "https://www.jma.go.jp/bosai/himawari/data/satimg/targetTimes_fd.json"
+    # 時刻リストにのっていない古いデータをさかのぼる日数
+    days_back = 7
+
+    def __init__(self, metrics=True):
         # 設定ファイルの読み込み
         with open("settings_sat.json") as fp:
             self.settings = json.load(fp)
+        # 計測(常駐するときは共有のものを使う)
+        if metrics:
+            init_metrics(self.settings.get("metrics"), "sat")
+        # タイル取得エンジン
+        self.init_fetcher()
+        # 作成状況の記録
+        self.init_manifest()
+        # 動画
+        self.timelapses = get_timelapses(self.settings.get("timelapse"), self.settings["path"])
         # ファイルの保存場所に移動
         try:
             # ディレクトリが存在しなければ作成
@@ -37,12 +69,48 @@ class DownloadSatellite:
         except Exception as e:
             exit_program(e, sys.exc_info())
         # 地図が存在しなければ作成して，開く
-        self.image_map = self.draw_base(5, 25, 10, 30, 14, self.settings["path_map"]["j"])
+        self.image_map = self.draw_base(*self.tiles_jp, self.settings["path_map"]["j"])
         # 時刻リストを取得(日本域)
-        self.jp_time_list = self.get_time_list("https://www.jma.go.jp/bosai/himawari/data/satimg/targetTimes_fd.json", "気象衛星画像")
+        self.refresh()
+
+    def refresh(self):  # 時刻リストを取得し直して，対象の期間を更新(常駐するときは実行のたびに呼ぶ)
+        self.jp_time_list = self.get_time_list(self.uri_time_list, "気象衛星画像")
         # 時刻表にのっていない時間
         self.time_end = datetime.datetime.strptime(self.jp_time_list[0]["basetime"], "%Y%m%d%H%M%S")
-        self.time_begin = self.time_end - datetime.timedelta(days=7)
+        self.time_begin = self.time_end - datetime.timedelta(days=self.days_back)
+
+    def init_fetcher(self):  # タイル取得エンジンの準備
+        self.fetcher = get_fetcher(self.settings.get("tile_workers"), self.settings.get("tile_cache"))
+        # サーバにあるかの確認(接続を共有する)
+        self.checker = get_checker(self.settings.get("path_negative"), self.fetcher.session)
+        self.prefetch = self.settings.get("prefetch", self.prefetch)
+        # 画像単位で先読みするためのスレッドプール
+        self.content_executor = futures.ThreadPoolExecutor(max_workers=self.prefetch)
+
+    def init_manifest(self):  # 作成状況の記録の準備(設定がなければファイルの有無で判断)
+        path = self.settings.get("path_manifest")
+        self.manifest = FrameManifest(path) if path else None
+
+    def frame_path(self, product, basetime):  # 保存先(設定により日付ごとのディレクトリに分ける)
+        path = self.settings["path"][product]
+        if self.settings.get("shard_output"):
+            path = os.path.join(path, basetime[:8])
+        return os.path.join(path, f'{basetime}.jpg')
+
+    def remaining(self, product, basetimes):  # まだ作成していない時刻
+        if self.manifest is None:
+            return [basetime for basetime in basetimes if not os.path.exists(self.frame_path(product, basetime))]
+        return self.manifest.remaining(product, basetimes, lambda basetime: os.path.exists(self.frame_path(product, basetime)))
+
+    def record(self, product, basetime, status):  # 作成結果を記録(作成できた画像は動画に追加)
+        if self.manifest is not None and status is not None:
+            self.manifest.record(product, basetime, status)
+        if status == FrameManifest.DONE and product in self.timelapses:
+            self.timelapses[product].add(basetime, self.frame_path(product, basetime))
+
+    def flush_timelapses(self):  # 追加した画像を動画にする
+        for timelapse in self.timelapses.values():
+            timelapse.flush()
 
     def get_time_list(self, uri, text):  # 時刻リストを取得
         while True:
@@ -56,74 +124,188 @@ class DownloadSatellite:
                 print(f'[時刻リストを取得({text})]')
                 return time_list
 
-    def download_jp_common(self, band, prod, z, x0, y0, x1, y1, path_dir, alpha=0.95, beta=0.05):  # ダウンロード(共通，日本域)
+    def plan_times(self):  # 作成する時刻の一覧(新しい順) (basetime, validtime, 確認が必要か)
+        times = {}
         for time_this in self.jp_time_list:
-            # 保存先
-            path = os.path.join(path_dir, f'{time_this["basetime"]}.jpg')
-            self.draw_content(time_this["basetime"], time_this["validtime"], band, prod, z, x0, y0, x1, y1, path, check=False, alpha=alpha, beta=beta)
-        # 時刻リストにのっていない古いデータをダウンロード
+            times[time_this["basetime"]] = (time_this["basetime"], time_this["validtime"], False)
+        # 時刻リストにのっていない古いデータ
         time_this = self.time_begin
         while time_this < self.time_end:
             if time_this.hour % 12 != 2 and time_this.minute != 50:
-                # 保存先
                 basetime = time_this.strftime("%Y%m%d%H%M%S")
-                path = os.path.join(path_dir, f'{basetime}.jpg')
-                self.draw_content(basetime, basetime, band, prod, z, x0, y0, x1, y1, path, alpha=alpha, beta=beta)
+                times.setdefault(basetime, (basetime, basetime, True))
             time_this += datetime.timedelta(minutes=10)
+        return sorted(times.values(), reverse=True)
+
+    def plan(self, products):  # 時刻ごとのまだ作成していない画像 [((basetime, validtime, check), [(名前, 保存先)])]
+        times = self.plan_times()
+        # 画像の種類ごとに一度に調べる
+        remaining = {name: set(self.remaining(name, [basetime for basetime, _, _ in times])) for name in products}
+        plan = []
+        for basetime, validtime, check in times:
+            items = [(name, self.frame_path(name, basetime)) for name in products if basetime in remaining[name]]
+            if items:
+                plan.append(((basetime, validtime, check), items))
+        return plan
+
+    def download_jp(self, products=None):  # ダウンロード(全ての画像をまとめて，新しい時刻から，日本域)
+        if products is None:
+            products = [name for name in self.products if name in self.settings["path"]]
+        pending = collections.deque()
+        for (basetime, validtime, check), items in self.plan(products):
+            # 1時刻分のタイルのダウンロードを先に始めておく
+            future = self.content_executor.submit(self.fetch_time, basetime, validtime, check, items)
+            pending.append((basetime, validtime, items, future))
+            get_metrics().gauge('pending_frames', len(pending), product='sat')
+            # 先読みの数を超えたら古いものから作成
+            if len(pending) > self.prefetch:
+                self.draw_time(*pending.popleft())
+        while pending:
+            self.draw_time(*pending.popleft())
+        self.flush_timelapses()
+
+    def fetch_time(self, basetime, validtime, check, items):  # 1時刻分の全ての画像のタイルをまとめてダウンロード
+        uri_grids = [self.uri_content(basetime, validtime, *self.products[name][:2], *self.tiles_jp) for name, _ in items]
+        # 時刻リストにない時刻は画像ごとに代表の1枚だけ確認する(ない画像は空のリスト，確認できなければNone)
+        found = [True if not check else self.checker.check(uri_grid[0][0]) for uri_grid in uri_grids]
+        for (name, _), exists in zip(items, found):
+            if exists is False:
+                print(f'[{basetime}] サーバにないファイルです({name})')
+            elif exists is None:
+                print(f'[{basetime}] 確認できませんでした({name})')
+        # 全ての画像のタイルを同時に投入する
+        future_grids = [[[self.fetcher.submit(uri) for uri in uri_h] for uri_h in uri_grid] if exists else None for uri_grid, exists in zip(uri_grids, found)]
+        results = []
+        for exists, future_grid in zip(found, future_grids):
+            if exists is None:
+                results.append(None)
+            elif not exists:
+                results.append([])
+            else:
+                results.append([[future.result() for future in future_h] for future_h in future_grid])
+        return results
+
+    def draw_time(self, basetime, validtime, items, future):  # 1時刻分の画像を作成
+        for (name, path), tiles in zip(items, future.result()):
+            band, prod, alpha, beta = self.products[name]
+            args = (basetime, validtime, band, prod, *self.tiles_jp, path)
+            self.record(name, basetime, self.draw_prefetched(args, dict(check=False, alpha=alpha, beta=beta), tiles))
 
     def download_jp_infrared(self):  # ダウンロード(赤外画像,日本域)
-        self.download_jp_common("B13", "TBB", 5, 25, 10, 30, 14, self.settings["path"]["jp_infrared"])
+        self.download_jp(["jp_infrared"])
 
     def download_jp_visible(self):  # ダウンロード(可視画像,日本域)
-        self.download_jp_common("B03", "ALBD", 5, 25, 10, 30, 14, self.settings["path"]["jp_visible"])
+        self.download_jp(["jp_visible"])
 
     def download_jp_watervapor(self):  # ダウンロード(水蒸気画像,日本域)
-        self.download_jp_common("B08", "TBB", 5, 25, 10, 30, 14, self.settings["path"]["jp_watervapor"])
+        self.download_jp(["jp_watervapor"])
 
     def download_jp_truecolor(self):  # ダウンロード(トゥルーカラー再現画像,日本域)
-        self.download_jp_common("REP", "ETC", 5, 25, 10, 30, 14, self.settings["path"]["jp_truecolor"], alpha=1, beta=0)
+        self.download_jp(["jp_truecolor"])
 
     def download_jp_cloudheight(self):  # ダウンロード(雲頂画像,日本域)
-        self.download_jp_common("SND", "ETC", 5, 25, 10, 30, 14, self.settings["path"]["jp_cloudheight"])
+        self.download_jp(["jp_cloudheight"])
+
+    def draw_contents(self, product, contents):  # 複数の画像を先読みしながら作成
+        # contents: (draw_contentの位置引数, キーワード引数)のリスト 位置引数の最初はbasetime，最後は保存先
+        remaining = set(self.remaining(product, [args[0] for args, _ in contents]))
+        pending = collections.deque()
+        for args, kwargs in contents:
+            # 作成済みなら何もしない
+            if args[0] not in remaining:
+                continue
+            # タイルのダウンロードを先に始めておく
+            future = self.content_executor.submit(self.fetch_content, self.uri_content(*args[:-1]), args[0], kwargs.get("check", True))
+            pending.append((args, kwargs, future))
+            get_metrics().gauge('pending_frames', len(pending), product=product)
+            # 先読みの数を超えたら古いものから作成
+            if len(pending) > self.prefetch:
+                args, kwargs, future = pending.popleft()
+                self.record(product, args[0], self.draw_prefetched(args, kwargs, future.result()))
+        while pending:
+            args, kwargs, future = pending.popleft()
+            self.record(product, args[0], self.draw_prefetched(args, kwargs, future.result()))
+        self.flush_timelapses()
+
+    def uri_content(self, basetime, validtime, band, prod, z, x0, y0, x1, y1):  # タイルのURIの2次元リスト
+        return [[f'https://www.jma.go.jp/bosai/himawari/data/satimg/{basetime}/fd/{validtime}/{band}/{prod}/{str(z)}/{str(x)}/{str(y)}.jpg' for x in range(x0, x1 + 1)] for y in range(y0, y1 + 1)]
 
-    def draw_content(self, basetime, validtime, band, prod, z, x0, y0, x1, y1, path, check=True, alpha=0.95, beta=0.05):  # 画像描画
+    def draw_prefetched(self, args, kwargs, tiles):  # 先読みしたタイルで画像を作成(確認できなかった場合は作成しない)
+        if tiles is None:
+            return FrameManifest.UNKNOWN
+        return self.draw_content(*args, tiles=tiles, **kwargs)
+
+    def fetch_content(self, uri_grid, basetime, check):  # タイルをまとめてダウンロード(サーバにない場合は空のリスト，確認できなければNone)
+        # 時刻リストにないファイルだけ，代表の1枚でチェックする
+        if check:
+            exists = self.checker.check(uri_grid[0][0])
+            if exists is None:
+                print(f'[{basetime}] 確認できませんでした')
+                return None
+            if not exists:
+                print(f'[{basetime}] サーバにないファイルです')
+                return []
+        with get_metrics().stage('fetch'):
+            return self.fetcher.get_grid(uri_grid)
+
+    def decode_tile(self, data, flags=cv2.IMREAD_COLOR):  # タイルをメモリ上で画像に変換
+        if data is None:
+            return None
+        cache = self.fetcher.cache
+        if cache is None:
+            return cv2.imdecode(np.frombuffer(data, np.uint8), flags)
+        # 同じ内容のタイルは一度だけデコードする
+        key = (hashlib.sha256(data).hexdigest(), flags)
+        image = cache.get_decoded(key)
+        if image is None:
+            image = cv2.imdecode(np.frombuffer(data, np.uint8), flags)
+            if image is not None:
+                cache.put_decoded(key, image)
+        return image
+
+    def draw_content(self, basetime, validtime, band, prod, z, x0, y0, x1, y1, path, check=True, alpha=0.95, beta=0.05, tiles=None):  # 画像描画(状態を返す)
         # ファイルが存在するなら何もしない
-        if not os.path.exists(path):
-            image_list = np.empty((y1 - y0 + 1, x1 - x0 + 1), dtype=np.ndarray)
-            # ダウンロード
-            for y in range(y0, y1 + 1):
-                for x in range(x0, x1 + 1):
-                    uri = f'https://www.jma.go.jp/bosai/himawari/data/satimg/{basetime}/fd/{validtime}/{band}/{prod}/{str(z)}/{str(x)}/{str(y)}.jpg'
-                    # 時刻リストにないファイルだけチェックする
-                    if check and not file_is_on_server(uri):
-                        print(f'[{basetime}] サーバにないファイルです')
-                        return
-                    image_list[y - y0][x - x0] = cv2.imread(self.download(uri, self.tmp_name))
-            # 結合
-            try:
+        if os.path.exists(path): return FrameManifest.DONE
+        # ダウンロード
+        if tiles is None:
+            tiles = self.fetch_content(self.uri_content(basetime, validtime, band, prod, z, x0, y0, x1, y1), basetime, check)
+            if tiles is None: return FrameManifest.UNKNOWN
+        if not tiles: return FrameManifest.MISSING
+        metrics = get_metrics()
+        with metrics.stage('decode', band=band, prod=prod):
+            image_list = [[self.decode_tile(data) for data in tiles_h] for tiles_h in tiles]
+        # 結合
+        try:
+            with metrics.stage('compose', band=band, prod=prod):
                 image = cv2.vconcat([cv2.hconcat(image_h) for image_h in image_list])
-            except cv2.error:
-                print(f'[{basetime}] 作成できませんでした')
-                return
-            # マッピング
-            image = cv2.addWeighted(src1=image, alpha=alpha, src2=self.image_map, beta=beta, gamma=0)
-            # 文字書き込み
-            date_utc = datetime.datetime.strptime(basetime, "%Y%m%d%H%M%S")
-            date_jst = date_utc + datetime.timedelta(hours=9)
-            date_str = f'{date_jst.strftime("%Y.%m.%d %H:%M")}JST ({date_utc.strftime("%Y.%m.%d %H:%M")}UTC)'
-            cv2.putText(image, date_str, (10, 1270), cv2.FONT_HERSHEY_SIMPLEX, 2, (255, 255, 255), 4)
-            # 画像を保存
-            cv2.imwrite(path, image)
-            print(f'[{date_str}] {path}')
+                # マッピング
+                image = cv2.addWeighted(src1=image, alpha=alpha, src2=self.image_map, beta=beta, gamma=0)
+        except cv2.error:
+            print(f'[{basetime}] 作成できませんでした')
+            return FrameManifest.FAILED
+        # 文字書き込み
+        date_utc = datetime.datetime.strptime(basetime, "%Y%m%d%H%M%S")
+        date_jst = date_utc + datetime.timedelta(hours=9)
+        date_str = f'{date_jst.strftime("%Y.%m.%d %H:%M")}JST ({date_utc.strftime("%Y.%m.%d %H:%M")}UTC)'
+        cv2.putText(image, date_str, (10, 1270), cv2.FONT_HERSHEY_SIMPLEX, 2, (255, 255, 255), 4)
+        # 画像を保存
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with metrics.stage('encode', band=band, prod=prod):
+            written = cv2.imwrite(path, image)
+        if not written:
+            return FrameManifest.FAILED
+        print(f'[{date_str}] {path}')
+        return FrameManifest.DONE
+
+    def uri_base(self, z, x0, y0, x1, y1):  # 地図タイルのURIの2次元リスト
+        return [[f'https://cyberjapandata.gsi.go.jp/xyz/gmld_ptc2/{str(z)}/{str(x)}/{str(y)}.png' for x in range(x0, x1 + 1)] for y in range(y0, y1 + 1)]
 
     def draw_base(self, z, x0, y0, x1, y1, path):  # 地図描画
         # ファイルが存在するなら何もしない
         if not os.path.exists(path):
-            image_list = np.empty((y1 - y0 + 1, x1 - x0 + 1), dtype=np.ndarray)
             # ダウンロード
-            for y in range(y0, y1 + 1):
-                for x in range(x0, x1 + 1):
-                    image_list[y - y0][x - x0] = cv2.imread(self.download(f'https://cyberjapandata.gsi.go.jp/xyz/gmld_ptc2/{str(z)}/{str(x)}/{str(y)}.png', self.tmp_name))
+            tiles = self.fetcher.get_grid(self.uri_base(z, x0, y0, x1, y1))
+            image_list = [[self.decode_tile(data) for data in tiles_h] for tiles_h in tiles]
             # 結合
             image = cv2.vconcat([cv2.hconcat(image_h) for image_h in image_list])
             # 色を置換
@@ -139,17 +321,10 @@ class DownloadSatellite:
         # 地図ファイルを開く
         return cv2.imread(path)
 
-    @classmethod
-    def download(cls, uri, path):  # ダウンロードしたファイルのパスを返す
-        while True:
-            try:
-                req = requests.get(uri, timeout=10)
-            # ダウンロードできない場合
-            except Exception as e:
-                print(f'[エラー　　　　] {e}')
-                tm.sleep(10)
-            # ダウンロードが成功したらファイルを保存
-            else:
-                with open(path, "wb") as fp:
-                    fp.write(req.content)
-                return path
+    def download(self, uri, path):  # ダウンロードしたファイルのパスを返す
+        with get_metrics().stage('download'):
+            data = self.fetcher.get(uri)
+        # ダウンロードが成功したらファイルを保存
+        with open(path, "wb") as fp:
+            fp.write(data or b"")
+        return path
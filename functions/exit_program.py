@@ -1,6 +1,17 @@
 import os
 import sys
-from tkinter import messagebox
+
+# 'q'の入力を待つか(常駐するときは待たずに例外を送出する)
+interactive = True
+
+
+class ProgramExit(Exception):  # 入力を待たずに終了するときの例外
+    pass
+
+
+def set_interactive(value):  # 'q'の入力を待つかの設定
+    global interactive
+    interactive = value
 
 
 def exit_program(e, info=None):  # プログラムの終了
@@ -9,6 +20,8 @@ def exit_program(e, info=None):  # プログラムの終了
         exc_type, exc_obj, exc_tb = info
         fname = os.path.split(exc_tb.tb_frame.f_code.co_filename)[1]
         print("{0} {1} {2}行目".format(exc_type, fname, exc_tb.tb_lineno))
+    if not interactive:
+        raise ProgramExit(e)
     print("{0}\n\'q\'で終了します".format(e))
     while True:
         s = input()
@@ -0,0 +1,81 @@
+###################################################################
+# 1サイクル分の要素の保存(float32の.npyをメモリマップで読む)
+###################################################################
+import os
+import sys
+import json
+
+import numpy as np
+
+if __name__ == "__main__":
+    print("please execute main.py")
+    sys.exit()
+
+
+class FieldArchive:  # 天気図に使う要素を切り出した範囲で保存し，grib2ファイルなしで読めるようにする
+    # 保存する型
+    dtype = np.float32
+    # 索引ファイルの名前
+    index_name = 'index.json'
+
+    def __init__(self, path):
+        # 1サイクル分のディレクトリ
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        # 名前 -> 要素の情報
+        self.entries = {}
+        # 領域 -> 緯度経度のファイル名
+        self.grids = {}
+        # 領域 -> (lat, lon) 開いた緯度経度
+        self.grid_arrays = {}
+        try:
+            with open(os.path.join(path, self.index_name)) as fp:
+                index = json.load(fp)
+            self.entries = index['fields']
+            self.grids = index['grids']
+        except (OSError, ValueError, KeyError):
+            pass
+
+    @staticmethod
+    def name(key):  # 要素のファイル名(拡張子なし)
+        shortName, level, forecast_time, region = key
+        return f'{shortName}_{level}_FT{forecast_time:03d}_{region}'
+
+    def has(self, key):  # 保存済みか
+        return self.name(key) in self.entries
+
+    def save_array(self, file_name, array):  # 配列を保存(書き込みが終わってから名前を変える)
+        path = os.path.join(self.path, file_name)
+        path_tmp = f'{path}.{os.getpid()}.tmp.npy'
+        np.save(path_tmp, array)
+        os.replace(path_tmp, path)
+
+    def write(self, key, field):  # 要素(data, lat, lon)を保存
+        data, lat, lon = field
+        shortName, level, forecast_time, region = key
+        # 緯度経度は領域ごとに一度だけ
+        if region not in self.grids:
+            self.save_array(f'lat_{region}.npy', np.asarray(lat))
+            self.save_array(f'lon_{region}.npy', np.asarray(lon))
+            self.grids[region] = {'lat': f'lat_{region}.npy', 'lon': f'lon_{region}.npy'}
+        name = self.name(key)
+        # 欠損値はNaNにする
+        self.save_array(name + '.npy', np.ma.filled(np.ma.asarray(data, dtype=self.dtype), np.nan))
+        self.entries[name] = {'shortName': shortName, 'level': level, 'forecastTime': forecast_time, 'region': region, 'shape': list(np.shape(data))}
+
+    def grid(self, region):  # 緯度経度(メモリマップ)
+        if region not in self.grid_arrays:
+            self.grid_arrays[region] = tuple(np.load(os.path.join(self.path, self.grids[region][name]), mmap_mode='r') for name in ('lat', 'lon'))
+        return self.grid_arrays[region]
+
+    def load(self, key):  # 要素(data, lat, lon)をコピーせずに読む
+        data = np.load(os.path.join(self.path, self.name(key) + '.npy'), mmap_mode='r')
+        lat, lon = self.grid(key[3])
+        return data, lat, lon
+
+    def save(self):  # 索引を保存
+        path = os.path.join(self.path, self.index_name)
+        path_tmp = f'{path}.{os.getpid()}.tmp'
+        with open(path_tmp, 'w') as fp:
+            json.dump({'fields': self.entries, 'grids': self.grids}, fp)
+        os.replace(path_tmp, path)
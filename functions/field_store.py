@@ -0,0 +1,70 @@
+###################################################################
+# 読み込んだ要素の保持
+###################################################################
+import sys
+import collections
+
+import numpy as np
+
+if __name__ == "__main__":
+    print("please execute main.py")
+    sys.exit()
+
+
+class FieldStore:  # 要素をキーごとに保持し，上限を超えたら最も古く使われたものから捨てる
+    # メモリの上限(MB)のデフォルト
+    max_mb = 512
+
+    def __init__(self, max_mb=None):
+        if max_mb is not None:
+            self.max_mb = max_mb
+        # キー -> (配列のタプル, バイト数)
+        self.items = collections.OrderedDict()
+        self.nbytes = 0
+        # 統計
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def size(value):  # 配列のタプルのバイト数(同じ配列は一度だけ，ビューは元の配列で数える)
+        arrays = {}
+        for array in value:
+            # メモリマップはページキャッシュにあるので数えない
+            if isinstance(array, np.memmap):
+                continue
+            if isinstance(getattr(array, 'base', None), np.ndarray):
+                array = array.base
+            arrays[id(array)] = array
+        return sum(getattr(array, 'nbytes', 0) for array in arrays.values())
+
+    def get(self, key):  # 保持していれば返す(なければNone)
+        item = self.items.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.items.move_to_end(key)
+        return item[0]
+
+    def put(self, key, value):  # 保持する(書き換えられないようにする)
+        for array in value:
+            if hasattr(array, 'setflags'):
+                array.setflags(write=False)
+        if key in self.items:
+            self.nbytes -= self.items.pop(key)[1]
+        size = self.size(value)
+        self.items[key] = (value, size)
+        self.nbytes += size
+        # 上限を超えたら古いものから捨てる(今入れたものは残す)
+        while self.nbytes > self.max_mb * 1024 * 1024 and len(self.items) > 1:
+            _, (_, size) = self.items.popitem(last=False)
+            self.nbytes -= size
+            self.evictions += 1
+
+    def clear(self):
+        self.items.clear()
+        self.nbytes = 0
+
+    def stats(self):  # 統計の文字列
+        return f'hit {self.hits}, miss {self.misses}, evict {self.evictions}, {self.nbytes / 1024 / 1024:.1f}MB'
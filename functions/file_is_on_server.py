@@ -1,29 +1,124 @@
-import urllib
+import os
+import json
+import atexit
+import threading
 import time as tm
 
+import requests
 
-def file_is_on_server(url):  # インターネット接続を確認して，ダウンロードする対象がサーバーに存在するか確認
-    def is_connected():
-        while True:
-            # ネット接続を確認
+
+class ServerChecker:  # ダウンロードする対象がサーバーに存在するか確認
+    # 接続確認先
+    uri_check = 'https://www.jma.go.jp/jma/index.html'
+    # タイムアウト(秒)
+    timeout = 10
+    # 再試行までの待ち時間(秒)
+    retry_wait = 10
+    # サーバにないと判定した結果を覚えておく時間(秒)
+    negative_ttl = 24 * 3600
+    # この数だけ記録したら保存
+    save_interval = 50
+
+    def __init__(self, path_negative=None, session=None):
+        self.session = session or requests.Session()
+        # 接続確認済みかどうか(セッションで一度だけ確認する)
+        self.connected = False
+        # サーバにないファイル url -> 確認した時刻
+        self.path_negative = path_negative
+        self.negative = {}
+        if path_negative is not None and os.path.exists(path_negative):
+            try:
+                with open(path_negative) as fp:
+                    self.negative = json.load(fp)
+            except Exception as e:
+                print(f'[確認結果の読み込みエラー] {e}')
+        self.n_negative = 0
+        self.lock = threading.Lock()
+        if path_negative is not None:
+            atexit.register(self.save)
+
+    def is_connected(self):  # インターネット接続を確認(確認済みなら何もしない)
+        while not self.connected:
             try:
-                urllib.request.urlopen('https://www.jma.go.jp/jma/index.html')
+                self.session.head(self.uri_check, timeout=self.timeout)
             # 接続できなければ10秒待って再試行
             except Exception as e:
                 print('[接続エラー] {0}'.format(e))
-                tm.sleep(10)
+                tm.sleep(self.retry_wait)
             # 接続出来たらループから抜ける
             else:
-                break
-    # 目的の画像がサーバーに存在するか確認
-    #存在すればTrue, 存在しなければFalseを返す
-    cnt = 0
-    while cnt < 3:
-        try:
-            is_connected()
-            urllib.request.urlopen(url)
-        except Exception:
+                self.connected = True
+
+    def probe(self, url):  # ヘッダだけ取得してステータスコードを返す
+        req = self.session.head(url, timeout=self.timeout, allow_redirects=True)
+        # HEADに対応していないサーバは本文を読まずにGET
+        if req.status_code in (405, 501):
+            with self.session.get(url, timeout=self.timeout, stream=True) as req:
+                return req.status_code
+        return req.status_code
+
+    def check(self, url):  # 存在すればTrue, 存在しなければFalse, 確認できなければ(接続エラー，5xx)Noneを返す
+        # 最近サーバになかったファイルは確認しない
+        with self.lock:
+            checked = self.negative.get(url)
+        if checked is not None and tm.time() - checked < self.negative_ttl:
+            return False
+        cnt = 0
+        while cnt < 3:
+            try:
+                self.is_connected()
+                status = self.probe(url)
+            except Exception:
+                # 接続を確認し直す
+                self.connected = False
+                cnt += 1
+                continue
+            if status == 200:
+                return True
+            # 4xxのときだけサーバにないと記録する
+            if status < 500:
+                self.add_negative(url)
+                return False
             cnt += 1
-        else:
-            return True
-    return False
+        # 一時的なエラーは記録しない(次回また確認する)
+        return None
+
+    def exists(self, url):  # 存在すればTrue, 存在しない(確認できない)ならFalseを返す
+        return self.check(url) is True
+
+    def add_negative(self, url):  # サーバにないファイルを記録
+        with self.lock:
+            self.negative[url] = tm.time()
+            self.n_negative += 1
+            save = self.n_negative % self.save_interval == 0
+        if save:
+            self.save()
+
+    def save(self):  # サーバにないファイルの記録を保存(期限切れは捨てる)
+        if self.path_negative is None:
+            return
+        with self.lock:
+            now = tm.time()
+            self.negative = {url: checked for url, checked in self.negative.items() if now - checked < self.negative_ttl}
+            text = json.dumps(self.negative)
+        path_tmp = f'{self.path_negative}.{os.getpid()}.tmp'
+        with open(path_tmp, "w") as fp:
+            fp.write(text)
+        os.replace(path_tmp, self.path_negative)
+
+
+# プロセス内で共有する確認用オブジェクト ネガティブキャッシュの保存先 -> ServerChecker
+_checkers = {}
+_checker_lock = threading.Lock()
+
+
+def get_checker(path_negative=None, session=None):  # ネガティブキャッシュの保存先ごとに共有の確認用オブジェクトを返す
+    # session: 最初に作成するときだけ使う(接続の共有)
+    with _checker_lock:
+        if path_negative not in _checkers:
+            _checkers[path_negative] = ServerChecker(path_negative, session)
+        return _checkers[path_negative]
+
+
+def file_is_on_server(url):  # インターネット接続を確認して，ダウンロードする対象がサーバーに存在するか確認
+    return get_checker().exists(url)
\ No newline at end of file
@@ -0,0 +1,107 @@
+###################################################################
+# 衛星・レーダー画像の作成状況の記録(SQLite)
+###################################################################
+import os
+import sys
+import atexit
+import sqlite3
+import threading
+import time as tm
+
+if __name__ == "__main__":
+    print("please execute main.py")
+    sys.exit()
+
+
+class FrameManifest:  # 画像ごとの状態(作成済み/サーバにない/失敗/確認できない)と試行回数を記録
+    # 作成済み
+    DONE = 'done'
+    # サーバにない
+    MISSING = 'missing'
+    # 作成に失敗
+    FAILED = 'failed'
+    # 接続エラーなどで確認できなかった(試行回数に数えず，次回また確認する)
+    UNKNOWN = 'unknown'
+    # サーバにない，失敗した画像を再び試すまでの時間(秒) 試行回数ごとに倍にする
+    retry_wait = 600
+    # 再び試すまでの時間の上限(秒)
+    retry_wait_max = 24 * 3600
+    # この数だけ記録したら保存
+    save_interval = 50
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        # 画像を作成するスレッドと先読みのスレッドで共有する
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS frames ('
+            'product TEXT NOT NULL, basetime TEXT NOT NULL, status TEXT NOT NULL, '
+            'attempts INTEGER NOT NULL DEFAULT 0, updated REAL NOT NULL, '
+            'PRIMARY KEY (product, basetime))')
+        self.connection.commit()
+        self.n_record = 0
+        self.lock = threading.Lock()
+        atexit.register(self.close)
+
+    def statuses(self, product):  # basetime -> (状態, 試行回数, 更新した時刻)
+        with self.lock:
+            rows = self.connection.execute('SELECT basetime, status, attempts, updated FROM frames WHERE product = ?', (product,)).fetchall()
+        return {basetime: (status, attempts, updated) for basetime, status, attempts, updated in rows}
+
+    def retry_after(self, attempts):  # 再び試すまでの時間(秒)
+        return min(self.retry_wait * 2 ** max(attempts - 1, 0), self.retry_wait_max)
+
+    def is_due(self, status, now):  # 作成済みでなく，再び試す時刻になったか
+        state, attempts, updated = status
+        if state == self.DONE:
+            return False
+        if state == self.UNKNOWN:
+            return True
+        return now - updated >= self.retry_after(attempts)
+
+    def remaining(self, product, basetimes, exists=None):  # まだ作成する必要がある時刻
+        # exists(basetime): 記録がない時刻のファイルがすでにあるか(記録を始める前に作成した画像)
+        statuses = self.statuses(product)
+        now = tm.time()
+        remaining = []
+        found = []
+        for basetime in basetimes:
+            status = statuses.get(basetime)
+            if status is None:
+                if exists is not None and exists(basetime):
+                    found.append(basetime)
+                else:
+                    remaining.append(basetime)
+            elif self.is_due(status, now):
+                remaining.append(basetime)
+        # 見つかったファイルは作成済みとして記録
+        if found:
+            with self.lock:
+                self.connection.executemany(
+                    'INSERT OR IGNORE INTO frames (product, basetime, status, attempts, updated) VALUES (?, ?, ?, 0, ?)',
+                    [(product, basetime, self.DONE, now) for basetime in found])
+                self.connection.commit()
+        return remaining
+
+    def record(self, product, basetime, status):  # 結果を記録(サーバにない，失敗したときは試行回数を増やす)
+        attempts = 1 if status in (self.MISSING, self.FAILED) else 0
+        with self.lock:
+            self.connection.execute(
+                'INSERT INTO frames (product, basetime, status, attempts, updated) VALUES (?, ?, ?, ?, ?) '
+                'ON CONFLICT (product, basetime) DO UPDATE SET '
+                'status = excluded.status, attempts = attempts + excluded.attempts, updated = excluded.updated',
+                (product, basetime, status, attempts, tm.time()))
+            self.n_record += 1
+            if self.n_record % self.save_interval == 0:
+                self.connection.commit()
+
+    def close(self):  # 保存して閉じる
+        with self.lock:
+            if self.connection is None:
+                return
+            self.connection.commit()
+            self.connection.close()
+            self.connection = None
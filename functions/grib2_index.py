@@ -0,0 +1,260 @@
+###################################################################
+# grib2ファイルの節の読み取り
+###################################################################
+import os
+import sys
+import json
+
+if __name__ == "__main__":
+    print("please execute main.py")
+    sys.exit()
+
+# パラメータ (discipline, parameterCategory, parameterNumber) -> shortName
+PARAMETERS = {
+    (0, 0, 0): 't',
+    (0, 1, 0): 'q',
+    (0, 1, 1): 'r',
+    (0, 1, 8): 'tp',
+    (0, 2, 2): 'u',
+    (0, 2, 3): 'v',
+    (0, 2, 8): 'w',
+    (0, 3, 0): 'sp',
+    (0, 3, 1): 'prmsl',
+    (0, 3, 5): 'gh',
+    (0, 4, 7): 'dswrf',
+    (0, 6, 1): 'tcc',
+    (0, 6, 3): 'lcc',
+    (0, 6, 4): 'mcc',
+    (0, 6, 5): 'hcc',
+}
+# 地上からの高さで名前が変わるもの (shortName, 高さ) -> shortName
+PARAMETERS_HEIGHT = {
+    ('t', 2): '2t',
+    ('r', 2): '2r',
+    ('u', 10): '10u',
+    ('v', 10): '10v',
+}
+# 第一固定面の種類 -> typeOfLevel
+LEVEL_TYPES = {
+    1: 'surface',
+    100: 'isobaricInhPa',
+    101: 'meanSea',
+    103: 'heightAboveGround',
+}
+# 最初に読み込むヘッダの大きさ(バイト)
+HEADER_SIZE = 512
+
+
+class RangeNotSupported(Exception):  # サーバが部分ダウンロードに対応していない
+    pass
+
+
+def signed(value, nbytes):  # 符号と絶対値で表された整数を変換
+    sign = 1 << (nbytes * 8 - 1)
+    return -(value & (sign - 1)) if value & sign else value
+
+
+def parse_header(buf):  # メッセージの先頭から第4節までを読む(足りなければ必要なバイト数を返す)
+    if buf[:4] != b'GRIB' or buf[7] != 2:
+        raise ValueError('grib2メッセージではありません')
+    discipline = buf[6]
+    length = int.from_bytes(buf[8:16], 'big')
+    pos = 16
+    while True:
+        if len(buf) < pos + 5:
+            return None, pos + 5
+        section_length = int.from_bytes(buf[pos:pos + 4], 'big')
+        if buf[pos + 4] == 4:
+            break
+        pos += section_length
+    if len(buf) < pos + 28:
+        return None, pos + 28
+    # 第4節(プロダクト定義節)
+    category = buf[pos + 9]
+    number = buf[pos + 10]
+    forecast_time = int.from_bytes(buf[pos + 18:pos + 22], 'big')
+    # 時間の単位が分なら時間に直す
+    if buf[pos + 17] == 0:
+        forecast_time //= 60
+    level_type = buf[pos + 22]
+    scale = signed(buf[pos + 23], 1)
+    scaled_value = int.from_bytes(buf[pos + 24:pos + 28], 'big')
+    if scaled_value == 0xFFFFFFFF:
+        level = 0
+    else:
+        level = signed(scaled_value, 4) / 10 ** scale
+    # 気圧面はhPaにする
+    if level_type == 100:
+        level /= 100
+    level = int(level) if float(level).is_integer() else level
+    short_name = PARAMETERS.get((discipline, category, number), 'unknown')
+    if level_type == 103:
+        short_name = PARAMETERS_HEIGHT.get((short_name, level), short_name)
+    entry = {
+        'shortName': short_name,
+        'typeOfLevel': LEVEL_TYPES.get(level_type, str(level_type)),
+        'level': level,
+        'forecastTime': forecast_time,
+        'discipline': discipline,
+        'parameterCategory': category,
+        'parameterNumber': number,
+        'length': length,
+    }
+    return entry, None
+
+
+def scan(reader):  # メッセージの一覧を作成
+    # reader(offset, size): offsetからsizeバイト読み込む関数
+    entries = []
+    offset = 0
+    while True:
+        size = HEADER_SIZE
+        buf = reader(offset, size)
+        if len(buf) < 16:
+            break
+        while True:
+            entry, needed = parse_header(buf)
+            if entry is not None:
+                break
+            # ヘッダが長い場合は読み直す
+            if len(buf) < size:
+                raise ValueError(f'{offset}バイト目のメッセージが途中で切れています')
+            size = needed + HEADER_SIZE
+            buf = reader(offset, size)
+        entry['offset'] = offset
+        entries.append(entry)
+        offset += entry['length']
+    return entries
+
+
+def http_reader(session, uri, timeout=10):  # HTTPのRangeで読み込む関数を返す
+    def reader(offset, size):
+        req = session.get(uri, headers={'Range': f'bytes={offset}-{offset + size - 1}'}, timeout=timeout)
+        # ファイルの終わりを超えた場合
+        if req.status_code == 416:
+            return b''
+        if req.status_code == 200:
+            req.close()
+            raise RangeNotSupported(uri)
+        req.raise_for_status()
+        return req.content
+    return reader
+
+
+def file_reader(fp):  # ファイルから読み込む関数を返す
+    def reader(offset, size):
+        fp.seek(offset)
+        return fp.read(size)
+    return reader
+
+
+def merge_ranges(entries, gap=0):  # 隣り合うメッセージの範囲をまとめる
+    ranges = []
+    for entry in sorted(entries, key=lambda entry: entry['offset']):
+        start = entry['offset']
+        end = start + entry['length']
+        if ranges and start - ranges[-1][1] <= gap:
+            ranges[-1][1] = max(ranges[-1][1], end)
+        else:
+            ranges.append([start, end])
+    return ranges
+
+
+def path_index(path_grib2):  # 索引ファイルの場所
+    return path_grib2 + '.idx.json'
+
+
+def build_index(path_grib2):  # grib2ファイルの索引を作成して保存
+    with open(path_grib2, 'rb') as fp:
+        entries = scan(file_reader(fp))
+    index = {'size': os.path.getsize(path_grib2), 'entries': entries}
+    path_tmp = path_index(path_grib2) + '.tmp'
+    with open(path_tmp, 'w') as fp:
+        json.dump(index, fp)
+    os.replace(path_tmp, path_index(path_grib2))
+    return entries
+
+
+def path_unavailable(path_grib2):  # サーバのファイルにもないメッセージの記録の場所
+    return path_grib2 + '.unavailable.json'
+
+
+def load_unavailable(path_grib2):  # サーバのファイルにもないメッセージ {(shortName, level, forecastTime)}
+    try:
+        with open(path_unavailable(path_grib2)) as fp:
+            return {tuple(message) for message in json.load(fp)}
+    except (OSError, ValueError, TypeError):
+        return set()
+
+
+def save_unavailable(path_grib2, messages):  # サーバのファイルにもないメッセージを追加して保存
+    messages = load_unavailable(path_grib2) | set(messages)
+    path_tmp = path_unavailable(path_grib2) + '.tmp'
+    with open(path_tmp, 'w') as fp:
+        json.dump(sorted(messages), fp)
+    os.replace(path_tmp, path_unavailable(path_grib2))
+
+
+def load_index(path_grib2):  # 索引を読み込む(なければ作成)
+    try:
+        with open(path_index(path_grib2)) as fp:
+            index = json.load(fp)
+        # grib2ファイルと大きさが合わなければ作り直す
+        if index['size'] == os.path.getsize(path_grib2):
+            return index['entries']
+    except (OSError, ValueError, KeyError):
+        pass
+    return build_index(path_grib2)
+
+
+class Grib2Index:  # 索引を使ってgrib2ファイルのメッセージを直接読む
+    def __init__(self, path_grib2):
+        self.path_grib2 = path_grib2
+        self.entries = load_index(path_grib2)
+        # (shortName, typeOfLevel, level, forecastTime) -> メッセージ
+        self.table = {}
+        # (shortName, level, forecastTime) -> メッセージ(typeOfLevelを指定しない場合)
+        self.table_name = {}
+        for entry in self.entries:
+            self.table.setdefault((entry['shortName'], entry['typeOfLevel'], entry['level'], entry['forecastTime']), entry)
+            self.table_name.setdefault((entry['shortName'], entry['level'], entry['forecastTime']), entry)
+
+    def find(self, shortName, level, forecastTime=0, typeOfLevel=None):  # メッセージを探す(なければNone)
+        if typeOfLevel is None:
+            return self.table_name.get((shortName, level, forecastTime))
+        return self.table.get((shortName, typeOfLevel, level, forecastTime))
+
+    def read(self, entry):  # メッセージのバイト列を読む
+        with open(self.path_grib2, 'rb') as fp:
+            fp.seek(entry['offset'])
+            return fp.read(entry['length'])
+
+    def iter_steps(self, steps, max_pending=2):  # ファイルを先頭から一度だけ読み，そろった予報時間ごとにメッセージを返す
+        # steps: 予報時間 -> [(shortName, level, forecastTime)]
+        # 積算値(テンプレート4.8)はforecastTimeが積算の開始なので，予報時間とメッセージのforecastTimeは異なることがある
+        # 予報時間 -> 読むメッセージの一覧 [((shortName, level), メッセージ)]
+        wanted = {}
+        for forecast_time, fields in steps.items():
+            entries = [((shortName, level), self.find(shortName, level, message_time)) for shortName, level, message_time in fields]
+            entries = [(key, entry) for key, entry in entries if entry is not None]
+            if entries:
+                wanted[forecast_time] = entries
+        # 予報時間ごとの最後のメッセージの位置
+        last = {forecast_time: max(entry['offset'] for _, entry in entries) for forecast_time, entries in wanted.items()}
+        # 予報時間 -> {(shortName, level): (メッセージ, バイト列(上限を超えた分はNoneにして後で読む))}
+        pending = {}
+        items = sorted(((forecast_time, key, entry) for forecast_time, entries in wanted.items() for key, entry in entries), key=lambda item: item[2]['offset'])
+        with open(self.path_grib2, 'rb') as fp:
+            for forecast_time, key, entry in items:
+                messages = pending.setdefault(forecast_time, {})
+                # メモリに置くのはmax_pending個の予報時間まで
+                if forecast_time in list(pending)[:max_pending]:
+                    fp.seek(entry['offset'])
+                    messages[key] = (entry, fp.read(entry['length']))
+                else:
+                    messages[key] = (entry, None)
+                if entry['offset'] != last[forecast_time]:
+                    continue
+                # そろったら返す
+                del pending[forecast_time]
+                yield forecast_time, {key: data if data is not None else self.read(entry) for key, (entry, data) in messages.items()}
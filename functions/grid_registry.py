@@ -0,0 +1,80 @@
+###################################################################
+# 格子の切り出し範囲と緯度経度の共有
+###################################################################
+import sys
+import threading
+
+import numpy as np
+
+if __name__ == "__main__":
+    print("please execute main.py")
+    sys.exit()
+
+# 格子を区別するキー
+GRID_KEYS = (
+    'gridType',
+    'Ni',
+    'Nj',
+    'latitudeOfFirstGridPointInDegrees',
+    'longitudeOfFirstGridPointInDegrees',
+    'latitudeOfLastGridPointInDegrees',
+    'longitudeOfLastGridPointInDegrees',
+)
+
+
+class GridSubset:  # 格子の一部分(切り出す行と列，緯度，経度)
+    def __init__(self, rows, cols, lat, lon):
+        self.rows = rows
+        self.cols = cols
+        # 緯度経度は共有するので書き換えを禁止
+        lat.setflags(write=False)
+        lon.setflags(write=False)
+        self.lat = lat
+        self.lon = lon
+
+    def data(self, values):  # 切り出した値(コピーしない)
+        return values[self.rows, self.cols]
+
+
+# (格子, 範囲) -> GridSubset(切り出せない格子はNone)
+_subsets = {}
+_subsets_lock = threading.Lock()
+
+
+def contiguous_slice(mask):  # 連続したTrueの範囲をsliceにする(連続していなければNone)
+    index = np.flatnonzero(mask)
+    if index.size == 0 or index[-1] - index[0] + 1 != index.size:
+        return None
+    return slice(int(index[0]), int(index[-1]) + 1)
+
+
+def make_subset(message, bounds):  # 切り出し範囲と緯度経度を計算
+    if message['gridType'] != 'regular_ll':
+        return None
+    lat1, lat2, lon1, lon2 = bounds
+    lats, lons = message.latlons()
+    lat_1d = lats[:, 0]
+    lon_1d = lons[0, :]
+    rows = contiguous_slice((lat_1d >= (-90 if lat1 is None else lat1)) & (lat_1d <= (90 if lat2 is None else lat2)))
+    cols = contiguous_slice((lon_1d >= (-np.inf if lon1 is None else lon1)) & (lon_1d <= (np.inf if lon2 is None else lon2)))
+    if rows is None or cols is None:
+        return None
+    return GridSubset(rows, cols, lats[rows, cols].copy(), lons[rows, cols].copy())
+
+
+def get_subset(message, bounds):  # 格子と範囲ごとに一度だけ計算する
+    key = (tuple(message[name] for name in GRID_KEYS), bounds)
+    with _subsets_lock:
+        if key not in _subsets:
+            _subsets[key] = make_subset(message, bounds)
+        return _subsets[key]
+
+
+def subset_field(message, bounds):  # 範囲を切り出した値，緯度，経度を返す
+    # bounds: (lat1, lat2, lon1, lon2) 制限しない場合はNone
+    subset = get_subset(message, bounds)
+    # 切り出せない格子はpygribに任せる
+    if subset is None:
+        kwargs = {name: value for name, value in zip(('lat1', 'lat2', 'lon1', 'lon2'), bounds) if value is not None}
+        return message.data(**kwargs)
+    return subset.data(message.values), subset.lat, subset.lon
@@ -0,0 +1,173 @@
+###################################################################
+# 計測(段階ごとの時間，転送量，再試行，待ち行列の長さ)
+###################################################################
+import os
+import sys
+import json
+import atexit
+import contextlib
+import threading
+import time as tm
+
+if __name__ == "__main__":
+    print("please execute main.py")
+    sys.exit()
+
+# Prometheusの名前の接頭辞
+PREFIX = 'gpv'
+
+
+class NullMetrics:  # 計測しない(設定がないとき)
+    enabled = False
+    # 何もしないwith
+    _null = contextlib.nullcontext()
+
+    def stage(self, name, **labels):
+        return self._null
+
+    def count(self, name, value=1, **labels):
+        pass
+
+    def gauge(self, name, value, **labels):
+        pass
+
+    def flush(self):
+        pass
+
+    def take(self):
+        return None
+
+    def merge(self, totals):
+        pass
+
+    def config(self):
+        return None
+
+
+class Metrics:  # 計測した値をJSON Lines / Prometheusのテキストファイルに出力
+    enabled = True
+
+    def __init__(self, job, path_jsonl=None, path_prometheus=None):
+        # プログラムの名前(gsm, msm, sat, rad)
+        self.job = job
+        self.path_jsonl = path_jsonl
+        self.path_prometheus = path_prometheus
+        for path in (path_jsonl, path_prometheus):
+            if path is not None:
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # (名前, ラベル) -> 値
+        self.counters = {}
+        self.gauges = {}
+        # (段階, ラベル) -> [回数, 合計秒]
+        self.stages = {}
+        self.lock = threading.Lock()
+        # Prometheusのファイルは設定したプロセスだけが書く(子プロセスはJSON Linesだけ)
+        self.pid = os.getpid()
+        atexit.register(self.flush)
+
+    @staticmethod
+    def key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def emit(self, record):  # JSON Linesに1行追記(複数のプロセスから追記してもよい)
+        if self.path_jsonl is None:
+            return
+        record = {'time': round(tm.time(), 3), 'job': self.job, 'pid': os.getpid(), **record}
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        with open(self.path_jsonl, 'a', encoding='utf-8') as fp:
+            fp.write(line)
+
+    @contextlib.contextmanager
+    def stage(self, name, **labels):  # withの中の時間を記録
+        start = tm.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = tm.perf_counter() - start
+            with self.lock:
+                stage = self.stages.setdefault(self.key(name, labels), [0, 0.0])
+                stage[0] += 1
+                stage[1] += elapsed
+            self.emit({'type': 'stage', 'stage': name, 'seconds': round(elapsed, 6), **labels})
+
+    def count(self, name, value=1, **labels):  # 累積する値(バイト数，再試行の回数など)
+        with self.lock:
+            key = self.key(name, labels)
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def gauge(self, name, value, **labels):  # 現在の値(待ち行列の長さなど)
+        with self.lock:
+            self.gauges[self.key(name, labels)] = value
+
+    def take(self):  # 累積した値を取り出して0に戻す(子プロセスから親プロセスに渡す)
+        with self.lock:
+            totals = (self.counters, self.gauges, self.stages)
+            self.counters = {}
+            self.gauges = {}
+            self.stages = {}
+        return totals
+
+    def merge(self, totals):  # 子プロセスで累積した値を足す
+        if totals is None:
+            return
+        counters, gauges, stages = totals
+        with self.lock:
+            for key, value in counters.items():
+                self.counters[key] = self.counters.get(key, 0) + value
+            self.gauges.update(gauges)
+            for key, (runs, seconds) in stages.items():
+                stage = self.stages.setdefault(key, [0, 0.0])
+                stage[0] += runs
+                stage[1] += seconds
+
+    def config(self):  # 子プロセスで同じ出力先を使うための設定(Prometheusのファイルは親プロセスだけが書く)
+        return {"jsonl": self.path_jsonl}
+
+    def flush(self):  # 累積した値を出力
+        with self.lock:
+            counters = dict(self.counters)
+            gauges = dict(self.gauges)
+            stages = {key: list(value) for key, value in self.stages.items()}
+        if counters or gauges:
+            self.emit({'type': 'totals',
+                       'counters': {self.label_text(name, labels): value for (name, labels), value in counters.items()},
+                       'gauges': {self.label_text(name, labels): value for (name, labels), value in gauges.items()}})
+        if self.path_prometheus is None or os.getpid() != self.pid:
+            return
+        lines = []
+        for metric, kind, values in (
+                (f'{PREFIX}_stage_seconds_total', 'counter', {key: value[1] for key, value in stages.items()}),
+                (f'{PREFIX}_stage_runs_total', 'counter', {key: value[0] for key, value in stages.items()})):
+            lines.append(f'# TYPE {metric} {kind}')
+            lines += [f'{metric}{self.label_text(None, (("stage", name),) + labels)} {value}' for (name, labels), value in sorted(values.items())]
+        for (name, labels), value in sorted(counters.items()):
+            lines.append(f'{PREFIX}_{name}_total{self.label_text(None, labels)} {value}')
+        for (name, labels), value in sorted(gauges.items()):
+            lines.append(f'{PREFIX}_{name}{self.label_text(None, labels)} {value}')
+        # 書き込みが終わってから名前を変える(node_exporterが途中のファイルを読まないように)
+        path_tmp = f'{self.path_prometheus}.{os.getpid()}.tmp'
+        with open(path_tmp, 'w') as fp:
+            fp.write('\n'.join(lines) + '\n')
+        os.replace(path_tmp, self.path_prometheus)
+
+    def label_text(self, name, labels):  # name{key="value",...}
+        labels = (('job', self.job),) + tuple(labels)
+        text = ','.join(f'{key}="{value}"' for key, value in labels)
+        return f'{name or ""}{{{text}}}'
+
+
+# プロセス内で共有する計測用オブジェクト
+_metrics = NullMetrics()
+
+
+def init_metrics(settings, job):  # 設定ファイルの"metrics"({"jsonl", "prometheus"})から準備
+    global _metrics
+    if settings and (settings.get("jsonl") or settings.get("prometheus")):
+        _metrics = Metrics(job, settings.get("jsonl"), settings.get("prometheus"))
+    else:
+        _metrics = NullMetrics()
+    return _metrics
+
+
+def get_metrics():  # 共有の計測用オブジェクトを返す
+    return _metrics
@@ -0,0 +1,131 @@
+###################################################################
+# プロファイル(cProfile / サンプリング)とメモリ使用量の最大値
+###################################################################
+import os
+import sys
+import io
+import json
+import time as tm
+import pstats
+import cProfile
+import threading
+import tracemalloc
+
+if __name__ == "__main__":
+    print("please execute main.py")
+    sys.exit()
+
+
+class SamplingProfiler:  # 一定間隔でスタックを記録(flamegraph.pl / speedscopeのcollapsed形式)
+    # 記録する間隔(秒)
+    interval = 0.005
+
+    def __init__(self, interval=None, thread_id=None):
+        if interval is not None:
+            self.interval = interval
+        # 記録するスレッド(指定しなければ呼び出したスレッド)
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        # スタック -> 回数
+        self.stacks = {}
+        self.running = threading.Event()
+        self.thread = None
+
+    @staticmethod
+    def frame_name(frame):  # 関数名(ファイル名:行)
+        code = frame.f_code
+        return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+    def sample(self):  # スタックを1回記録
+        frame = sys._current_frames().get(self.thread_id)
+        names = []
+        while frame is not None:
+            names.append(self.frame_name(frame))
+            frame = frame.f_back
+        if names:
+            stack = ';'.join(reversed(names))
+            self.stacks[stack] = self.stacks.get(stack, 0) + 1
+
+    def run(self):
+        while self.running.is_set():
+            self.sample()
+            tm.sleep(self.interval)
+
+    def __enter__(self):
+        self.running.set()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.running.clear()
+        self.thread.join()
+
+    def write_collapsed(self, path):  # 1行に1つのスタックと回数
+        with open(path, 'w') as fp:
+            for stack, count in sorted(self.stacks.items()):
+                fp.write(f'{stack} {count}\n')
+
+
+def run_cprofile(func, path):  # cProfileで実行し，統計(.pstats)と上位の関数(.txt)を保存
+    profile = cProfile.Profile()
+    start = tm.perf_counter()
+    profile.enable()
+    try:
+        func()
+    finally:
+        profile.disable()
+    elapsed = tm.perf_counter() - start
+    profile.dump_stats(path + '.pstats')
+    text = io.StringIO()
+    pstats.Stats(profile, stream=text).sort_stats('cumulative').print_stats(40)
+    with open(path + '.txt', 'w') as fp:
+        fp.write(text.getvalue())
+    return elapsed, [path + '.pstats', path + '.txt']
+
+
+def run_sampling(func, path, interval=None):  # サンプリングで実行し，collapsed形式で保存
+    start = tm.perf_counter()
+    with SamplingProfiler(interval) as profiler:
+        func()
+    elapsed = tm.perf_counter() - start
+    profiler.write_collapsed(path + '.collapsed')
+    return elapsed, [path + '.collapsed']
+
+
+def run_tracemalloc(func, path, limit=20):  # メモリ確保量の最大値(バイト)と確保の多い場所を保存
+    tracemalloc.start(25)
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+        snapshot = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    with open(path + '.memory.txt', 'w') as fp:
+        fp.write(f'peak: {peak} bytes\n')
+        for stat in snapshot.statistics('lineno')[:limit]:
+            fp.write(f'{stat}\n')
+    return peak, [path + '.memory.txt']
+
+
+def profile_targets(targets, output, profiler='cprofile', interval=None, memory=True):  # 対象ごとにプロファイルとメモリを計測
+    # targets: [(名前, 準備する関数, 計測する関数)] 準備する関数は計測のたびに呼ぶ(作成済みの画像の削除など)
+    os.makedirs(output, exist_ok=True)
+    reports = []
+    for name, prepare, func in targets:
+        path = os.path.join(output, name)
+        prepare()
+        if profiler == 'sample':
+            elapsed, files = run_sampling(func, path, interval)
+        else:
+            elapsed, files = run_cprofile(func, path)
+        report = {'name': name, 'profiler': profiler, 'seconds': elapsed, 'files': files}
+        # メモリの計測は時間に影響するので別に実行する
+        if memory:
+            prepare()
+            report['peak_bytes'], files = run_tracemalloc(func, path)
+            report['files'] += files
+        print(f'[プロファイル] {name}: {elapsed:.3f}秒' + (f', 最大{report["peak_bytes"] / 2 ** 20:.1f}MiB' if memory else ''))
+        reports.append(report)
+    with open(os.path.join(output, 'report.json'), 'w') as fp:
+        json.dump(reports, fp, indent=4, ensure_ascii=False)
+    return reports
@@ -0,0 +1,44 @@
+###################################################################
+# 格子点の投影座標のキャッシュ
+###################################################################
+import sys
+import hashlib
+import threading
+
+import numpy as np
+import cartopy.crs as ccrs
+
+if __name__ == "__main__":
+    print("please execute main.py")
+    sys.exit()
+
+# 正距円筒図法(格子の座標系)
+datacrs = ccrs.PlateCarree()
+# (投影法, 格子) -> (x, y)
+_points = {}
+_points_lock = threading.Lock()
+
+
+def grid_digest(lon, lat):  # 格子の内容からキーを作る
+    digest = hashlib.sha1()
+    for array in (lon, lat):
+        array = np.ascontiguousarray(array)
+        digest.update(repr((array.shape, array.dtype.str)).encode())
+        digest.update(array.view(np.uint8))
+    return digest.hexdigest()
+
+
+def project_grid(projection, lon, lat):  # 格子点を地図の座標に変換(格子と投影法ごとに一度だけ計算)
+    key = (projection.proj4_init, grid_digest(lon, lat))
+    with _points_lock:
+        points = _points.get(key)
+    if points is None:
+        xyz = projection.transform_points(datacrs, np.asarray(lon), np.asarray(lat))
+        x = np.ascontiguousarray(xyz[..., 0])
+        y = np.ascontiguousarray(xyz[..., 1])
+        x.setflags(write=False)
+        y.setflags(write=False)
+        points = (x, y)
+        with _points_lock:
+            _points[key] = points
+    return points
@@ -0,0 +1,73 @@
+###################################################################
+# レーダー画像の合成(背景は一度だけ用意し，作業領域を使い回す)
+###################################################################
+import sys
+import threading
+
+import numpy as np
+
+if __name__ == "__main__":
+    print("please execute main.py")
+    sys.exit()
+
+
+class RadarCompositor:  # 背景(地図と凡例)にレーダーのタイルを重ねる
+    # BGRAの1画素を1つの整数として見たときのBGRの部分
+    bgr_bits = 0x00FFFFFF
+
+    def __init__(self, background):
+        # 背景(BGR) 画像ごとに変更しないので読み取り専用にしておく
+        self.background = np.ascontiguousarray(background[:, :, :3])
+        self.background.setflags(write=False)
+        self.shape = self.background.shape[:2]
+        # スレッドごとの作業領域
+        self.local = threading.local()
+
+    def buffers(self):  # 作業領域(スレッドごとに一度だけ確保)
+        local = self.local
+        if getattr(local, 'canvas', None) is None:
+            height, width = self.shape
+            # 結合したタイル(BGRA)
+            local.canvas = np.empty((height, width, 4), dtype=np.uint8)
+            # 同じ領域を1画素1つの整数(リトルエンディアン)として見る
+            local.packed = local.canvas.view('<u4').reshape(height, width)
+            # 黒の画素の判定
+            local.bgr = np.empty((height, width), dtype='<u4')
+            local.black = np.empty((height, width), dtype=bool)
+            # 合成結果(BGR)
+            local.out = np.empty((height, width, 3), dtype=np.uint8)
+        return local
+
+    def assemble(self, tiles, canvas):  # タイルを作業領域に直接並べる(大きさが合わなければFalse)
+        y = 0
+        for tiles_h in tiles:
+            x = 0
+            height = None
+            for tile in tiles_h:
+                if tile is None or tile.ndim != 3 or tile.shape[2] != 4:
+                    return False
+                if height is None:
+                    height = tile.shape[0]
+                if tile.shape[0] != height or y + height > self.shape[0] or x + tile.shape[1] > self.shape[1]:
+                    return False
+                canvas[y:y + height, x:x + tile.shape[1]] = tile
+                x += tile.shape[1]
+            if x != self.shape[1]:
+                return False
+            y += height or 0
+        return y == self.shape[0]
+
+    def composite(self, tiles):  # 合成した画像(BGR)を返す(作業領域なので次の合成まで有効) 失敗したらNone
+        local = self.buffers()
+        if not self.assemble(tiles, local.canvas):
+            return None
+        rgb = local.canvas[:, :, :3]
+        alpha = local.canvas[:, :, 3:]
+        # 黒を白に置き換える(α成分はそのまま)
+        np.bitwise_and(local.packed, self.bgr_bits, out=local.bgr)
+        np.equal(local.bgr, 0, out=local.black)
+        np.bitwise_or(local.packed, self.bgr_bits, out=local.packed, where=local.black)
+        # α成分をマスクにして背景と合成
+        np.bitwise_or(self.background, alpha, out=local.out)
+        np.bitwise_and(local.out, rgb, out=local.out)
+        return local.out
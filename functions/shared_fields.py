@@ -0,0 +1,49 @@
+###################################################################
+# 共有メモリによる要素の受け渡し
+###################################################################
+import sys
+from multiprocessing import shared_memory, resource_tracker
+
+import numpy as np
+
+if __name__ == "__main__":
+    print("please execute main.py")
+    sys.exit()
+
+
+class SharedFields:  # 配列をまとめて共有メモリに置く
+    # 配列の先頭をそろえるバイト数
+    align = 64
+
+    def __init__(self, arrays):
+        # arrays: キー -> ndarray
+        items = []
+        size = 0
+        for key, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            items.append((key, size, array.shape, array.dtype.str))
+            size += -(-array.nbytes // self.align) * self.align
+        self.shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        for (key, offset, shape, dtype), array in zip(items, arrays.values()):
+            np.ndarray(shape, dtype=dtype, buffer=self.shm.buf, offset=offset)[...] = array
+        # 子プロセスに渡す情報
+        self.descriptor = {"name": self.shm.name, "items": items}
+
+    def close(self):  # 共有メモリを解放
+        self.shm.close()
+        self.shm.unlink()
+
+
+def attach_fields(descriptor):  # 共有メモリの配列を読み取り専用で開く(共有メモリと配列の辞書を返す)
+    try:
+        shm = shared_memory.SharedMemory(name=descriptor["name"], track=False)
+    except TypeError:
+        # Python 3.12以前は開いただけで後始末の対象になるので外す
+        shm = shared_memory.SharedMemory(name=descriptor["name"])
+        resource_tracker.unregister(shm._name, "shared_memory")
+    arrays = {}
+    for key, offset, shape, dtype in descriptor["items"]:
+        array = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+        array.setflags(write=False)
+        arrays[key] = array
+    return shm, arrays
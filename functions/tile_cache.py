@@ -0,0 +1,128 @@
+###################################################################
+# タイルキャッシュ(内容アドレス方式)
+###################################################################
+import os
+import sys
+import json
+import time as tm
+import hashlib
+import threading
+import collections
+
+if __name__ == "__main__":
+    print("please execute main.py")
+    sys.exit()
+
+
+class TileCache:
+    # キャッシュの上限(MB)のデフォルト
+    max_mb = 512
+    # メモリに保持するデコード済みタイルの数
+    max_decoded = 64
+    # この回数putしたら索引を保存
+    save_interval = 100
+
+    def __init__(self, path, max_mb=None):
+        if max_mb is not None:
+            self.max_mb = max_mb
+        self.path = path
+        self.path_index = os.path.join(path, "index.json")
+        os.makedirs(os.path.join(path, "blobs"), exist_ok=True)
+        # 索引 url -> {"sha", "etag", "size", "used"}
+        self.index = {}
+        if os.path.exists(self.path_index):
+            try:
+                with open(self.path_index) as fp:
+                    self.index = json.load(fp)
+            except Exception as e:
+                print(f'[キャッシュ索引の読み込みエラー] {e}')
+        # デコード済みタイル(内容のハッシュ -> 画像)
+        self.decoded = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.n_put = 0
+
+    def path_blob(self, sha):  # 内容のハッシュからファイルの場所を返す
+        return os.path.join(self.path, "blobs", sha[:2], sha)
+
+    def get(self, url):  # キャッシュにあればデータを返す(なければNone)
+        with self.lock:
+            entry = self.index.get(url)
+            if entry is None:
+                return None
+            entry["used"] = tm.time()
+        try:
+            with open(self.path_blob(entry["sha"]), "rb") as fp:
+                return fp.read()
+        except FileNotFoundError:
+            with self.lock:
+                self.index.pop(url, None)
+            return None
+
+    def put(self, url, data, etag=None):  # データをキャッシュに追加
+        sha = hashlib.sha256(data).hexdigest()
+        path = self.path_blob(sha)
+        # 同じ内容がすでにあれば書き込まない
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            path_tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(path_tmp, "wb") as fp:
+                fp.write(data)
+            os.replace(path_tmp, path)
+        with self.lock:
+            self.index[url] = {"sha": sha, "etag": etag, "size": len(data), "used": tm.time()}
+            self.n_put += 1
+            save = self.n_put % self.save_interval == 0
+        if save:
+            self.evict()
+            self.save()
+        return sha
+
+    def evict(self):  # 上限を超えたら最も古く使われた内容から削除
+        with self.lock:
+            # 内容ごとの大きさと最終使用時刻
+            blobs = {}
+            for entry in self.index.values():
+                size, used = blobs.get(entry["sha"], (entry["size"], 0))
+                blobs[entry["sha"]] = (size, max(used, entry["used"]))
+            total = sum(size for size, _ in blobs.values())
+            evicted = set()
+            for sha, (size, _) in sorted(blobs.items(), key=lambda item: item[1][1]):
+                if total <= self.max_mb * 1024 * 1024:
+                    break
+                evicted.add(sha)
+                total -= size
+            if not evicted:
+                return
+            self.index = {url: entry for url, entry in self.index.items() if entry["sha"] not in evicted}
+        for sha in evicted:
+            try:
+                os.remove(self.path_blob(sha))
+            except FileNotFoundError:
+                pass
+
+    def save(self):  # 索引を保存
+        with self.lock:
+            text = json.dumps(self.index)
+        path_tmp = f'{self.path_index}.{os.getpid()}.tmp'
+        with open(path_tmp, "w") as fp:
+            fp.write(text)
+        os.replace(path_tmp, self.path_index)
+
+    def close(self):
+        self.evict()
+        self.save()
+
+    def get_decoded(self, key):  # デコード済みのタイルを返す(なければNone)
+        with self.lock:
+            image = self.decoded.get(key)
+            if image is not None:
+                self.decoded.move_to_end(key)
+            return image
+
+    def put_decoded(self, key, image):  # デコード済みのタイルを保持
+        # 共有されるので書き換えを禁止
+        image.setflags(write=False)
+        with self.lock:
+            self.decoded[key] = image
+            while len(self.decoded) > self.max_decoded:
+                self.decoded.popitem(last=False)
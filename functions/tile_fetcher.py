@@ -0,0 +1,112 @@
+###################################################################
+# タイル取得エンジン
+###################################################################
+import os
+import sys
+import time as tm
+import atexit
+import threading
+from concurrent import futures
+
+import requests
+from requests.adapters import HTTPAdapter
+
+if __name__ == "__main__":
+    print("please execute main.py")
+    sys.exit()
+
+from .tile_cache import TileCache
+from .metrics import get_metrics
+
+
+class TileFetcher:
+    # 同時ダウンロード数のデフォルト
+    max_workers = 16
+    # タイムアウト(秒)
+    timeout = 10
+    # 再試行までの待ち時間(秒)
+    retry_wait = 10
+
+    def __init__(self, max_workers=None, cache=None):
+        if max_workers is not None:
+            self.max_workers = max_workers
+        # タイルキャッシュ(使わない場合はNone)
+        self.cache = cache
+        if cache is not None:
+            atexit.register(cache.close)
+        # ホストごとに接続を使い回すセッション(keep-alive)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=self.max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        # タイル取得用のスレッドプール
+        self.executor = futures.ThreadPoolExecutor(max_workers=self.max_workers)
+
+    def get(self, uri):  # ダウンロードしたデータを返す(サーバにない場合はNone)
+        metrics = get_metrics()
+        # キャッシュにあればダウンロードしない
+        if self.cache is not None:
+            data = self.cache.get(uri)
+            if data is not None:
+                metrics.count('cache_hits', source='tile')
+                return data
+        while True:
+            try:
+                req = self.session.get(uri, timeout=self.timeout)
+            # ダウンロードできない場合
+            except Exception as e:
+                print(f'[エラー　　　　] {e}')
+                metrics.count('retries', source='tile')
+                tm.sleep(self.retry_wait)
+                continue
+            # サーバ側のエラーは再試行
+            if req.status_code >= 500:
+                print(f'[エラー　　　　] {req.status_code}: {uri}')
+                metrics.count('retries', source='tile')
+                tm.sleep(self.retry_wait)
+                continue
+            metrics.count('requests', source='tile', status=req.status_code)
+            if req.status_code != 200:
+                return None
+            metrics.count('bytes', len(req.content), source='tile')
+            if self.cache is not None:
+                self.cache.put(uri, req.content, req.headers.get("ETag"))
+            return req.content
+
+    def submit(self, uri):  # ダウンロードをスレッドプールに投入
+        return self.executor.submit(self.get, uri)
+
+    def get_grid(self, uri_grid):  # タイルの2次元リストをまとめてダウンロード
+        future_grid = [[self.submit(uri) for uri in uri_h] for uri_h in uri_grid]
+        return [[future.result() for future in future_h] for future_h in future_grid]
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+        self.session.close()
+        if self.cache is not None:
+            self.cache.close()
+
+
+# プロセス内で共有するタイル取得エンジン (同時ダウンロード数, キャッシュの保存先) -> TileFetcher
+_fetchers = {}
+# キャッシュの保存先 -> TileCache(同じ保存先は1つのオブジェクトで管理する)
+_caches = {}
+_fetcher_lock = threading.Lock()
+
+
+def get_fetcher(max_workers=None, cache=None):  # 設定ごとに共有のタイル取得エンジンを返す
+    # cache: 設定ファイルの"tile_cache"({"path", "max_mb"})
+    path = os.path.abspath(cache["path"]) if cache else None
+    with _fetcher_lock:
+        key = (max_workers, path)
+        if key not in _fetchers:
+            tile_cache = None
+            if path is not None:
+                if path not in _caches:
+                    _caches[path] = TileCache(cache["path"], cache.get("max_mb"))
+                tile_cache = _caches[path]
+                # 同じ保存先で上限が異なる設定は使えない
+                if tile_cache.max_mb != cache.get("max_mb", tile_cache.max_mb):
+                    raise ValueError(f'{cache["path"]}のmax_mbが設定ごとに異なります')
+            _fetchers[key] = TileFetcher(max_workers, tile_cache)
+        return _fetchers[key]
@@ -0,0 +1,165 @@
+###################################################################
+# 動画の作成(追加した画像だけを小さな動画にして，再生リストでつなぐ)
+###################################################################
+import os
+import sys
+import json
+import datetime
+import threading
+
+import cv2
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+if __name__ == "__main__":
+    print("please execute main.py")
+    sys.exit()
+
+# 区間の基準の時刻
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+class Timelapse:  # 1種類の画像の動画
+    # 動画にする時間(時間)
+    hours = 24
+    # 1つの動画ファイルにまとめる最大の時間(分)
+    segment_minutes = 60
+    # 1秒あたりの画像の枚数
+    fps = 8
+    # 動画の形式
+    fourcc = 'mp4v'
+    ext = 'mp4'
+    # 索引と再生リストのファイル名
+    index_name = 'index.json'
+    playlist_name = 'playlist.ffconcat'
+    # 時刻の書式
+    time_format = '%Y%m%d%H%M%S'
+
+    def __init__(self, path, product, hours=None, segment_minutes=None, fps=None, fourcc=None, ext=None):
+        # 動画の保存先
+        self.path = os.path.join(path, product)
+        os.makedirs(self.path, exist_ok=True)
+        self.product = product
+        if hours is not None:
+            self.hours = hours
+        if segment_minutes is not None:
+            self.segment_minutes = segment_minutes
+        if not isinstance(self.segment_minutes, int) or self.segment_minutes <= 0:
+            raise ValueError(f'segment_minutesは正の整数にしてください: {self.segment_minutes}')
+        if fps is not None:
+            self.fps = fps
+        if fourcc is not None:
+            self.fourcc = fourcc
+        if ext is not None:
+            self.ext = ext
+        # まだ動画にしていない画像 時刻 -> 画像のパス
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    def segment(self, time_str):  # 時刻が含まれる区間の開始時刻(1日より長い区間も区切れるように基準の時刻から数える)
+        time_this = datetime.datetime.strptime(time_str, self.time_format)
+        minutes = int((time_this - EPOCH).total_seconds()) // 60 // self.segment_minutes * self.segment_minutes
+        return (EPOCH + datetime.timedelta(minutes=minutes)).strftime(self.time_format)
+
+    def add(self, time_str, path):  # 作成した画像を追加(flushで動画にする)
+        with self.lock:
+            self.pending[time_str] = path
+
+    def flush(self):  # 追加した画像だけを新しい動画にして再生リストに加え，古い動画を捨てる
+        # 作成済みの動画は作り直さない(時間が重なる画像が遅れて届いたときだけ，重なる動画とまとめて作り直す)
+        with self.lock:
+            pending = self.pending
+            self.pending = {}
+        if not pending:
+            return
+        # 複数のプロセスから同時に書き込まないようにする
+        with open(os.path.join(self.path, '.lock'), 'w') as fp_lock:
+            if fcntl is not None:
+                fcntl.flock(fp_lock, fcntl.LOCK_EX)
+            # 最初の画像の時刻 -> {'file': 動画ファイル名, 'frames': {時刻: 画像のパス}}
+            index = self.load_index()
+            # 動画にする時間より前の動画と画像は捨てる
+            time_newest = datetime.datetime.strptime(max([max(pending)] + [max(entry['frames']) for entry in index.values()]), self.time_format)
+            time_oldest = (time_newest - datetime.timedelta(hours=self.hours)).strftime(self.time_format)
+            for key in sorted(index):
+                if max(index[key]['frames']) < time_oldest:
+                    self.remove(index.pop(key)['file'])
+            # 新しい画像を区間ごとにまとめる(1つの動画が長くなりすぎないように)
+            groups = {}
+            for time_str, path in pending.items():
+                if time_str >= time_oldest:
+                    groups.setdefault(self.segment(time_str), {})[time_str] = path
+            for frames in groups.values():
+                first, last = min(frames), max(frames)
+                # 時間が重なる動画は取り出してまとめる 同じ時刻は新しい画像で置き換える
+                overlap = [key for key, entry in index.items() if key == first or (min(entry['frames']) <= last and first <= max(entry['frames']))]
+                entries = [index.pop(key) for key in overlap]
+                frames = {**{time_str: path for entry in entries for time_str, path in entry['frames'].items()}, **frames}
+                key = min(frames)
+                entry = {'file': f'{key}_{max(frames)}.{self.ext}', 'frames': frames}
+                if self.encode(entry):
+                    index[key] = entry
+                for file_name in {entry_old['file'] for entry_old in entries} - {entry['file']}:
+                    self.remove(file_name)
+            self.save_index(index)
+            self.save_playlist(index)
+        print(f'[動画　　　　] {self.product}: {len(pending)}枚追加, {len(groups)}ファイル')
+
+    def encode(self, entry):  # 1つの動画を作成(画像が1枚もなければFalse)
+        path = os.path.join(self.path, entry['file'])
+        path_tmp = f'{path}.{os.getpid()}.tmp.{self.ext}'
+        writer = None
+        size = None
+        for time_str in sorted(entry['frames']):
+            image = cv2.imread(entry['frames'][time_str], cv2.IMREAD_COLOR)
+            if image is None:
+                continue
+            if writer is None:
+                size = (image.shape[1], image.shape[0])
+                writer = cv2.VideoWriter(path_tmp, cv2.VideoWriter_fourcc(*self.fourcc), self.fps, size)
+            elif (image.shape[1], image.shape[0]) != size:
+                image = cv2.resize(image, size)
+            writer.write(image)
+        if writer is None:
+            return False
+        writer.release()
+        os.replace(path_tmp, path)
+        return True
+
+    def remove(self, file_name):  # 動画ファイルを削除
+        try:
+            os.remove(os.path.join(self.path, file_name))
+        except FileNotFoundError:
+            pass
+
+    def load_index(self):  # 最初の画像の時刻 -> {'file': 動画ファイル名, 'frames': {時刻: 画像のパス}}
+        try:
+            with open(os.path.join(self.path, self.index_name)) as fp:
+                return json.load(fp)
+        except (OSError, ValueError):
+            return {}
+
+    def save_index(self, index):  # 索引を保存
+        self.save_text(self.index_name, json.dumps(index))
+
+    def save_playlist(self, index):  # 動画を時刻順につなぐ再生リスト(ffmpeg -f concat)
+        lines = ['ffconcat version 1.0'] + [f"file '{index[segment]['file']}'" for segment in sorted(index)]
+        self.save_text(self.playlist_name, '\n'.join(lines) + '\n')
+
+    def save_text(self, file_name, text):  # 書き込みが終わってから名前を変える
+        path = os.path.join(self.path, file_name)
+        path_tmp = f'{path}.{os.getpid()}.tmp'
+        with open(path_tmp, 'w') as fp:
+            fp.write(text)
+        os.replace(path_tmp, path)
+
+
+def get_timelapses(settings, products):  # 設定にあれば画像の種類 -> Timelapse, なければ空
+    # settings: {"path": 保存先, "hours": 時間, "segment_minutes": 分, "fps": 枚数, "fourcc": 形式, "ext": 拡張子}
+    if not settings:
+        return {}
+    options = {key: settings.get(key) for key in ('hours', 'segment_minutes', 'fps', 'fourcc', 'ext')}
+    return {product: Timelapse(settings["path"], product, **options) for product in products}
@@ -0,0 +1,9 @@
+from functions import run_daemon
+
+
+def main():
+    run_daemon()
+
+
+if __name__ == "__main__":
+    main()
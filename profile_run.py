@@ -0,0 +1,167 @@
+###################################################################
+# 1サイクルの天気図，1時刻の衛星・レーダー画像をプロファイル
+# 例: python profile_run.py gsm --time 2021040100 --charts np_500_ht
+#     python profile_run.py sat --basetime 20210401000000 --products jp_infrared --profiler sample
+#     python profile_run.py msm --synthetic
+###################################################################
+import os
+import sys
+import json
+import argparse
+import datetime
+
+import matplotlib
+matplotlib.use('Agg')
+
+from functions.download_gsmclass import DownloadGSM
+from functions.download_msmclass import DownloadMSM
+from functions.download_satclass import DownloadSatellite
+from functions.download_radclass import DownloadRadar
+from functions.radar_composite import RadarCompositor
+from functions.tile_fetcher import TileFetcher
+from functions.tile_cache import TileCache
+from functions.chart_specs import required_fields
+from functions.profiling import profile_targets
+
+# 擬似データの時刻
+SYNTHETIC_TIME = datetime.datetime(2021, 4, 1, 0)
+# レーダーのタイルの範囲
+TILES_RADAR = (6, 53, 22, 58, 27)
+
+
+def load_settings(path):  # 設定ファイル(なければ空)
+    if path is None or not os.path.exists(path):
+        return {}
+    with open(path) as fp:
+        return json.load(fp)
+
+
+def synthetic():  # 擬似データの作成(benchmarks/synthetic.py)
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks'))
+    import synthetic
+    return synthetic
+
+
+class CachedTileFetcher(TileFetcher):  # タイルキャッシュだけから返す(ネットワークには接続しない)
+    def get(self, uri):  # キャッシュになければ失敗
+        data = self.cache.get(uri)
+        if data is None:
+            raise FileNotFoundError(f'{uri}はタイルキャッシュにありません')
+        return data
+
+
+def remover(path):  # 作成済みの画像を削除する関数
+    def prepare():
+        if os.path.exists(path):
+            os.remove(path)
+    return prepare
+
+
+def chart_targets(cls, args, settings):  # 天気図ごとの計測対象
+    fig_x = settings.get("fig_x", 21)
+    fig_y = settings.get("fig_y", 17)
+    if args.synthetic:
+        time_this = SYNTHETIC_TIME
+        path_tmp = os.path.join(args.output, 'grib2')
+        os.makedirs(path_tmp, exist_ok=True)
+        synthetic().write_grib2(os.path.join(path_tmp, time_this.strftime('%Y%m%d%H')), args.command, required_fields(cls.charts), [args.ft], time_this, cls.accumulated)
+        archive = None
+    else:
+        time_this = datetime.datetime.strptime(args.time, '%Y%m%d%H')
+        path_tmp = settings["path"]["tmp"]
+        archive = settings["path"].get("archive")
+    t = cls(time_this, fig_x, fig_y, path_tmp, forecast_times=[args.ft], charts=args.charts, archive=archive)
+    # ローカルのデータだけを使う
+    if not os.path.exists(t.path_grib2) and not t.archive_is_complete():
+        sys.exit(f'{t.path_grib2}もアーカイブもありません')
+    t.download_grib2()
+    t.set_forecast_time(args.ft)
+    path_out = os.path.join(args.output, 'charts')
+    os.makedirs(path_out, exist_ok=True)
+    targets = []
+    for chart in t.charts:
+        def func(chart=chart):
+            # 要素の読み込みと計算も含める
+            t.fields.clear()
+            getattr(t, chart)(path_out)
+        targets.append((f'{args.command}_{chart}', remover(t.path_fig(path_out)), func))
+    return targets
+
+
+def tile_targets(args, settings):  # 衛星・レーダー画像の計測対象
+    radar = args.command == 'rad'
+    t = (DownloadRadar if radar else DownloadSatellite).__new__(DownloadRadar if radar else DownloadSatellite)
+    t.settings = settings
+    tiles = TILES_RADAR if radar else t.tiles_jp
+    if args.synthetic:
+        t.fetcher = synthetic().LocalTileFetcher(os.path.join(args.output, 'tiles'))
+        basetime = SYNTHETIC_TIME.strftime('%Y%m%d%H%M%S')
+        path_map = os.path.join(args.output, f'{args.command}_map.png')
+    else:
+        # タイルはキャッシュにあるものだけを使う(サーバの応答時間を計測に含めない)
+        cache = settings.get("tile_cache")
+        if not cache:
+            sys.exit('設定ファイルに"tile_cache"がありません(--synthetic で擬似データを使えます)')
+        t.fetcher = CachedTileFetcher(settings.get("tile_workers"), TileCache(cache["path"], cache.get("max_mb")))
+        basetime = args.basetime
+        path_map = settings["path_map"]["jp" if radar else "j"]
+    # 地図(作成済みならそれを使う)
+    if args.synthetic:
+        t.fetcher.prepare(t.uri_base(*tiles))
+    t.image_map = t.draw_base(*tiles, path_map)
+    if radar:
+        if not args.synthetic:
+            t.draw_legend()
+        t.compositor = RadarCompositor(t.image_map)
+        contents = {'jp_radar': ((basetime, basetime, *tiles), {})}
+    else:
+        products = args.products or list(t.products)
+        contents = {name: ((basetime, basetime, *t.products[name][:2], *tiles), dict(alpha=t.products[name][2], beta=t.products[name][3])) for name in products}
+    path_out = os.path.join(args.output, 'frames')
+    os.makedirs(path_out, exist_ok=True)
+    targets = []
+    for name, (content_args, kwargs) in contents.items():
+        if args.synthetic:
+            t.fetcher.prepare(t.uri_content(*content_args))
+        path = os.path.join(path_out, f'{name}_{basetime}.jpg')
+
+        def func(content_args=content_args, kwargs=kwargs, path=path):
+            # タイルの取得も含める
+            t.draw_content(*content_args, path, check=False, **kwargs)
+        targets.append((f'{args.command}_{name}', remover(path), func))
+    return targets
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('command', choices=('gsm', 'msm', 'sat', 'rad'))
+    parser.add_argument('--settings', help='設定ファイル(指定しなければsettings_<command>.json)')
+    parser.add_argument('--synthetic', action='store_true', help='擬似データを使う')
+    parser.add_argument('--time', help='天気図の初期時刻 YYYYmmddHH')
+    parser.add_argument('--ft', type=int, default=0, help='予報時間')
+    parser.add_argument('--charts', nargs='+', help='天気図の名前(指定しなければ全て)')
+    parser.add_argument('--basetime', help='衛星・レーダー画像の時刻 YYYYmmddHHMMSS')
+    parser.add_argument('--products', nargs='+', help='衛星画像の種類(指定しなければ全て)')
+    parser.add_argument('--profiler', choices=('cprofile', 'sample'), default='cprofile')
+    parser.add_argument('--interval', type=float, help='サンプリングの間隔(秒)')
+    parser.add_argument('--no-memory', action='store_true', help='メモリの計測をしない')
+    parser.add_argument('--output', default='profile', help='結果の保存先')
+    args = parser.parse_args()
+    settings = load_settings(args.settings or f'settings_{args.command}.json')
+    if not args.synthetic:
+        if not settings:
+            parser.error('設定ファイルがありません(--synthetic で擬似データを使えます)')
+        if args.command in ('gsm', 'msm') and args.time is None:
+            parser.error('--time が必要です')
+        if args.command in ('sat', 'rad') and args.basetime is None:
+            parser.error('--basetime が必要です')
+    os.makedirs(args.output, exist_ok=True)
+    if args.command in ('gsm', 'msm'):
+        targets = chart_targets(DownloadGSM if args.command == 'gsm' else DownloadMSM, args, settings)
+    else:
+        targets = tile_targets(args, settings)
+    profile_targets(targets, args.output, args.profiler, args.interval, not args.no_memory)
+
+
+if __name__ == "__main__":
+    main()
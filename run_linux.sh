@@ -1,7 +1,9 @@
 sleep 5
 SCRIPT_DIR=$(cd $(dirname $0); pwd)
 cd $SCRIPT_DIR
-gnome-terminal --execute bash -i -c "conda activate weather; python main_gsm.py"
-gnome-terminal --execute bash -i -c "conda activate weather; python main_msm.py"
-gnome-terminal --execute bash -i -c "conda activate weather; python main_sat.py"
-gnome-terminal --execute bash -i -c "conda activate weather; python main_rad.py"
\ No newline at end of file
+# 1つのプロセスで常駐してGSM, MSM, 衛星, レーダーを定期的に実行(終了はkill -TERM)
+# 1回だけ対話的に実行するときは python main_gsm.py など
+eval "$(conda shell.bash hook)"
+conda activate weather
+nohup python main_daemon.py >> daemon.log 2>&1 &
+echo $! > daemon.pid
\ No newline at end of file